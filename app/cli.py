@@ -0,0 +1,78 @@
+"""
+Command line entry points of the STAC generator.
+
+`poetry run python -m app.cli build manifest.ndjson items.ndjson --workers 16`
+`poetry run python -m app.cli build manifest.csv catalog/ --format catalog`
+`poetry run python -m app.cli build manifest.ndjson items/ --format geoparquet`
+"""
+import argparse
+import json
+import logging
+import sys
+
+from dotenv import load_dotenv
+
+from app.stac.services.catalog_builder import MANIFEST_FORMATS, OUTPUT_FORMATS, build_catalog
+
+
+def _print_progress(entry):
+    line = f"[{entry['index']}] {entry['status']} {entry.get('id') or ''} {entry['seconds']:.3f}s"
+    if entry["status"] != "success":
+        line += f" {entry['detail']}"
+    print(line, file=sys.stderr, flush=True)
+
+
+def build(args) -> int:
+    summary = build_catalog(
+        args.manifest,
+        args.output,
+        output_format=args.format,
+        checkpoint=args.checkpoint,
+        restart=args.restart,
+        workers=args.workers,
+        manifest_format=args.manifest_format,
+        catalog_id=args.catalog_id,
+        row_group_size=args.row_group_size,
+        part_size=args.part_size,
+        progress=None if args.quiet else _print_progress,
+    )
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="STAC generator tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser(
+        "build",
+        help="Generate the STAC items of a manifest offline",
+        description="Generate the STAC items of a JSON, NDJSON or CSV manifest of payloads "
+        "across a pool of worker processes, and write them to an NDJSON file, a static "
+        "catalog or a GeoParquet dataset. Builds resume from their checkpoint.",
+    )
+    build_parser.add_argument("manifest", help="The manifest of payloads")
+    build_parser.add_argument("output", help="The NDJSON file, or the static catalog or GeoParquet directory to write")
+    build_parser.add_argument("--format", choices=OUTPUT_FORMATS, default="ndjson", help="The output format")
+    build_parser.add_argument("--manifest-format", choices=MANIFEST_FORMATS, help="Defaults to the manifest extension")
+    build_parser.add_argument("--workers", type=int, help="The number of worker processes, defaults to BATCH_MAX_WORKERS")
+    build_parser.add_argument("--checkpoint", help="The checkpoint file, defaults to <output>.checkpoint")
+    build_parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and build everything again")
+    build_parser.add_argument("--catalog-id", default="stac-generator", help="The ID of the root catalog")
+    build_parser.add_argument("--row-group-size", type=int, default=1000, help="The items per GeoParquet row group")
+    build_parser.add_argument("--part-size", type=int, default=100000, help="The maximum items per GeoParquet part file")
+    build_parser.add_argument("--quiet", action="store_true", help="Do not print a line per item")
+    build_parser.add_argument("--log-level", default="WARNING", help="The level of the generation logs")
+    build_parser.set_defaults(func=build)
+    return parser
+
+
+def main(argv=None) -> int:
+    load_dotenv(".env")
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
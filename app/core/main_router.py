@@ -1,6 +1,9 @@
 from fastapi import APIRouter
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+
+from app.core.warmup import get_warmup_timings, is_ready
+from app.stac.services.metrics import generate_metrics
 
 router = APIRouter()
 
@@ -8,3 +11,24 @@ router = APIRouter()
 @router.get("/status", status_code=200)
 def healthcheck():
     return JSONResponse(content=jsonable_encoder({"status": "I'm doing great! Thanks for checking up on me."}))
+
+
+@router.get("/ready", status_code=200)
+def readiness():
+    """
+    Return 200 once the warm-up of the serving process has finished, 503 before, with the
+    duration of each warm-up stage and the cold start time in seconds.
+    """
+    if not is_ready():
+        return JSONResponse(status_code=503, content={"status": "warming up", "warmup": get_warmup_timings()})
+    return JSONResponse(content={"status": "ready", "warmup": get_warmup_timings()})
+
+
+@router.get("/metrics", status_code=200)
+def metrics():
+    """
+    Return the metrics of the service in the Prometheus text format, e.g. the time spent
+    in each stage of item generation by parser and collection.
+    """
+    content, content_type = generate_metrics()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,131 @@
+"""
+Warm-up of the service, and the cold start time it takes.
+
+This module is imported first by app.main, and only imports the modules it warms up when
+called, so that the time taken to load the app is measured from here.
+
+Under gunicorn (see gunicorn.conf.py) the app and the parsers are loaded once by the
+master process, before the workers are forked and share them. GDAL and PROJ open files
+and databases that are not meant to be shared across a fork, so each worker warms them
+up after the fork.
+"""
+import logging
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# When the process started loading the app, reset when a worker is forked
+_started = time.perf_counter()
+
+# The duration of each warm-up stage in seconds, and of the cold start
+_timings: Dict[str, float] = {}
+_ready = threading.Event()
+
+
+def mark_app_loaded():
+    """
+    Record the time taken to import the app, called once it has been created.
+    """
+    _record("app_load", time.perf_counter() - _started)
+
+
+def mark_forked():
+    """
+    Restart the cold start clock in a forked worker: loading the app was done by the
+    master process, once for every worker.
+    """
+    global _started
+    _started = time.perf_counter()
+    _ready.clear()
+
+
+def warm_up_before_fork():
+    """
+    Do the warm-up that forked workers can share: load every parser into the registry,
+    and run a round trip through pystac, whose first use imports more modules.
+    """
+    from pystac import Item
+
+    from app.stac.services.metadata_parsers.metadata_parser_manager import MetadataParserManager
+
+    started = time.perf_counter()
+    MetadataParserManager.load_parsers()
+    _record("parsers", time.perf_counter() - started)
+
+    started = time.perf_counter()
+    item = Item(id="warm-up", geometry=None, bbox=None, datetime=None,
+                properties={"start_datetime": "2020-01-01T00:00:00Z", "end_datetime": "2020-01-01T00:00:00Z"})
+    Item.from_dict(item.to_dict(), migrate=False)
+    _record("pystac", time.perf_counter() - started)
+
+
+def warm_up():
+    """
+    Do the warm-up of a worker, then mark it as ready.
+
+    GDAL opens its drivers and PROJ its database on first use, and the first item of a
+    grid reprojects its bounds: a small in-memory GeoTIFF is inspected like a TIFF asset
+    is, to pay for these before the first request. A failing warm-up is logged, the
+    worker is ready anyway.
+    """
+    try:
+        # Done by the master process under gunicorn
+        if "parsers" not in _timings:
+            warm_up_before_fork()
+        _warm_up_gdal()
+    except Exception as e:
+        logger.exception(f"Warm-up failed: {e}")
+    _record("cold_start", time.perf_counter() - _started)
+    logger.info(f"Warmed up in {_timings['cold_start']:.3f}s: {_timings}")
+    _ready.set()
+
+
+def _warm_up_gdal():
+    import numpy
+    import rasterio
+    from rasterio.io import MemoryFile
+    from rasterio.transform import from_origin
+
+    from app.stac.services.footprint import get_valid_data_footprint
+    from app.stac.services.raster_inspection import create_stac_item
+    from app.stac.services.raster_statistics import STATISTICS_OVERVIEW, get_raster_bands
+
+    started = time.perf_counter()
+    data = numpy.zeros((64, 64), dtype="uint8")
+    data[16:48, 16:48] = 1
+    with rasterio.Env(), MemoryFile() as memory_file:
+        profile = {
+            "driver": "GTiff", "width": 64, "height": 64, "count": 1, "dtype": "uint8",
+            "crs": "EPSG:32630", "transform": from_origin(500000, 5600000, 10, 10), "nodata": 0,
+        }
+        with memory_file.open(**profile) as dst:
+            dst.write(data, 1)
+        with memory_file.open() as src:
+            create_stac_item(src).to_dict()
+            get_raster_bands(src, STATISTICS_OVERVIEW)
+            get_valid_data_footprint(src)
+    _record("gdal", time.perf_counter() - started)
+
+
+def is_ready() -> bool:
+    """
+    Whether the warm-up of this process has finished.
+    """
+    return _ready.is_set()
+
+
+def get_warmup_timings() -> Dict[str, float]:
+    """
+    Return the duration in seconds of each warm-up stage done by this process or before
+    its fork, and its cold start time once it is ready.
+    """
+    return dict(_timings)
+
+
+def _record(stage: str, seconds: float):
+    from app.stac.services.metrics import WARMUP_SECONDS
+
+    _timings[stage] = seconds
+    WARMUP_SECONDS.labels(stage).set(seconds)
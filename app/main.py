@@ -1,3 +1,8 @@
+# Imported first, it measures the time taken to load the app
+from app.core import warmup
+
+import asyncio
+
 from fastapi import FastAPI, APIRouter
 from dotenv import load_dotenv
 
@@ -5,6 +10,11 @@ from dotenv import load_dotenv
 from app.stac import router as stac_router
 from app.core.main_router import router as main_router
 
+from app.stac.services.executors import run_in_generation_executor, shutdown_executors
+from app.stac.services.http_fetch import close_http_session
+from app.stac.services.job_manager import job_manager
+from app.stac.services.publisher.publish_queue import publish_queue
+from app.stac.services.publisher.publisher_utility import close_stac_api_client
 from app.stac.services.metadata_parsers.metadata_parser_manager import (
     MetadataParserManager,
 )
@@ -17,14 +27,29 @@ app = FastAPI(title="STAC Generator API", version="0.1.0")
 
 
 @app.on_event("startup")
-def startup_event():
-    MetadataParserManager.list_available_parsers()
+async def startup_event():
+    MetadataParserManager.load_parsers()
+    await job_manager.start()
+    await publish_queue.start()
+    # Requests are served meanwhile, /ready passes once it is done
+    app.state.warm_up = asyncio.ensure_future(run_in_generation_executor(warmup.warm_up))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_manager.stop()
+    await publish_queue.stop()
+    await close_stac_api_client()
+    shutdown_executors()
+    close_http_session()
 
 
 app.include_router(main_router, tags=["Main"])
 app.include_router(stac_router, tags=["STAC"])
 app.include_router(root_router, tags=["Root"])
 
+warmup.mark_app_loaded()
+
 
 if __name__ == "__main__":
     # Use this for debugging purposes only
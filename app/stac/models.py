@@ -1,6 +1,13 @@
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field, root_validator
-import requests
+from typing import List, Optional, Dict, Any, Literal
+from pydantic import BaseModel, Field
+
+from .services.http_fetch import fetch_json
+
+
+class MetadataFetchError(ValueError):
+    """
+    Raised when the metadata of a payload can not be fetched from its metadata_url.
+    """
 
 
 class GenerateSTACPayload(BaseModel):
@@ -26,20 +33,37 @@ class GenerateSTACPayload(BaseModel):
     )
     parser: Optional[str] = Field(None, example="example")
     collection: Optional[str] = Field(None, example="example")
+    raster_statistics: Optional[Literal["none", "overview", "sampled", "exact"]] = Field(
+        None,
+        example="overview",
+        description="How the band statistics of the TIFF assets are computed. Defaults to "
+        "the raster_statistics of the parser, then to RASTER_STATISTICS_METHOD.",
+    )
+    footprint: Optional[Literal["bounds", "valid-data"]] = Field(
+        None,
+        example="valid-data",
+        description="Whether the item geometry is the bounds of the TIFF assets or the "
+        "polygon of their valid pixels. Defaults to the footprint of the parser, then to "
+        "FOOTPRINT_METHOD.",
+    )
+
+    def fetch_metadata(self):
+        """
+        Fetch the metadata from metadata_url when no metadata was provided.
 
-    @root_validator
-    def fetch_metadata(cls, values):
-        metadata = values.get("metadata")
-        metadata_url = values.get("metadata_url")
+        This is not done as part of validation, because FastAPI validates request
+        bodies on the event loop and the fetch is blocking network I/O. It is called
+        by STACItemCreator, which runs on the generation executor.
 
+        Raises:
+            MetadataFetchError: If the metadata can not be fetched or is not valid JSON.
+        """
         # Check if there isn't a metadata provided but there is a metadata_url
-        if not metadata and metadata_url:
+        if not self.metadata and self.metadata_url:
             try:
-                # Fetch the content from the metadata URL
-                response = requests.get(metadata_url)
-                response.raise_for_status()
-                values["metadata"] = response.json()
+                # Fetch the content from the metadata URL through the shared, cached session
+                self.metadata = fetch_json(self.metadata_url)
             except Exception as e:
-                raise ValueError(f"Failed to fetch metadata from {metadata_url}: {e}")
+                raise MetadataFetchError(f"Failed to fetch metadata from {self.metadata_url}: {e}")
 
-        return values
+        return self.metadata
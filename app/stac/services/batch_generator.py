@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List
+
+from .executors import discard_batch_process_pool, get_batch_max_workers, get_batch_process_pool
+from .metrics import STAGE_PUBLISH, get_metric_labels, observe_stage
+from .stac_item_creator import STACItemCreator
+from ..models import MetadataFetchError
+from .publisher.publish_queue import publish_queue
+from .publisher.publisher_utility import (
+    get_publish_mode,
+    publish_many_to_stac_fastapi,
+    publish_to_stac_fastapi,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _generate_batch_entry(index: int, payload: dict) -> Dict[str, Any]:
+    """
+    Generate the STAC item of a single payload inside a batch worker process.
+
+    Errors are converted to strings in the worker, since not every exception
+    raised by GDAL can be pickled back to the parent process.
+    """
+    try:
+        item = STACItemCreator(payload).create_item()
+        return {"index": index, "status": "success", "result": item}
+    except MetadataFetchError as e:
+        return {"index": index, "status": "error", "detail": f"Invalid payload: {e}"}
+    except Exception as e:
+        logger.exception(e)
+        return {"index": index, "status": "error", "detail": str(e)}
+
+
+async def _publish_batch(payloads: List[dict], entries: List[Dict[str, Any]]):
+    """
+    Publish the generated items of a batch, replacing each successful result with the item URL.
+
+    When write-behind publishing is enabled the items are queued, else in bulk mode the
+    items of each collection are sent together through the bulk items endpoint, otherwise
+    they are published concurrently one by one.
+    """
+    by_collection = defaultdict(list)
+    for entry in entries:
+        if entry["status"] == "success":
+            payload = payloads[entry["index"]]
+            collection = payload.get("collection") or payload.get("parser") or "default"
+            by_collection[collection].append(entry)
+
+    def fail(entry, error):
+        entry.pop("result", None)
+        entry.update({"status": "error", "detail": str(error)})
+
+    def get_parser(collection_entries):
+        # The entries of a collection are published together, whatever their parser
+        parsers = {payloads[entry["index"]].get("parser") for entry in collection_entries}
+        return parsers.pop() if len(parsers) == 1 else "mixed"
+
+    async def publish_collection(collection, collection_entries):
+        items = [entry["result"] for entry in collection_entries]
+        labels = get_metric_labels(get_parser(collection_entries), collection)
+        try:
+            with observe_stage(STAGE_PUBLISH, labels):
+                # A failed chunk only fails its own items
+                results = await publish_many_to_stac_fastapi(items, collection, return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(collection_entries)
+        for entry, result in zip(collection_entries, results):
+            if isinstance(result, Exception):
+                fail(entry, result)
+            else:
+                entry["result"] = result
+
+    async def publish_entry(collection, entry):
+        labels = get_metric_labels(payloads[entry["index"]].get("parser"), collection)
+        try:
+            with observe_stage(STAGE_PUBLISH, labels):
+                entry["result"] = await publish_to_stac_fastapi(entry["result"], collection)
+        except Exception as e:
+            fail(entry, e)
+
+    async def enqueue_entry(collection, entry):
+        try:
+            entry["result"] = await publish_queue.enqueue(
+                entry["result"], collection, payloads[entry["index"]].get("parser")
+            )
+        except Exception as e:
+            fail(entry, e)
+
+    if publish_queue.enabled:
+        publications = [
+            enqueue_entry(collection, entry)
+            for collection, collection_entries in by_collection.items()
+            for entry in collection_entries
+        ]
+    elif get_publish_mode() == "bulk":
+        publications = [
+            publish_collection(collection, collection_entries)
+            for collection, collection_entries in by_collection.items()
+        ]
+    else:
+        publications = [
+            publish_entry(collection, entry)
+            for collection, collection_entries in by_collection.items()
+            for entry in collection_entries
+        ]
+    await asyncio.gather(*publications)
+
+
+async def generate_batch(payloads: List[dict]) -> List[Dict[str, Any]]:
+    """
+    Generate STAC items for a list of payloads in parallel across the batch process pool.
+
+    The items are published once generated when HTTP_PUBLISH_TO_STAC_API is enabled,
+    in which case the result of each entry is the published item URL.
+
+    Args:
+        payloads (list): A list of dictionaries matching GenerateSTACPayload.
+
+    Returns:
+        list: One entry per payload, in the order they were submitted, each with a
+        "status" of "success" (and a "result") or "error" (and a "detail").
+    """
+    loop = asyncio.get_running_loop()
+    # Payloads are pickled when submitted, keep the backlog of the pool bounded
+    slots = asyncio.Semaphore(get_batch_max_workers() * 2)
+
+    async def generate(index, payload):
+        async with slots:
+            pool = get_batch_process_pool()
+            try:
+                return await loop.run_in_executor(pool, _generate_batch_entry, index, payload)
+            except BrokenProcessPool:
+                # A worker died (e.g. a crash inside GDAL), the pool can not be reused
+                discard_batch_process_pool(pool)
+                raise
+
+    results = await asyncio.gather(
+        *[generate(index, payload) for index, payload in enumerate(payloads)], return_exceptions=True
+    )
+
+    entries = []
+    for index, result in enumerate(results):
+        if isinstance(result, BaseException):
+            logger.error(f"Batch entry {index} failed: {result}")
+            entries.append({"index": index, "status": "error", "detail": str(result)})
+        else:
+            entries.append(result)
+
+    if os.getenv("HTTP_PUBLISH_TO_STAC_API", "false").lower() == "true":
+        await _publish_batch(payloads, entries)
+
+    return entries
@@ -0,0 +1,506 @@
+import atexit
+import base64
+import http.server
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, FrozenSet, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import requests
+
+from .gdal_profiles import get_block_cache_hosts
+from .http_fetch import get_fetch_timeout, get_http_session, probe_remote_file
+from .sqlite_store import LRUStore, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+# How long the identity of a remote file is trusted before it is checked again
+_IDENTITY_TTL = 30
+
+# Counters kept in the database, so that they cover every process sharing the cache
+STAT_NAMES = ("hits", "misses", "bytes_saved", "bytes_fetched", "evictions")
+
+# Headers of the remote file forwarded by the proxy
+_FORWARDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class BlockCache(LRUStore):
+    """
+    A persistent cache of the blocks of remote files, stored in a SQLite database.
+
+    Files are split in aligned blocks of `block_size` bytes. Blocks are keyed by the
+    URL of the file without its query string (so signed URLs of the same file share
+    their blocks), the identity of its content (ETag, Last-Modified and size) and
+    their index.
+
+    The least recently used blocks are evicted once the cache holds more than
+    `max_bytes`, see sqlite_store.LRUStore. The database can be shared by several
+    processes, which also share the counters of hits, misses, bytes saved and fetched,
+    and evictions.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        block_size (int): The size of the blocks.
+        max_bytes (int): The maximum size of the cached blocks.
+    """
+
+    table = "blocks"
+
+    def __init__(self, path: str, block_size: int = 65536, max_bytes: int = 1073741824, timeout: float = 10):
+        self.block_size = block_size
+        super().__init__(path, max_bytes, timeout)
+
+    def _create(self, connection: sqlite3.Connection):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS blocks ("
+            "key TEXT NOT NULL, block INTEGER NOT NULL, data BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (key, block))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS blocks_last_access ON blocks (last_access)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS block_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO block_cache_stats (name, value) VALUES (?, 0)",
+            [(name,) for name in STAT_NAMES],
+        )
+        super()._create(connection)
+
+    def get_key(self, url: str, identity: str) -> str:
+        """
+        Return the key of the blocks of a remote file.
+        """
+        return self._get_versioned_key(self.block_size, url.split("?")[0], identity)
+
+    def get_blocks(self, key: str, first: int, last: int) -> Dict[int, bytes]:
+        """
+        Return the cached blocks of a file from `first` to `last` included, by index.
+
+        This does not write to the database, the blocks are marked as used with the next
+        write of this process, see put_blocks.
+        """
+        rows = self._connect().execute(
+            "SELECT rowid, block, data FROM blocks WHERE key = ? AND block BETWEEN ? AND ?",
+            (key, first, last),
+        ).fetchall()
+        self._touch(rowid for rowid, _, _ in rows)
+        return {block: data for _, block, data in rows}
+
+    def put_blocks(self, key: str, blocks: Dict[int, bytes], **counters: int):
+        """
+        Store blocks of a file and add to the shared counters, then evict the least
+        recently used blocks above max_bytes, all in a single write.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO blocks (key, block, data, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                [(key, index, data, len(data), now) for index, data in blocks.items()],
+            )
+            evicted = self._evict(connection)
+            self._add_counters(connection, dict(counters, evictions=evicted))
+
+    def count(self, **counters: int):
+        """
+        Add to the shared counters, e.g. count(hits=2, bytes_saved=131072).
+        """
+        with self._connect() as connection:
+            self._add_counters(connection, counters)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Return the shared counters, the ratio of blocks served from the cache, and the
+        number and size of the cached blocks.
+        """
+        connection = self._connect()
+        stats = dict(connection.execute("SELECT name, value FROM block_cache_stats").fetchall())
+        blocks = connection.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+        reads = stats["hits"] + stats["misses"]
+        stats.update(
+            {"hit_ratio": stats["hits"] / reads if reads else 0.0, "blocks": blocks, "bytes": self._get_size(connection)}
+        )
+        return stats
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM blocks")
+            connection.execute("UPDATE block_cache_stats SET value = 0")
+
+    @staticmethod
+    def _add_counters(connection: sqlite3.Connection, counters: Dict[str, int]):
+        connection.executemany(
+            "UPDATE block_cache_stats SET value = value + ? WHERE name = ?",
+            [(value, name) for name, value in counters.items() if value],
+        )
+
+
+class RemoteFile:
+    """
+    Reads byte ranges of a remote file through a block cache.
+
+    The size and identity of the file are read with a request of its first byte, see
+    http_fetch.probe_remote_file. Missing blocks are fetched with one range request per
+    run of consecutive blocks. Files without an ETag or Last-Modified header can not be
+    told apart from a changed file, their ranges are fetched without being cached.
+
+    Attributes:
+        url (str): The URL of the file, with its query string.
+        size (int): The size of the file, None if it is unknown.
+        identity (str): The identity of the content of the file, None if it is unknown.
+        headers (dict): The headers of the file forwarded to GDAL.
+    """
+
+    def __init__(self, cache: BlockCache, url: str, session: Optional[requests.Session] = None):
+        self.cache = cache
+        self.url = url
+        self.session = session or get_http_session()
+        self.size, headers = probe_remote_file(url, self.session)
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        self.identity = None
+        if (etag or last_modified) and self.size is not None:
+            self.identity = f"etag:{etag}|modified:{last_modified}|size:{self.size}"
+        self.headers = {name: headers[name] for name in _FORWARDED_HEADERS if name in headers}
+
+    def read(self, start: int, end: int) -> bytes:
+        """
+        Return the bytes from `start` to `end` included, end being capped to the file size.
+        """
+        end = min(end, self.size - 1)
+        if self.identity is None:
+            return self._fetch(start, end)
+
+        block_size = self.cache.block_size
+        first, last = start // block_size, end // block_size
+        key = self.cache.get_key(self.url, self.identity)
+        blocks = self.cache.get_blocks(key, first, last)
+        cached = sum(len(data) for data in blocks.values())
+
+        fetched = {}
+        index = first
+        while index <= last:
+            if index in blocks:
+                index += 1
+                continue
+            run_end = index
+            while run_end + 1 <= last and run_end + 1 not in blocks:
+                run_end += 1
+            data = self._fetch(index * block_size, min((run_end + 1) * block_size, self.size) - 1)
+            for offset in range(index, run_end + 1):
+                fetched[offset] = data[(offset - index) * block_size:(offset - index + 1) * block_size]
+            index = run_end + 1
+
+        # The fetched blocks, the counters and the touches of the read are written at once
+        self.cache.put_blocks(
+            key,
+            fetched,
+            hits=last - first + 1 - len(fetched),
+            misses=len(fetched),
+            bytes_saved=cached,
+            bytes_fetched=sum(len(data) for data in fetched.values()),
+        )
+        blocks.update(fetched)
+        data = b"".join(blocks[index] for index in range(first, last + 1))
+        offset = start - first * block_size
+        return data[offset:offset + end - start + 1]
+
+    def pass_through(self, range_header: Optional[str]) -> requests.Response:
+        """
+        Read the file, or the range of a Range header, without the cache. Used for files
+        whose size is unknown, so that their reads can not be split in blocks.
+        """
+        headers = {"Range": range_header} if range_header else {}
+        response = self.session.get(self.url, headers=headers, timeout=get_fetch_timeout())
+        response.raise_for_status()
+        return response
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        response = self.session.get(
+            self.url, headers={"Range": f"bytes={start}-{end}"}, timeout=get_fetch_timeout()
+        )
+        response.raise_for_status()
+        if response.status_code == 206:
+            return response.content
+        # The server ignored the range, only keep what was asked for
+        return response.content[start:end + 1]
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Return the first and last bytes of a single byte range of a Range header, e.g.
+    `bytes=0-99`, `bytes=100-` or the last 100 bytes with `bytes=-100`, clipped to the
+    size of the file. Returns None for ranges that can not be served: multiple ranges,
+    other units, malformed headers and ranges outside of the file.
+    """
+    unit, _, byte_range = range_header.strip().partition("=")
+    first, dash, last = byte_range.strip().partition("-")
+    if unit.strip().lower() != "bytes" or not dash:
+        return None
+    if any(value and not value.isdigit() for value in (first, last)):
+        return None
+    if not first:
+        # A suffix range, of the last bytes of the file
+        if not last or int(last) == 0 or size == 0:
+            return None
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end
+
+
+class _BlockCacheHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves remote files to GDAL from the block cache. The path of a request is the
+    URL of the file, encoded, followed by its file name so that GDAL sees its extension.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        remote = self._get_remote_file()
+        if remote is None:
+            return
+        if remote.size is None:
+            self._pass_through(remote, head=True)
+            return
+        self._send_headers(200, remote, remote.size)
+
+    def do_GET(self):
+        remote = self._get_remote_file()
+        if remote is None:
+            return
+        if remote.size is None:
+            self._pass_through(remote)
+            return
+        range_header = self.headers.get("Range")
+        start, end = 0, remote.size - 1
+        if range_header:
+            byte_range = _parse_range(range_header, remote.size)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{remote.size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = byte_range
+        try:
+            data = remote.read(start, end)
+        except requests.RequestException as e:
+            self._send_error(e)
+            return
+        self._send_headers(206 if range_header else 200, remote, len(data), start)
+        self.wfile.write(data)
+
+    def _get_remote_file(self) -> Optional[RemoteFile]:
+        token = self.path.lstrip("/").split("/", 1)[0]
+        try:
+            url = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        except ValueError:
+            self.send_error(404)
+            return None
+        # The proxy only reads from the hosts the block cache is enabled for
+        if urlparse(url).hostname not in self.server.hosts:
+            self.send_error(403)
+            return None
+        try:
+            return self.server.get_remote_file(url)
+        except requests.RequestException as e:
+            self._send_error(e)
+            return None
+
+    def _pass_through(self, remote: RemoteFile, head: bool = False):
+        try:
+            response = remote.pass_through(None if head else self.headers.get("Range"))
+        except requests.RequestException as e:
+            self._send_error(e)
+            return
+        self.send_response(response.status_code)
+        for name in _FORWARDED_HEADERS + ("Content-Range",):
+            if name in response.headers:
+                self.send_header(name, response.headers[name])
+        self.send_header("Content-Length", str(len(response.content)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(response.content)
+
+    def _send_headers(self, status: int, remote: RemoteFile, length: int, start: int = 0):
+        self.send_response(status)
+        for name, value in remote.headers.items():
+            self.send_header(name, value)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(length))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{start + length - 1}/{remote.size}")
+        self.end_headers()
+
+    def _send_error(self, error: requests.RequestException):
+        response = getattr(error, "response", None)
+        status = response.status_code if response is not None else 502
+        logger.warning(f"Could not read {self.path} through the block cache: {error}")
+        self.send_error(status)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _BlockCacheServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, cache: BlockCache, hosts: FrozenSet[str]):
+        super().__init__(("127.0.0.1", 0), _BlockCacheHandler)
+        self.cache = cache
+        self.hosts = hosts
+        # The files read recently, by URL, as (expiry, RemoteFile) tuples
+        self._remote_files: Dict[str, Tuple[float, RemoteFile]] = {}
+        self._remote_files_lock = threading.Lock()
+
+    def get_remote_file(self, url: str) -> RemoteFile:
+        now = time.monotonic()
+        with self._remote_files_lock:
+            self._remote_files = {
+                key: value for key, value in self._remote_files.items() if value[0] > now
+            }
+            entry = self._remote_files.get(url)
+        if entry is not None:
+            return entry[1]
+        remote = RemoteFile(self.cache, url)
+        with self._remote_files_lock:
+            self._remote_files[url] = (now + _IDENTITY_TTL, remote)
+        return remote
+
+
+def _serve(path: str, block_size: int, max_bytes: int, hosts: FrozenSet[str], ports):
+    server = _BlockCacheServer(BlockCache(path, block_size, max_bytes), hosts)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+class BlockCacheProxy:
+    """
+    A local HTTP server reading remote files through a BlockCache, for GDAL.
+
+    GDAL reads the files from the proxy instead of their URL, so that rasterio calls are
+    served from the cache without changing how the files are opened. The server runs
+    in a child process of each process using it: some rasterio calls hold the GIL while
+    GDAL waits for a response, which a server thread of the same process could never send.
+
+    Attributes:
+        path (str): The path of the SQLite database of the cache.
+        hosts (frozenset): The hosts the server reads files from, it refuses other URLs.
+        url (str): The base URL of the server, once started.
+    """
+
+    def __init__(self, path: str, block_size: int, max_bytes: int, hosts: FrozenSet[str]):
+        self.path = path
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self.hosts = hosts
+        self.url = None
+        self._process = None
+        self._owner = None
+        self._lock = threading.Lock()
+
+    def get_url(self, url: str) -> str:
+        """
+        Return the URL to read a remote file from, starting the server if it is not running.
+        """
+        with self._lock:
+            # A forked child inherits the attributes, not the server process
+            if self._process is None or self._owner != os.getpid() or not self._process.is_alive():
+                self._start()
+            base_url = self.url
+        token = base64.urlsafe_b64encode(url.encode()).decode().rstrip("=")
+        name = os.path.basename(urlparse(url).path) or "file"
+        return f"{base_url}/{token}/{quote(name)}"
+
+    def _start(self):
+        context = multiprocessing.get_context("spawn")
+        ports = context.Queue()
+        process = context.Process(
+            target=_serve, args=(self.path, self.block_size, self.max_bytes, self.hosts, ports), daemon=True
+        )
+        process.start()
+        self.url = f"http://127.0.0.1:{ports.get(timeout=60)}"
+        self._process = process
+        self._owner = os.getpid()
+        logger.info(f"Started the block cache proxy of {self.path} on {self.url}")
+
+    def stop(self):
+        with self._lock:
+            if self._process is not None and self._owner == os.getpid():
+                self._process.terminate()
+                self._process.join()
+            self._process = None
+
+
+# One proxy, shared by the threads of a process
+_proxy: Optional[BlockCacheProxy] = None
+_proxy_lock = threading.Lock()
+
+
+def get_block_cache() -> Optional[BlockCache]:
+    """
+    Return the block cache, or None if it is disabled.
+
+    The cache is enabled by setting `BLOCK_CACHE_PATH` to the path of its SQLite
+    database. Its size is capped by `BLOCK_CACHE_MAX_BYTES` (defaults to 1 GiB) and
+    its blocks are `BLOCK_CACHE_BLOCK_SIZE` bytes (defaults to 64 KiB).
+    """
+    path = os.getenv("BLOCK_CACHE_PATH")
+    if not path:
+        return None
+
+    return get_shared_store(BlockCache, path, *_get_block_cache_settings())
+
+
+def get_cached_url(filepath: str) -> str:
+    """
+    Return the path to open a raster from: the block cache proxy for HTTP(S) files of
+    the hosts whose GDAL profile enables the block cache (see
+    gdal_profiles.get_block_cache_hosts) when the block cache is enabled, else the path
+    itself.
+    """
+    global _proxy
+    path = os.getenv("BLOCK_CACHE_PATH")
+    parsed = urlparse(filepath)
+    if not path or parsed.scheme not in ("http", "https"):
+        return filepath
+    hosts = get_block_cache_hosts()
+    if parsed.hostname not in hosts:
+        return filepath
+
+    block_size, max_bytes = _get_block_cache_settings()
+    settings = (path, block_size, max_bytes, hosts)
+    with _proxy_lock:
+        if _proxy is None or (_proxy.path, _proxy.block_size, _proxy.max_bytes, _proxy.hosts) != settings:
+            if _proxy is not None:
+                _proxy.stop()
+            _proxy = BlockCacheProxy(*settings)
+        proxy = _proxy
+    return proxy.get_url(filepath)
+
+
+def stop_block_cache_proxy():
+    """
+    Stop the block cache proxy of this process, if it was started.
+    """
+    global _proxy
+    with _proxy_lock:
+        if _proxy is not None:
+            _proxy.stop()
+            _proxy = None
+
+
+def _get_block_cache_settings() -> Tuple[int, int]:
+    return (
+        int(os.getenv("BLOCK_CACHE_BLOCK_SIZE", "65536")),
+        int(os.getenv("BLOCK_CACHE_MAX_BYTES", "1073741824")),
+    )
+
+
+atexit.register(stop_block_cache_proxy)
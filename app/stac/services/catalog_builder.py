@@ -0,0 +1,468 @@
+import csv
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from pystac import get_stac_version
+
+from .executors import get_batch_max_workers
+from .geoparquet import GeoParquetWriter
+from .metadata_parsers.metadata_parser_manager import MetadataParserManager
+from .stac_item_creator import STACItemCreator
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMATS = ("json", "ndjson", "csv")
+OUTPUT_FORMATS = ("ndjson", "catalog", "geoparquet")
+
+# Payload fields read from the columns of a CSV manifest, other columns go to the metadata
+_CSV_PAYLOAD_FIELDS = ("parser", "collection", "metadata_url", "raster_statistics", "footprint")
+_UNSAFE_PATH_CHARACTERS = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def get_manifest_format(path: str) -> str:
+    """
+    Return the format of a manifest from its extension.
+
+    Raises:
+        ValueError: If the extension is not one of .json, .ndjson, .jsonl or .csv.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        return "json"
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    if extension == ".csv":
+        return "csv"
+    raise ValueError(f"Unknown manifest format for {path}, expected one of {MANIFEST_FORMATS}")
+
+
+def read_manifest(path: str, manifest_format: Optional[str] = None) -> Iterator[dict]:
+    """
+    Read the payloads of a manifest.
+
+    A JSON manifest holds an array of payloads and an NDJSON manifest one payload per line,
+    as they would be sent to `/stac/generate`. A CSV manifest has a `files` column, with
+    the files separated by spaces or semicolons, optional `parser`, `collection`,
+    `metadata_url`, `raster_statistics`, `footprint` and `metadata` (a JSON object) columns, and any
+    other column is added to the metadata.
+
+    Args:
+        path (str): The path of the manifest.
+        manifest_format (str): One of MANIFEST_FORMATS, guessed from the extension if None.
+
+    Yields:
+        dict: The payloads, in manifest order.
+    """
+    manifest_format = manifest_format or get_manifest_format(path)
+    if manifest_format == "json":
+        with open(path, "rb") as manifest:
+            payloads = orjson.loads(manifest.read())
+        if not isinstance(payloads, list):
+            raise ValueError(f"The JSON manifest {path} should hold an array of payloads")
+        yield from payloads
+    elif manifest_format == "ndjson":
+        with open(path, "rb") as manifest:
+            for line in manifest:
+                if line.strip():
+                    yield orjson.loads(line)
+    elif manifest_format == "csv":
+        with open(path, newline="") as manifest:
+            for row in csv.DictReader(manifest):
+                yield _read_csv_row(row)
+    else:
+        raise ValueError(f"Unknown manifest format {manifest_format}, expected one of {MANIFEST_FORMATS}")
+
+
+def _read_csv_row(row: Dict[str, str]) -> dict:
+    """
+    Convert a row of a CSV manifest to a payload.
+    """
+    payload = {"files": re.split(r"[;\s]+", (row.pop("files", None) or "").strip())}
+    metadata = row.pop("metadata", None)
+    metadata = orjson.loads(metadata) if metadata else {}
+    for key, value in row.items():
+        if value in (None, ""):
+            continue
+        if key in _CSV_PAYLOAD_FIELDS:
+            payload[key] = value
+        else:
+            metadata[key] = value
+    if metadata:
+        payload["metadata"] = metadata
+    return payload
+
+
+def get_payload_key(payload: dict) -> str:
+    """
+    Return a key identifying a payload in a checkpoint, from its content.
+    """
+    return hashlib.sha1(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def get_collection_id(payload: dict) -> str:
+    """
+    Return the collection of a payload, like the generation routes do.
+    """
+    return payload.get("collection") or payload.get("parser") or "default"
+
+
+class Checkpoint:
+    """
+    The entries of a build that are done, appended to an NDJSON file as they finish.
+
+    Each line holds the "index", "key", "id", "status" and "seconds" of an entry, so the
+    file is also the per-item timing report of the build.
+
+    Attributes:
+        path (str): The path of the checkpoint file.
+        completed (set): The keys of the payloads that were generated successfully.
+    """
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.completed = set()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, "rb") as checkpoint:
+                for line in checkpoint:
+                    try:
+                        entry = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        # The last line of an interrupted build may be truncated
+                        continue
+                    if entry.get("status") == "success":
+                        self.completed.add(entry["key"])
+        self._file = open(path, "ab")
+
+    def record(self, entry: Dict[str, Any]):
+        record = {name: entry.get(name) for name in ("index", "key", "id", "status", "seconds", "detail")}
+        self._file.write(orjson.dumps(record) + b"\n")
+        self._file.flush()
+        if entry["status"] == "success":
+            self.completed.add(entry["key"])
+
+    def close(self):
+        self._file.close()
+
+
+class NDJSONItemWriter:
+    """
+    Writes items to an NDJSON file, appending to it when a build is resumed.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self._file = open(path, "ab" if append else "wb")
+
+    def write(self, item: dict, collection: str):
+        item.setdefault("collection", collection)
+        self._file.write(orjson.dumps(item, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class StaticCatalogWriter:
+    """
+    Writes items to a static STAC catalog, with relative links.
+
+    Items are written to `<root>/<collection>/<item id>/<item id>.json` as they are
+    generated. The collections and the root `catalog.json` are written on close, from
+    every item found in the directory, so that resumed builds include earlier items.
+    """
+
+    def __init__(self, root: str, catalog_id: str = "stac-generator", description: str = ""):
+        self.root = root
+        self.catalog_id = catalog_id
+        self.description = description or "Catalog built by the STAC generator"
+        os.makedirs(root, exist_ok=True)
+
+    def write(self, item: dict, collection: str):
+        collection_dir = _get_safe_name(collection)
+        item_dir = _get_safe_name(item["id"])
+        os.makedirs(os.path.join(self.root, collection_dir, item_dir), exist_ok=True)
+        item["collection"] = collection
+        item["links"] = [
+            link for link in item.get("links", []) if link.get("rel") not in ("root", "parent", "collection", "self")
+        ] + [
+            {"rel": "root", "href": "../../catalog.json", "type": "application/json"},
+            {"rel": "parent", "href": "../collection.json", "type": "application/json"},
+            {"rel": "collection", "href": "../collection.json", "type": "application/json"},
+        ]
+        path = os.path.join(self.root, collection_dir, item_dir, f"{item_dir}.json")
+        # Written then renamed, so an interrupted build never leaves a partial item
+        with open(path + ".tmp", "wb") as item_file:
+            item_file.write(orjson.dumps(item, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_INDENT_2))
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        children = []
+        for collection_dir in sorted(os.listdir(self.root)):
+            if os.path.isdir(os.path.join(self.root, collection_dir)):
+                collection = self._write_collection(collection_dir)
+                if collection is not None:
+                    children.append({
+                        "rel": "child",
+                        "href": f"./{collection_dir}/collection.json",
+                        "type": "application/json",
+                        "title": collection,
+                    })
+
+        catalog = {
+            "type": "Catalog",
+            "stac_version": get_stac_version(),
+            "id": self.catalog_id,
+            "description": self.description,
+            "links": [{"rel": "root", "href": "./catalog.json", "type": "application/json"}] + children,
+        }
+        self._write_json(os.path.join(self.root, "catalog.json"), catalog)
+
+    def _write_collection(self, collection_dir: str) -> Optional[str]:
+        """
+        Write the collection.json of a collection directory, with the extent of its items.
+
+        The items are read one at a time. Returns the collection ID, or None if the
+        directory holds no item.
+        """
+        collection_id = None
+        bbox = None
+        start, end = None, None
+        links = []
+        directory = os.path.join(self.root, collection_dir)
+        for item_dir in sorted(os.listdir(directory)):
+            path = os.path.join(directory, item_dir, f"{item_dir}.json")
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as item_file:
+                item = orjson.loads(item_file.read())
+            collection_id = item.get("collection", collection_dir)
+            links.append({"rel": "item", "href": f"./{item_dir}/{item_dir}.json", "type": "application/json"})
+
+            if item.get("bbox"):
+                item_bbox = item["bbox"]
+                half = len(item_bbox) // 2
+                if bbox is None:
+                    bbox = list(item_bbox)
+                elif len(bbox) == len(item_bbox):
+                    bbox = [min(a, b) for a, b in zip(bbox[:half], item_bbox[:half])] + [
+                        max(a, b) for a, b in zip(bbox[half:], item_bbox[half:])
+                    ]
+            properties = item.get("properties", {})
+            for value in (properties.get("datetime"), properties.get("start_datetime"), properties.get("end_datetime")):
+                if value:
+                    # STAC datetimes are RFC 3339 strings in UTC, which sort chronologically
+                    start = value if start is None or value < start else start
+                    end = value if end is None or value > end else end
+
+        if collection_id is None:
+            return None
+
+        collection = {
+            "type": "Collection",
+            "stac_version": get_stac_version(),
+            "id": collection_id,
+            "description": f"Items of the {collection_id} collection",
+            "license": "proprietary",
+            "extent": {
+                "spatial": {"bbox": [bbox or [-180, -90, 180, 90]]},
+                "temporal": {"interval": [[start, end]]},
+            },
+            "links": [
+                {"rel": "root", "href": "../catalog.json", "type": "application/json"},
+                {"rel": "parent", "href": "../catalog.json", "type": "application/json"},
+            ] + links,
+        }
+        self._write_json(os.path.join(directory, "collection.json"), collection)
+        return collection_id
+
+    @staticmethod
+    def _write_json(path: str, document: dict):
+        with open(path, "wb") as output:
+            output.write(orjson.dumps(document, option=orjson.OPT_INDENT_2))
+
+
+def _get_safe_name(name: str) -> str:
+    return _UNSAFE_PATH_CHARACTERS.sub("_", name)
+
+
+def _init_build_worker():
+    """
+    Load the parsers once per worker process, before its first item.
+    """
+    MetadataParserManager.load_parsers()
+
+
+def _build_entry(index: int, key: str, payload: dict) -> Dict[str, Any]:
+    """
+    Generate the STAC item of a manifest entry inside a worker process, timing it.
+
+    Errors are converted to strings in the worker, since not every exception
+    raised by GDAL can be pickled back to the parent process.
+    """
+    started = time.perf_counter()
+    try:
+        item = STACItemCreator(payload).create_item()
+        entry = {"index": index, "key": key, "id": item["id"], "status": "success", "item": item}
+    except Exception as e:
+        logger.exception(e)
+        entry = {"index": index, "key": key, "status": "error", "detail": str(e)}
+    entry["seconds"] = round(time.perf_counter() - started, 6)
+    return entry
+
+
+def _get_timing_summary(seconds: List[float]) -> Dict[str, float]:
+    """
+    Return the mean, median, 95th percentile and maximum of the item timings.
+    """
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+    return {
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "p50": ordered[(len(ordered) - 1) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def build_catalog(
+    manifest: str,
+    output: str,
+    output_format: str = "ndjson",
+    checkpoint: Optional[str] = None,
+    restart: bool = False,
+    workers: Optional[int] = None,
+    manifest_format: Optional[str] = None,
+    catalog_id: str = "stac-generator",
+    row_group_size: int = 1000,
+    part_size: int = 100000,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Generate the STAC items of a manifest across a pool of worker processes and write them.
+
+    Entries are recorded in the checkpoint as they finish, and entries already generated
+    successfully are skipped when a build is run again with the same checkpoint, so an
+    interrupted build resumes where it stopped. Failed entries are retried. Items written
+    to GeoParquet are only recorded once the part file holding them is complete.
+
+    Args:
+        manifest (str): The path of the manifest, see read_manifest.
+        output (str): The NDJSON file, or the directory of the static catalog or of the
+            GeoParquet dataset.
+        output_format (str): "ndjson", "catalog" or "geoparquet".
+        checkpoint (str): The path of the checkpoint, defaults to the output with a
+            `.checkpoint` suffix.
+        restart (bool): Whether to discard the checkpoint and build everything again.
+        workers (int): The number of worker processes, defaults to BATCH_MAX_WORKERS.
+        manifest_format (str): The format of the manifest, guessed from its extension if None.
+        catalog_id (str): The ID of the root catalog of a static catalog.
+        row_group_size (int): The number of items per GeoParquet row group.
+        part_size (int): The maximum number of items per GeoParquet part file.
+        progress (callable): Called with each finished entry, without its item.
+
+    Returns:
+        dict: The number of entries generated, failed and skipped, the elapsed time and
+        a summary of the item timings in seconds.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format}, expected one of {OUTPUT_FORMATS}")
+    workers = workers or get_batch_max_workers()
+    checkpoint = Checkpoint(checkpoint or f"{output.rstrip(os.sep)}.checkpoint", restart=restart)
+    if output_format == "ndjson":
+        writer = NDJSONItemWriter(output, append=bool(checkpoint.completed))
+    elif output_format == "catalog":
+        writer = StaticCatalogWriter(output, catalog_id=catalog_id)
+    else:
+        writer = GeoParquetWriter(
+            output,
+            row_group_size=row_group_size,
+            part_size=part_size,
+            on_part=lambda entries: [checkpoint.record(entry) for entry in entries],
+        )
+
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+    timings = []
+    started = time.perf_counter()
+    # Payloads of the entries being generated, by future
+    pending: Dict[Any, Tuple[int, str, dict]] = {}
+    pool = None
+
+    def new_pool():
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_build_worker,
+        )
+
+    def finish(entry: Dict[str, Any], payload: dict):
+        if entry["status"] == "success":
+            item, collection = entry.pop("item"), get_collection_id(payload)
+            if isinstance(writer, GeoParquetWriter):
+                item.setdefault("collection", collection)
+                # Recorded in the checkpoint by on_part
+                writer.write(item, token=entry)
+            else:
+                writer.write(item, collection)
+                checkpoint.record(entry)
+            counts["succeeded"] += 1
+        else:
+            counts["failed"] += 1
+            checkpoint.record(entry)
+        timings.append(entry["seconds"])
+        if progress is not None:
+            progress(entry)
+
+    def collect(return_when):
+        nonlocal pool
+        done, _ = wait(list(pending), return_when=return_when)
+        broken = False
+        for future in done:
+            index, key, payload = pending.pop(future)
+            try:
+                entry = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. a crash inside GDAL), its entries are retried on resume
+                broken = True
+                entry = {"index": index, "key": key, "status": "error", "seconds": 0.0, "detail": str(e)}
+            finish(entry, payload)
+        if broken:
+            pool.shutdown(wait=False)
+            pool = new_pool()
+
+    try:
+        pool = new_pool()
+        for index, payload in enumerate(read_manifest(manifest, manifest_format)):
+            key = get_payload_key(payload)
+            if key in checkpoint.completed:
+                counts["skipped"] += 1
+                continue
+            # Keep a couple of entries queued per worker, the manifest is read as they finish
+            while len(pending) >= workers * 2:
+                collect(FIRST_COMPLETED)
+            pending[pool.submit(_build_entry, index, key, payload)] = (index, key, payload)
+        while pending:
+            collect(FIRST_COMPLETED)
+    finally:
+        for future in pending:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown(wait=True)
+        writer.close()
+        checkpoint.close()
+
+    return dict(
+        counts,
+        elapsed=round(time.perf_counter() - started, 6),
+        timings=_get_timing_summary(timings),
+    )
@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_generation_executor: Optional[ThreadPoolExecutor] = None
+_asset_executor: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_executors_lock = threading.Lock()
+
+
+def _get_worker_count(env_var: str, default: int) -> int:
+    """
+    Read a worker count from the environment, falling back to a default.
+    """
+    value = os.getenv(env_var)
+    if value:
+        return max(1, int(value))
+    return default
+
+
+def get_generation_max_workers() -> int:
+    """
+    Return the number of threads used to run blocking item generation.
+
+    Reads `GENERATION_MAX_WORKERS`. The default follows ThreadPoolExecutor, since
+    the work is dominated by GDAL and network reads that release the GIL.
+    """
+    return _get_worker_count("GENERATION_MAX_WORKERS", min(32, (os.cpu_count() or 1) + 4))
+
+
+def get_asset_max_workers() -> int:
+    """
+    Return the number of threads used to inspect the TIFF assets of items.
+
+    Reads `ASSET_MAX_WORKERS`. The pool is shared by every item being generated,
+    so it also bounds the number of rasters read at the same time.
+    """
+    return _get_worker_count("ASSET_MAX_WORKERS", min(32, (os.cpu_count() or 1) + 4))
+
+
+def get_batch_max_workers() -> int:
+    """
+    Return the number of worker processes used for batch generation.
+
+    Reads `BATCH_MAX_WORKERS` and falls back to the number of CPUs.
+    """
+    return _get_worker_count("BATCH_MAX_WORKERS", os.cpu_count() or 1)
+
+
+def get_generation_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool used to run blocking item generation, creating it on first use.
+    """
+    global _generation_executor
+    if _generation_executor is None:
+        max_workers = get_generation_max_workers()
+        logger.info(f"Starting generation executor with {max_workers} threads")
+        _generation_executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="stac-generation"
+        )
+    return _generation_executor
+
+
+def get_asset_executor() -> ThreadPoolExecutor:
+    """
+    Return the thread pool used to inspect TIFF assets, creating it on first use.
+
+    This is kept apart from the generation executor, whose threads wait on it.
+    """
+    global _asset_executor
+    # Requested concurrently by the generation threads
+    with _executors_lock:
+        if _asset_executor is None:
+            max_workers = get_asset_max_workers()
+            logger.info(f"Starting asset executor with {max_workers} threads")
+            _asset_executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="stac-asset"
+            )
+    return _asset_executor
+
+
+def get_batch_process_pool() -> ProcessPoolExecutor:
+    """
+    Return the process pool used for batch generation, creating it on first use.
+
+    Workers are started with the "spawn" method, GDAL state is not safe to share
+    with a forked child of a multi-threaded server process.
+    """
+    global _process_pool
+    if _process_pool is None:
+        max_workers = get_batch_max_workers()
+        logger.info(f"Starting batch process pool with {max_workers} workers")
+        if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            logger.warning("PROMETHEUS_MULTIPROC_DIR is not set, /metrics will not report the batch workers")
+        _process_pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+async def run_in_generation_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking callable on the generation executor without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_generation_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def discard_batch_process_pool(pool: ProcessPoolExecutor):
+    """
+    Drop a broken batch process pool without waiting for its workers, the next
+    submission starts a new pool.
+    """
+    global _process_pool
+    with _executors_lock:
+        if _process_pool is pool:
+            logger.warning("Discarding broken batch process pool")
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def shutdown_batch_process_pool():
+    """
+    Shut down the batch process pool if it has been started.
+    """
+    global _process_pool
+    if _process_pool is not None:
+        logger.info("Shutting down batch process pool")
+        _process_pool.shutdown(wait=True)
+        _process_pool = None
+
+
+def shutdown_executors():
+    """
+    Shut down every executor that has been started.
+    """
+    global _generation_executor, _asset_executor
+    if _generation_executor is not None:
+        logger.info("Shutting down generation executor")
+        _generation_executor.shutdown(wait=True)
+        _generation_executor = None
+    if _asset_executor is not None:
+        logger.info("Shutting down asset executor")
+        _asset_executor.shutdown(wait=True)
+        _asset_executor = None
+    shutdown_batch_process_pool()
@@ -1,6 +1,6 @@
 import mimetypes
 import os
-from typing import Union, Tuple, List, Dict, Any
+from typing import Optional, Union, Tuple, List, Dict, Any
 import logging
 from urllib.parse import urlparse
 
@@ -9,7 +9,13 @@ logger = logging.getLogger(__name__)
 import pathlib
 
 import rasterio
+import requests
 from rasterio.env import GDALVersion
+from rasterio.io import DatasetReader
+
+from .block_cache import get_cached_url
+from .gdal_profiles import gdal_env
+from .tiff_header import TiffHeaderError, supports_header_validation, validate_cog_header
 
 EXT_TO_MIME_LOOKUP = {
     '.dbf': 'application/x-dbf',
@@ -62,8 +68,24 @@ def get_mounted_file(filepath: str):
     return filepath
 
 
+def open_raster(filepath: Union[str, pathlib.PurePath]) -> DatasetReader:
+    """
+    Open a raster for reading. HTTP(S) files are read through the block cache when
+    `BLOCK_CACHE_PATH` is set, see block_cache.get_cached_url.
+
+    Args:
+        filepath (str or PathLike): The path or URL of the raster.
+
+    Returns:
+        DatasetReader: The open raster.
+    """
+    if isinstance(filepath, str):
+        filepath = get_cached_url(get_mounted_file(filepath))
+    return rasterio.open(filepath)
+
+
 def is_cog(
-    src_path: Union[str, pathlib.PurePath],
+    src_path: Union[str, pathlib.PurePath, DatasetReader],
     strict: bool = False,
 ) -> Tuple[bool, List[str], List[str]]:
     """
@@ -72,8 +94,12 @@ def is_cog(
     https://svn.osgeo.org/gdal/trunk/gdal/swig/python/samples/validate_cloud_optimized_geotiff.py
     Parameters
     ----------
-    src_path: str or PathLike object
-        A dataset path or URL. Will be opened in "r" mode.
+    src_path: str, PathLike object or open dataset
+        A dataset path or URL, or an already open dataset. Local paths and
+        HTTP(S) URLs are validated from the TIFF header only, read with a few
+        byte range requests, unless COG_HEADER_VALIDATION is "false". Other
+        paths, and headers that can not be parsed, are opened with GDAL.
+        Everything is read from a single dataset handle when one is given.
     strict: bool
         Treat warnings as errors
     Returns
@@ -85,156 +111,252 @@ def is_cog(
     warnings: list
         List of validation warnings.
     """
-    errors: List[str] = []
-    warnings: List[str] = []
-    details: Dict[str, Any] = {}
-
     if not GDALVersion.runtime().at_least("2.2"):
         raise Exception("GDAL 2.2 or above required")
 
-    with rasterio.Env():
-        with rasterio.open(src_path) as src:
-            if not src.driver == "GTiff":
-                errors.append("The file is not a GeoTIFF")
-                return False, errors, warnings
-
-            if any(pathlib.Path(x).suffix.lower() == ".ovr" for x in src.files):
-                errors.append(
-                    "Overviews found in external .ovr file. They should be internal"
+    if isinstance(src_path, DatasetReader):
+        errors, warnings = _validate_cog_dataset(src_path)
+    else:
+        if _use_header_validation(src_path):
+            try:
+                return validate_cog_header(str(src_path), strict)
+            except (TiffHeaderError, OSError, requests.RequestException) as e:
+                logger.warning(
+                    f"Could not validate the COG header of {src_path}, opening it with GDAL: {e}"
                 )
 
-            overviews = src.overviews(1)
-            if src.width > 512 and src.height > 512:
-                if not src.is_tiled:
-                    errors.append(
-                        "The file is greater than 512xH or 512xW, but is not tiled"
-                    )
+        with gdal_env(str(src_path)):
+            with open_raster(src_path) as src:
+                errors, warnings = _validate_cog_dataset(src)
 
-                if not overviews:
-                    warnings.append(
-                        "The file is greater than 512xH or 512xW, it is recommended "
-                        "to include internal overviews"
-                    )
+    is_valid = False if errors or (warnings and strict) else True
 
-            ifd_offset = int(src.get_tag_item("IFD_OFFSET", "TIFF", bidx=1))
-            if ifd_offset > 300:
-                errors.append(
-                    f"The offset of the main IFD should be < 300. It is {ifd_offset} instead"
-                )
+    return is_valid, errors, warnings
 
-            ifd_offsets = [ifd_offset]
-            details["ifd_offsets"] = {}
-            details["ifd_offsets"]["main"] = ifd_offset
 
-            if overviews and overviews != sorted(overviews):
-                errors.append("Overviews should be sorted")
+def _use_header_validation(src_path: Union[str, pathlib.PurePath]) -> bool:
+    """
+    Return True if the COG layout of a path should be validated from its header only.
+    """
+    if os.getenv("COG_HEADER_VALIDATION", "true").lower() != "true":
+        return False
+    return supports_header_validation(str(src_path))
 
-            for ix, dec in enumerate(overviews):
-                if not dec > 1:
-                    errors.append(
-                        "Invalid Decimation {} for overview level {}".format(dec, ix)
-                    )
 
-                # Check that the IFD of descending overviews are sorted by increasing
-                # offsets
-                ifd_offset = int(src.get_tag_item("IFD_OFFSET", "TIFF", bidx=1, ovr=ix))
-                ifd_offsets.append(ifd_offset)
-
-                details["ifd_offsets"]["overview_{}".format(ix)] = ifd_offset
-                if ifd_offsets[-1] < ifd_offsets[-2]:
-                    if ix == 0:
-                        errors.append(
-                            "The offset of the IFD for overview of index {} is {}, "
-                            "whereas it should be greater than the one of the main "
-                            "image, which is at byte {}".format(
-                                ix, ifd_offsets[-1], ifd_offsets[-2]
-                            )
-                        )
-                    else:
-                        errors.append(
-                            "The offset of the IFD for overview of index {} is {}, "
-                            "whereas it should be greater than the one of index {}, "
-                            "which is at byte {}".format(
-                                ix, ifd_offsets[-1], ix - 1, ifd_offsets[-2]
-                            )
-                        )
-
-            block_offset = src.get_tag_item("BLOCK_OFFSET_0_0", "TIFF", bidx=1)
-
-            data_offset = int(block_offset) if block_offset else 0
-            data_offsets = [data_offset]
-            details["data_offsets"] = {}
-            details["data_offsets"]["main"] = data_offset
-
-            for ix, _dec in enumerate(overviews):
-                block_offset = src.get_tag_item(
-                    "BLOCK_OFFSET_0_0", "TIFF", bidx=1, ovr=ix
-                )
-                data_offset = int(block_offset) if block_offset else 0
-                data_offsets.append(data_offset)
-                details["data_offsets"]["overview_{}".format(ix)] = data_offset
-
-            if data_offsets[-1] != 0 and data_offsets[-1] < ifd_offsets[-1]:
-                if len(overviews) > 0:
-                    errors.append(
-                        "The offset of the first block of the smallest overview "
-                        "should be after its IFD"
-                    )
-                else:
-                    errors.append(
-                        "The offset of the first block of the image should "
-                        "be after its IFD"
-                    )
+def _validate_cog_dataset(src: DatasetReader) -> Tuple[List[str], List[str]]:
+    """
+    Run the COG validation checks against an open dataset and return the errors and warnings.
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    details: Dict[str, Any] = {}
 
-            for i in range(len(data_offsets) - 2, 0, -1):
-                if data_offsets[i] < data_offsets[i + 1]:
-                    errors.append(
-                        "The offset of the first block of overview of index {} should "
-                        "be after the one of the overview of index {}".format(i - 1, i)
+    if not src.driver == "GTiff":
+        errors.append("The file is not a GeoTIFF")
+        return errors, warnings
+
+    if any(pathlib.Path(x).suffix.lower() == ".ovr" for x in src.files):
+        errors.append(
+            "Overviews found in external .ovr file. They should be internal"
+        )
+
+    overviews = src.overviews(1)
+    if src.width > 512 and src.height > 512:
+        if not src.is_tiled:
+            errors.append(
+                "The file is greater than 512xH or 512xW, but is not tiled"
+            )
+
+        if not overviews:
+            warnings.append(
+                "The file is greater than 512xH or 512xW, it is recommended "
+                "to include internal overviews"
+            )
+
+    ifd_offset = int(src.get_tag_item("IFD_OFFSET", "TIFF", bidx=1))
+    if ifd_offset > 300:
+        errors.append(
+            f"The offset of the main IFD should be < 300. It is {ifd_offset} instead"
+        )
+
+    ifd_offsets = [ifd_offset]
+    details["ifd_offsets"] = {}
+    details["ifd_offsets"]["main"] = ifd_offset
+
+    if overviews and overviews != sorted(overviews):
+        errors.append("Overviews should be sorted")
+
+    for ix, dec in enumerate(overviews):
+        if not dec > 1:
+            errors.append(
+                "Invalid Decimation {} for overview level {}".format(dec, ix)
+            )
+
+        # Check that the IFD of descending overviews are sorted by increasing
+        # offsets
+        ifd_offset = int(src.get_tag_item("IFD_OFFSET", "TIFF", bidx=1, ovr=ix))
+        ifd_offsets.append(ifd_offset)
+
+        details["ifd_offsets"]["overview_{}".format(ix)] = ifd_offset
+        if ifd_offsets[-1] < ifd_offsets[-2]:
+            if ix == 0:
+                errors.append(
+                    "The offset of the IFD for overview of index {} is {}, "
+                    "whereas it should be greater than the one of the main "
+                    "image, which is at byte {}".format(
+                        ix, ifd_offsets[-1], ifd_offsets[-2]
                     )
-
-            if len(data_offsets) >= 2 and data_offsets[0] < data_offsets[1]:
+                )
+            else:
                 errors.append(
-                    "The offset of the first block of the main resolution image "
-                    "should be after the one of the overview of index {}".format(
-                        len(overviews) - 1
+                    "The offset of the IFD for overview of index {} is {}, "
+                    "whereas it should be greater than the one of index {}, "
+                    "which is at byte {}".format(
+                        ix, ifd_offsets[-1], ix - 1, ifd_offsets[-2]
                     )
                 )
 
-        for ix, _dec in enumerate(overviews):
-            with rasterio.open(src_path, OVERVIEW_LEVEL=ix) as ovr_dst:
-                if ovr_dst.width > 512 and ovr_dst.height > 512:
-                    if not ovr_dst.is_tiled:
-                        errors.append("Overview of index {} is not tiled".format(ix))
+    block_offset = src.get_tag_item("BLOCK_OFFSET_0_0", "TIFF", bidx=1)
+
+    data_offset = int(block_offset) if block_offset else 0
+    data_offsets = [data_offset]
+    details["data_offsets"] = {}
+    details["data_offsets"]["main"] = data_offset
+
+    for ix, _dec in enumerate(overviews):
+        block_offset = src.get_tag_item(
+            "BLOCK_OFFSET_0_0", "TIFF", bidx=1, ovr=ix
+        )
+        data_offset = int(block_offset) if block_offset else 0
+        data_offsets.append(data_offset)
+        details["data_offsets"]["overview_{}".format(ix)] = data_offset
+
+    if data_offsets[-1] != 0 and data_offsets[-1] < ifd_offsets[-1]:
+        if len(overviews) > 0:
+            errors.append(
+                "The offset of the first block of the smallest overview "
+                "should be after its IFD"
+            )
+        else:
+            errors.append(
+                "The offset of the first block of the image should "
+                "be after its IFD"
+            )
+
+    for i in range(len(data_offsets) - 2, 0, -1):
+        if data_offsets[i] < data_offsets[i + 1]:
+            errors.append(
+                "The offset of the first block of overview of index {} should "
+                "be after the one of the overview of index {}".format(i - 1, i)
+            )
+
+    if len(data_offsets) >= 2 and data_offsets[0] < data_offsets[1]:
+        errors.append(
+            "The offset of the first block of the main resolution image "
+            "should be after the one of the overview of index {}".format(
+                len(overviews) - 1
+            )
+        )
+
+    for ix, _dec in enumerate(overviews):
+        ovr_width, ovr_height = _get_overview_shape(src, ix)
+        if ovr_width > 512 and ovr_height > 512 and not _is_overview_tiled(src, ix):
+            errors.append("Overview of index {} is not tiled".format(ix))
+
+    return errors, warnings
+
+
+def _is_overview_tiled(src: DatasetReader, ovr_index: int) -> bool:
+    """
+    Return whether an overview level of an open dataset is tiled, i.e. whether its block
+    width differs from its width, like DatasetReader.is_tiled.
 
-    is_valid = False if errors or (warnings and strict) else True
+    A striped overview has a single block per row, so an overview with a block at column 1
+    is tiled, which is read from the main dataset handle. Otherwise the overview fits in a
+    single column of blocks, or its block at column 1 is sparse, and its block shape is
+    read by opening the overview level.
+    """
+    if src.get_tag_item("BLOCK_OFFSET_1_0", "TIFF", bidx=1, ovr=ovr_index) is not None:
+        return True
+    with rasterio.open(src.name, OVERVIEW_LEVEL=ovr_index) as ovr:
+        return ovr.is_tiled
 
-    return is_valid, errors, warnings
+
+def _get_overview_shape(src: DatasetReader, ovr_index: int) -> Tuple[int, int]:
+    """
+    Return the (width, height) of an overview level of an open dataset.
+
+    GDAL computes overview dimensions by rounding up the division by the decimation factor.
+    """
+    factor = src.overviews(1)[ovr_index]
+    return -(-src.width // factor), -(-src.height // factor)
 
 
-def return_tiff_media_type(tiff_path: str) -> str:
+def return_tiff_media_type(tiff_path: str, src: DatasetReader = None) -> str:
     """Return the media type of a TIFF file
 
     Args:
         tiff_path (str): Path to the TIFF file
+        src (DatasetReader, optional): The TIFF file already opened, to avoid opening it again
 
     Returns:
         str: The media type of the TIFF file
     """
     if os.getenv("CHECK_COG_TYPE", "false").lower() == "true":
-        cog = is_cog(get_mounted_file(tiff_path))
+        return _get_cog_media_type(is_cog(src if src is not None else get_mounted_file(tiff_path)))
+
+    return "image/tiff; application=geotiff"
+
+
+def checks_remote_tiff_header(tiff_path: str) -> bool:
+    """Return True if the COG layout of a TIFF file is checked from its header before it is opened
+
+    This is the case of HTTP(S) files that are not read through the block cache when
+    CHECK_COG_TYPE and COG_HEADER_VALIDATION are enabled: a few range requests then
+    replace the reads GDAL makes to check the IFDs of every overview of the open dataset.
+
+    Args:
+        tiff_path (str): Path to the TIFF file
+
+    Returns:
+        bool: Whether return_remote_tiff_media_type applies to the file
+    """
+    if os.getenv("CHECK_COG_TYPE", "false").lower() != "true":
+        return False
+    if urlparse(tiff_path).scheme not in ("http", "https") or not _use_header_validation(tiff_path):
+        return False
+    return get_cached_url(tiff_path) == tiff_path
+
+
+def return_remote_tiff_media_type(tiff_path: str) -> Optional[str]:
+    """Return the media type of a remote TIFF file from its header, see checks_remote_tiff_header
+
+    Args:
+        tiff_path (str): URL of the TIFF file
+
+    Returns:
+        str: The media type of the TIFF file, or None if its header could not be validated,
+        it is then checked on the open dataset
+    """
+    try:
+        return _get_cog_media_type(validate_cog_header(tiff_path))
+    except (TiffHeaderError, OSError, requests.RequestException) as e:
+        logger.warning(f"Could not validate the COG header of {tiff_path.split('?')[0]}: {e}")
+        return None
+
 
-        if os.getenv("LOG_COG_INFO", "false").lower() == "true":
-            logger.info("Is the file a COG: {}".format(cog[0]))
+def _get_cog_media_type(cog: Tuple[bool, List[str], List[str]]) -> str:
+    if os.getenv("LOG_COG_INFO", "false").lower() == "true":
+        logger.info("Is the file a COG: {}".format(cog[0]))
 
-            if len(cog[1]) > 0:
-                logger.info("COG errors: {}".format(cog[1]))
+        if len(cog[1]) > 0:
+            logger.info("COG errors: {}".format(cog[1]))
 
-            if len(cog[2]) > 0:
-                logger.info("COG warnings: {}".format(cog[2]))
+        if len(cog[2]) > 0:
+            logger.info("COG warnings: {}".format(cog[2]))
 
-        if cog[0]:
-            return "image/tiff; application=geotiff; profile=cloud-optimized"
+    if cog[0]:
+        return "image/tiff; application=geotiff; profile=cloud-optimized"
 
     return "image/tiff; application=geotiff"
 
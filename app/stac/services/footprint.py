@@ -0,0 +1,232 @@
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+from rasterio.crs import CRS
+from rasterio.enums import MaskFlags
+from rasterio.features import rasterize, shapes
+from rasterio.io import DatasetReader
+from rasterio.transform import Affine, from_origin
+from rasterio.warp import transform_geom
+
+from .raster_statistics import get_overview_read_shape
+
+logger = logging.getLogger(__name__)
+
+FOOTPRINT_BOUNDS = "bounds"
+FOOTPRINT_VALID_DATA = "valid-data"
+FOOTPRINT_METHODS = (FOOTPRINT_BOUNDS, FOOTPRINT_VALID_DATA)
+
+EPSG_4326 = CRS.from_epsg(4326)
+
+
+def get_default_footprint_method() -> str:
+    """
+    Return the footprint method used when neither the request nor the parser sets one.
+
+    Reads `FOOTPRINT_METHOD`, defaults to "bounds".
+    """
+    method = os.getenv("FOOTPRINT_METHOD", FOOTPRINT_BOUNDS).lower()
+    if method not in FOOTPRINT_METHODS:
+        raise ValueError(f"Unsupported FOOTPRINT_METHOD: {method}")
+    return method
+
+
+def resolve_footprint_method(request_method: Optional[str], parser=None) -> str:
+    """
+    Return the footprint method of a request: the one it sets, else the `footprint`
+    attribute of its parser, else the default.
+    """
+    if request_method:
+        return request_method
+    parser_method = getattr(parser, "footprint", None)
+    if parser_method:
+        if parser_method not in FOOTPRINT_METHODS:
+            raise ValueError(f"Unsupported footprint method: {parser_method}")
+        return parser_method
+    return get_default_footprint_method()
+
+
+def get_footprint_settings() -> str:
+    """
+    Return the settings the valid data footprint depends on, for the raster cache key.
+    """
+    return f"{os.getenv('FOOTPRINT_MAX_SIZE', '1024')}:{os.getenv('FOOTPRINT_SIMPLIFY_TOLERANCE', '1')}"
+
+
+def get_valid_data_footprint(src: DatasetReader) -> Optional[Dict]:
+    """
+    Compute the polygon of the valid pixels of a raster, in EPSG:4326.
+
+    The dataset mask (nodata, alpha band or internal mask) is read from the coarsest
+    overview at least FOOTPRINT_MAX_SIZE (defaults to 1024) pixels wide or high, so the
+    full resolution pixels are not read. It is polygonized, the rings are simplified by
+    FOOTPRINT_SIMPLIFY_TOLERANCE (defaults to 1) pixels of that overview, and the result
+    is reprojected with a single transformation.
+
+    Args:
+        src (DatasetReader): The open raster.
+
+    Returns:
+        dict: The footprint as a GeoJSON Polygon or MultiPolygon, or None when every pixel
+        is valid, the raster has no CRS or no valid pixel, in which case the bounds
+        are the footprint.
+    """
+    if src.crs is None:
+        return None
+    if all(MaskFlags.all_valid in flags for flags in src.mask_flag_enums):
+        return None
+
+    height, width = get_overview_read_shape(src, int(os.getenv("FOOTPRINT_MAX_SIZE", "1024")))
+    tolerance = float(os.getenv("FOOTPRINT_SIMPLIFY_TOLERANCE", "1"))
+    mask = (src.dataset_mask(out_shape=(height, width)) > 0).astype("uint8")
+    if not mask.any():
+        logger.warning(f"{src.name} has no valid pixel, using its bounds as footprint")
+        return None
+    if mask.all():
+        return None
+
+    transform = src.transform * Affine.scale(src.width / width, src.height / height)
+    geometry = _polygonize(mask, transform, tolerance)
+    if geometry is None:
+        return None
+    if src.crs == EPSG_4326:
+        return geometry
+    return transform_geom(src.crs, EPSG_4326, geometry)
+
+
+def union_footprints(geometries: List[Dict], bboxes: List[List[float]]) -> Tuple[Dict, List[float]]:
+    """
+    Return the union of the footprints of the assets of an item, and of their bboxes.
+
+    Identical footprints, e.g. of bands stored one per file, are merged without any
+    computation. Different footprints are rasterized on a grid of FOOTPRINT_MAX_SIZE
+    (defaults to 1024) cells over their union bbox, every cell they touch is kept, and
+    the cells are polygonized and simplified like the valid data footprint, so the union
+    geometry is accurate to about a cell.
+
+    Args:
+        geometries (list): The GeoJSON Polygon or MultiPolygon footprints, in EPSG:4326.
+        bboxes (list): The [west, south, east, north] bbox of each footprint.
+
+    Returns:
+        tuple: The union geometry and bbox.
+    """
+    bbox = [
+        min(bbox[0] for bbox in bboxes),
+        min(bbox[1] for bbox in bboxes),
+        max(bbox[2] for bbox in bboxes),
+        max(bbox[3] for bbox in bboxes),
+    ]
+    distinct = []
+    for geometry in geometries:
+        if geometry not in distinct:
+            distinct.append(geometry)
+    if len(distinct) == 1:
+        return distinct[0], bbox
+
+    west, south, east, north = bbox
+    max_size = int(os.getenv("FOOTPRINT_MAX_SIZE", "1024"))
+    cell = max(east - west, north - south) / max_size
+    if cell == 0:
+        return distinct[0], bbox
+    width, height = max(1, math.ceil((east - west) / cell)), max(1, math.ceil((north - south) / cell))
+    transform = from_origin(west, north, cell, cell)
+    mask = rasterize(distinct, out_shape=(height, width), transform=transform, all_touched=True, dtype="uint8")
+    geometry = _polygonize(mask, transform, float(os.getenv("FOOTPRINT_SIMPLIFY_TOLERANCE", "1")))
+    if geometry is None:
+        geometry = {
+            "type": "Polygon",
+            "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]],
+        }
+    return geometry, bbox
+
+
+def get_geometry_bbox(geometry: Dict) -> List[float]:
+    """
+    Return the [west, south, east, north] bounds of a Polygon or MultiPolygon.
+    """
+    polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+    points = numpy.array([point for polygon in polygons for point in polygon[0]], dtype="float64")
+    return [*points.min(axis=0).tolist(), *points.max(axis=0).tolist()]
+
+
+def _polygonize(mask: numpy.ndarray, transform: Affine, tolerance: float) -> Optional[Dict]:
+    """
+    Return the polygons of the non zero cells of a mask, simplified by `tolerance` cells.
+
+    Returns:
+        dict: A GeoJSON Polygon or MultiPolygon in the coordinates of the transform, or
+        None if no polygon is left.
+    """
+    # Polygonized in pixel coordinates, so the tolerance is in pixels whatever the CRS
+    polygons = []
+    for geometry, _ in shapes(mask, mask=mask > 0, connectivity=8):
+        rings = [_simplify_ring(numpy.asarray(ring, dtype="float64"), tolerance) for ring in geometry["coordinates"]]
+        if rings[0] is None:
+            continue
+        polygons.append([_transform_ring(ring, transform) for ring in rings if ring is not None])
+    if not polygons:
+        return None
+    if len(polygons) == 1:
+        return {"type": "Polygon", "coordinates": polygons[0]}
+    return {"type": "MultiPolygon", "coordinates": polygons}
+
+
+def _transform_ring(ring: numpy.ndarray, transform: Affine) -> List[List[float]]:
+    """
+    Apply an affine transformation to the (column, row) points of a ring.
+    """
+    x = transform.a * ring[:, 0] + transform.b * ring[:, 1] + transform.c
+    y = transform.d * ring[:, 0] + transform.e * ring[:, 1] + transform.f
+    return numpy.column_stack((x, y)).tolist()
+
+
+def _simplify_ring(ring: numpy.ndarray, tolerance: float) -> Optional[numpy.ndarray]:
+    """
+    Simplify a closed ring with the Douglas-Peucker algorithm.
+
+    Returns:
+        ndarray: The simplified ring, or None if it collapsed to less than a triangle.
+    """
+    if tolerance <= 0:
+        return ring
+    # The ring is split at its farthest point from the start, which is kept in both halves
+    points = ring[:-1]
+    farthest = int(numpy.argmax(numpy.hypot(*(points - points[0]).T)))
+    if farthest == 0:
+        return None
+    keep = numpy.zeros(len(ring), dtype=bool)
+    keep[[0, farthest, len(ring) - 1]] = True
+    _douglas_peucker(ring, 0, farthest, tolerance, keep)
+    _douglas_peucker(ring, farthest, len(ring) - 1, tolerance, keep)
+    simplified = ring[keep]
+    return simplified if len(simplified) >= 4 else None
+
+
+def _douglas_peucker(points: numpy.ndarray, first: int, last: int, tolerance: float, keep: numpy.ndarray):
+    """
+    Mark the points between first and last that are kept by the Douglas-Peucker algorithm.
+    """
+    stack = [(first, last)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        between = points[first + 1:last]
+        segment = end - start
+        length = numpy.hypot(*segment)
+        if length == 0:
+            distances = numpy.hypot(*(between - start).T)
+        else:
+            # The distance of each point to the line through start and end
+            distances = numpy.abs(segment[0] * (between[:, 1] - start[1]) - segment[1] * (between[:, 0] - start[0])) / length
+        index = int(numpy.argmax(distances))
+        if distances[index] > tolerance:
+            middle = first + 1 + index
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
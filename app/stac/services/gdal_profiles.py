@@ -0,0 +1,217 @@
+import contextlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, FrozenSet, Iterator, Optional
+from urllib.parse import urlparse
+
+import rasterio
+
+logger = logging.getLogger(__name__)
+
+# Options for reading COGs over the network: no directory listings or sidecar probes,
+# a block cache, and as few range requests as possible
+REMOTE_READ_PROFILE = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.tiff,.TIF,.TIFF",
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": "26214400",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_INGESTED_BYTES_AT_OPEN": "32768",
+}
+
+# Profiles by URL scheme, local files keep the GDAL defaults
+DEFAULT_PROFILES = {
+    "http": REMOTE_READ_PROFILE,
+    "https": REMOTE_READ_PROFILE,
+    "s3": REMOTE_READ_PROFILE,
+    "gs": REMOTE_READ_PROFILE,
+    "az": REMOTE_READ_PROFILE,
+}
+
+# The option of a host profile reading its files through the block cache, not passed to GDAL
+BLOCK_CACHE_OPTION = "BLOCK_CACHE"
+
+# GDAL debug messages logged by rasterio for each HTTP request
+_DOWNLOAD_MESSAGE = re.compile(r"VSICURL: Downloading (\d+)-(\d+) \((.+?)\)")
+_FILE_SIZE_MESSAGE = re.compile(r"VSICURL: GetFileSize\((.+?)\)")
+
+
+def get_gdal_profiles() -> Dict[str, Dict[str, str]]:
+    """
+    Return the GDAL options by URL scheme or host.
+
+    `GDAL_READ_PROFILES` can hold a JSON object mapping schemes (e.g. "https") or hosts
+    (e.g. "account.blob.core.windows.net") to GDAL options, which are merged over the
+    defaults of that scheme.
+    """
+    profiles = {scheme: dict(options) for scheme, options in DEFAULT_PROFILES.items()}
+    overrides = os.getenv("GDAL_READ_PROFILES")
+    if overrides:
+        try:
+            overrides = json.loads(overrides)
+        except ValueError as e:
+            raise ValueError(f"GDAL_READ_PROFILES is not valid JSON: {e}")
+        for key, options in overrides.items():
+            profiles.setdefault(key, {}).update(
+                {name: str(value) for name, value in options.items()}
+            )
+    return profiles
+
+
+def get_gdal_options(filepath: str) -> Dict[str, str]:
+    """
+    Return the GDAL options to open a file with, from the profile of its scheme
+    updated with the profile of its host.
+    """
+    parsed = urlparse(filepath)
+    profiles = get_gdal_profiles()
+    options = dict(profiles.get(parsed.scheme, {}))
+    if parsed.hostname:
+        options.update(profiles.get(parsed.hostname, {}))
+    options.pop(BLOCK_CACHE_OPTION, None)
+    return options
+
+
+def get_block_cache_hosts() -> FrozenSet[str]:
+    """
+    Return the hosts whose files are read through the block cache, those whose profile
+    sets BLOCK_CACHE to "YES".
+    """
+    return frozenset(
+        key for key, options in get_gdal_profiles().items()
+        if str(options.get(BLOCK_CACHE_OPTION, "")).upper() in ("YES", "TRUE", "ON")
+    )
+
+
+class ReadStats:
+    """
+    The HTTP requests made by GDAL to read a file.
+
+    Attributes:
+        requests (int): The number of requests, including the HEAD request of the file size.
+        bytes (int): The number of bytes requested with range requests.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"requests": self.requests, "bytes": self.bytes}
+
+
+class _ReadStatsHandler(logging.Handler):
+    """
+    Counts the requests of files being read from the GDAL debug messages logged by rasterio.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        # The stats of the files being read, with the number of reads of each
+        self.stats: Dict[str, list] = {}
+        self.stats_lock = threading.Lock()
+        self.parent = logging.getLogger("rasterio")
+        self.forward_level = logging.WARNING
+
+    def emit(self, record):
+        # Records that were logged before the logger was switched to debug keep propagating
+        if record.levelno >= self.forward_level:
+            self.parent.handle(record)
+
+        message = record.getMessage()
+        match = _DOWNLOAD_MESSAGE.search(message)
+        if match:
+            url, size = match.group(3), int(match.group(2)) - int(match.group(1)) + 1
+        else:
+            match = _FILE_SIZE_MESSAGE.search(message)
+            if not match:
+                return
+            url, size = match.group(1), 0
+
+        with self.stats_lock:
+            entry = self.stats.get(url.split("?")[0])
+            if entry is not None:
+                stats = entry[0]
+                stats.requests += 1
+                stats.bytes += size
+
+
+_stats_handler = _ReadStatsHandler()
+_stats_handler_users = 0
+# The level and propagation of the rasterio._env logger before it was captured
+_stats_handler_restore: Optional[tuple] = None
+_stats_handler_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _capture_gdal_debug() -> Iterator[None]:
+    """
+    Route the GDAL debug messages logged by rasterio to the read stats handler while
+    files are counted.
+
+    The rasterio._env logger is switched to debug by the first reader only, and its level
+    and propagation are restored by the last one. The messages of other levels are
+    forwarded to the rasterio logger, as they were before. CPL_DEBUG is set in the GDAL
+    options of the counted reads, which are thread local, so that other reads do not log
+    debug messages.
+    """
+    global _stats_handler_users, _stats_handler_restore
+    gdal_logger = logging.getLogger("rasterio._env")
+    with _stats_handler_lock:
+        if _stats_handler_users == 0:
+            _stats_handler_restore = (gdal_logger.level, gdal_logger.propagate)
+            _stats_handler.forward_level = gdal_logger.getEffectiveLevel()
+            gdal_logger.addHandler(_stats_handler)
+            gdal_logger.setLevel(logging.DEBUG)
+            gdal_logger.propagate = False
+        _stats_handler_users += 1
+    try:
+        yield
+    finally:
+        with _stats_handler_lock:
+            _stats_handler_users -= 1
+            if _stats_handler_users == 0:
+                gdal_logger.removeHandler(_stats_handler)
+                level, propagate = _stats_handler_restore
+                gdal_logger.setLevel(level)
+                gdal_logger.propagate = propagate
+                _stats_handler_restore = None
+
+
+@contextlib.contextmanager
+def gdal_env(filepath: str) -> Iterator[Optional[ReadStats]]:
+    """
+    Apply the GDAL read profile of a file while it is opened and read.
+
+    When `GDAL_READ_STATS` is "true", GDAL debug messages are enabled for the reads of
+    the file, and the requests made for it are counted in the yielded ReadStats, which
+    is None otherwise. Concurrent reads of the same file share their counts.
+    """
+    options = get_gdal_options(filepath)
+    if os.getenv("GDAL_READ_STATS", "false").lower() != "true":
+        with rasterio.Env(**options):
+            yield None
+        return
+
+    from .block_cache import get_cached_url
+
+    # GDAL reads files cached by the block cache from its proxy
+    href = get_cached_url(filepath).split("?")[0]
+    with _stats_handler.stats_lock:
+        entry = _stats_handler.stats.setdefault(href, [ReadStats(), 0])
+        entry[1] += 1
+        stats = entry[0]
+
+    try:
+        with _capture_gdal_debug(), rasterio.Env(CPL_DEBUG=True, **options):
+            yield stats
+    finally:
+        with _stats_handler.stats_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _stats_handler.stats[href]
+        logger.info(f"Read {href} with {stats.requests} requests for {stats.bytes} bytes")
@@ -0,0 +1,486 @@
+import datetime
+import json
+import logging
+import os
+import struct
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pystac.utils import datetime_to_str, str_to_datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# Properties stored as timestamps rather than strings
+DATETIME_PROPERTIES = ("datetime", "start_datetime", "end_datetime", "created", "updated")
+
+_WKB_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+# The nesting depth of the coordinates of each geometry type
+_COORDINATE_DEPTHS = {
+    "Point": 0,
+    "LineString": 1,
+    "Polygon": 2,
+    "MultiPoint": 1,
+    "MultiLineString": 2,
+    "MultiPolygon": 3,
+}
+
+_WKB_NAMES = {number: name for name, number in _WKB_TYPES.items()}
+
+_GEO_METADATA = {
+    "version": "1.1.0",
+    "primary_column": "geometry",
+    "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}},
+}
+
+# The columns of an item that are not properties
+_ITEM_COLUMNS = ("type", "stac_version", "stac_extensions", "id", "geometry", "bbox", "links", "collection", "assets")
+
+
+def geometry_to_wkb(geometry: Optional[dict]) -> Optional[bytes]:
+    """
+    Encode a GeoJSON geometry as ISO WKB, little endian.
+
+    Args:
+        geometry (dict): The GeoJSON geometry, or None.
+
+    Returns:
+        bytes: The WKB of the geometry, or None.
+    """
+    if geometry is None:
+        return None
+    geometry_type = geometry["type"]
+    if geometry_type not in _WKB_TYPES:
+        raise ValueError(f"Unsupported geometry type {geometry_type}")
+
+    if geometry_type == "GeometryCollection":
+        parts = [geometry_to_wkb(part) for part in geometry["geometries"]]
+        return struct.pack("<BII", 1, _WKB_TYPES[geometry_type], len(parts)) + b"".join(parts)
+
+    coordinates = geometry["coordinates"]
+    position = coordinates
+    for _ in range(_COORDINATE_DEPTHS[geometry_type]):
+        position = position[0] if position else [0, 0]
+    dimensions = 3 if len(position) > 2 else 2
+    # ISO WKB marks 3D geometries by adding 1000 to the type
+    wkb_type = _WKB_TYPES[geometry_type] + (1000 if dimensions == 3 else 0)
+    point = struct.Struct(f"<{dimensions}d")
+
+    def pack_points(points):
+        return struct.pack("<I", len(points)) + b"".join(point.pack(*p[:dimensions]) for p in points)
+
+    def pack_polygon(rings):
+        return struct.pack("<I", len(rings)) + b"".join(pack_points(ring) for ring in rings)
+
+    header = struct.pack("<BI", 1, wkb_type)
+    if geometry_type == "Point":
+        return header + point.pack(*coordinates[:dimensions])
+    if geometry_type == "LineString":
+        return header + pack_points(coordinates)
+    if geometry_type == "Polygon":
+        return header + pack_polygon(coordinates)
+
+    # Multi geometries hold complete WKB geometries, each with its own header
+    part_header = struct.pack("<BI", 1, wkb_type - 3)
+    if geometry_type == "MultiPoint":
+        parts = [part_header + point.pack(*p[:dimensions]) for p in coordinates]
+    elif geometry_type == "MultiLineString":
+        parts = [part_header + pack_points(line) for line in coordinates]
+    else:
+        parts = [part_header + pack_polygon(polygon) for polygon in coordinates]
+    return header + struct.pack("<I", len(parts)) + b"".join(parts)
+
+
+def wkb_to_geometry(wkb: Optional[bytes]) -> Optional[dict]:
+    """
+    Decode ISO WKB into a GeoJSON geometry, the reverse of geometry_to_wkb.
+
+    Args:
+        wkb (bytes): The WKB of the geometry, or None.
+
+    Returns:
+        dict: The GeoJSON geometry, or None.
+    """
+    if wkb is None:
+        return None
+    geometry, _ = _read_wkb(wkb, 0)
+    return geometry
+
+
+def _read_wkb(wkb: bytes, offset: int) -> Tuple[dict, int]:
+    endian = "<" if wkb[offset] == 1 else ">"
+    wkb_type = struct.unpack_from(f"{endian}I", wkb, offset + 1)[0]
+    offset += 5
+    dimensions = 3 if wkb_type >= 1000 else 2
+    geometry_type = _WKB_NAMES[wkb_type % 1000]
+    point = struct.Struct(f"{endian}{dimensions}d")
+
+    def read_count():
+        nonlocal offset
+        count = struct.unpack_from(f"{endian}I", wkb, offset)[0]
+        offset += 4
+        return count
+
+    def read_points():
+        nonlocal offset
+        points = []
+        for _ in range(read_count()):
+            points.append(list(point.unpack_from(wkb, offset)))
+            offset += point.size
+        return points
+
+    if geometry_type == "Point":
+        coordinates = list(point.unpack_from(wkb, offset))
+        offset += point.size
+    elif geometry_type == "LineString":
+        coordinates = read_points()
+    elif geometry_type == "Polygon":
+        coordinates = [read_points() for _ in range(read_count())]
+    else:
+        parts = []
+        for _ in range(read_count()):
+            part, offset = _read_wkb(wkb, offset)
+            parts.append(part)
+        if geometry_type == "GeometryCollection":
+            return {"type": geometry_type, "geometries": parts}, offset
+        coordinates = [part["coordinates"] for part in parts]
+    return {"type": geometry_type, "coordinates": coordinates}, offset
+
+
+def _flatten(prefix: str, value: Any, row: Dict[str, Any]):
+    """
+    Add a value to a row, with the keys of nested dictionaries joined with dots.
+    """
+    if isinstance(value, dict):
+        for key, nested in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, nested, row)
+    else:
+        row[prefix] = value
+
+
+def flatten_asset(key: str, asset: dict) -> Dict[str, Any]:
+    """
+    Convert an asset to a struct of the `assets` column.
+
+    The asset key is a field of the struct, since the keys of generated items are their
+    file names and would make a column each. Nested dictionaries are flattened to fields
+    joined with dots, and so are the fields of each raster band.
+    """
+    flat = {"key": key}
+    for name, value in asset.items():
+        if name == "raster:bands" and isinstance(value, list):
+            bands = []
+            for band in value:
+                flat_band = {}
+                _flatten("", band, flat_band)
+                bands.append(flat_band)
+            flat[name] = bands
+        else:
+            _flatten(name, value, flat)
+    return flat
+
+
+def _unflatten(flat: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Nest the fields of a flat dictionary whose keys are joined with dots, dropping the
+    null fields that other rows of the table added.
+    """
+    nested: Dict[str, Any] = {}
+    for name, value in flat.items():
+        if value is None:
+            continue
+        *parents, key = name.split(".")
+        target = nested
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = value
+    return nested
+
+
+def _drop_nulls(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _drop_nulls(nested) for key, nested in value.items() if nested is not None}
+    if isinstance(value, list):
+        return [_drop_nulls(nested) for nested in value]
+    return value
+
+
+def unflatten_asset(flat: Dict[str, Any]) -> Tuple[str, dict]:
+    """
+    Convert a struct of the `assets` column back to its asset key and asset.
+    """
+    flat = dict(flat)
+    key = flat.pop("key")
+    bands = flat.pop("raster:bands", None)
+    asset = _unflatten(flat)
+    if bands is not None:
+        asset["raster:bands"] = [_unflatten(band) for band in bands]
+    return key, asset
+
+
+def flatten_item(item: dict) -> Dict[str, Any]:
+    """
+    Convert a STAC item to a row of the GeoParquet dataset.
+
+    The geometry is encoded as WKB, the bbox as a struct and the links as a JSON string.
+    Properties become top-level columns, with datetimes as timestamps. Assets are a list
+    of flat structs, see flatten_asset. This is not the stac-geoparquet layout, whose
+    assets are a struct of the asset keys: see unflatten_item for the reverse conversion.
+
+    Args:
+        item (dict): The STAC item.
+
+    Returns:
+        dict: The row, by column name.
+    """
+    row = {
+        "type": item.get("type", "Feature"),
+        "stac_version": item.get("stac_version"),
+        "stac_extensions": item.get("stac_extensions", []),
+        "id": item["id"],
+        "geometry": geometry_to_wkb(item.get("geometry")),
+        "bbox": None,
+        "links": json.dumps(item.get("links", [])),
+        "collection": item.get("collection"),
+        "assets": [flatten_asset(key, asset) for key, asset in item.get("assets", {}).items()],
+    }
+
+    bbox = item.get("bbox")
+    if bbox:
+        names = ("xmin", "ymin", "xmax", "ymax") if len(bbox) == 4 else ("xmin", "ymin", "zmin", "xmax", "ymax", "zmax")
+        row["bbox"] = {name: float(value) for name, value in zip(names, bbox)}
+
+    for name, value in item.get("properties", {}).items():
+        if name in DATETIME_PROPERTIES and isinstance(value, str):
+            value = str_to_datetime(value).astimezone(datetime.timezone.utc)
+        row[name] = value
+    return row
+
+
+def unflatten_item(row: Dict[str, Any]) -> dict:
+    """
+    Convert a row of the GeoParquet dataset back to a STAC item, the reverse of flatten_item.
+
+    Parquet columns can not tell a missing field from a null one: null fields are left
+    out, except for the `datetime` property that STAC requires. The keys of asset fields
+    are split on dots, like flatten_asset joined them.
+
+    Args:
+        row (dict): The row, by column name, as read by pyarrow.
+
+    Returns:
+        dict: The STAC item.
+    """
+    item = {
+        "type": row.get("type") or "Feature",
+        "stac_version": row.get("stac_version"),
+        "stac_extensions": row.get("stac_extensions") or [],
+        "id": row["id"],
+        "geometry": wkb_to_geometry(row.get("geometry")),
+    }
+    bbox = row.get("bbox")
+    if bbox:
+        names = ("xmin", "ymin", "zmin", "xmax", "ymax", "zmax") if bbox.get("zmin") is not None else ("xmin", "ymin", "xmax", "ymax")
+        item["bbox"] = [bbox[name] for name in names]
+
+    properties = {}
+    for name, value in row.items():
+        if name in _ITEM_COLUMNS or (value is None and name != "datetime"):
+            continue
+        if name in DATETIME_PROPERTIES and isinstance(value, datetime.datetime):
+            value = datetime_to_str(value)
+        properties[name] = _drop_nulls(value)
+    item["properties"] = properties
+
+    item["links"] = json.loads(row["links"]) if row.get("links") else []
+    item["assets"] = dict(unflatten_asset(asset) for asset in row.get("assets") or [])
+    if row.get("collection") is not None:
+        item["collection"] = row["collection"]
+    return item
+
+
+def read_items(path: str) -> Iterator[dict]:
+    """
+    Read the STAC items of a GeoParquet dataset written by GeoParquetWriter, part by part
+    and row group by row group.
+
+    Args:
+        path (str): The directory of the dataset, or one of its part files.
+    """
+    if pyarrow is None:
+        raise ImportError(
+            "pyarrow is required to read GeoParquet, install the geoparquet extra "
+            "(poetry install -E geoparquet)"
+        )
+    if os.path.isdir(path):
+        parts = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.startswith("part-") and name.endswith(".parquet")
+        )
+    else:
+        parts = [path]
+    for part in parts:
+        parquet_file = pyarrow.parquet.ParquetFile(part)
+        for index in range(parquet_file.num_row_groups):
+            for row in parquet_file.read_row_group(index).to_pylist():
+                yield unflatten_item(row)
+
+
+class GeoParquetWriter:
+    """
+    Writes STAC items to a GeoParquet dataset as they are produced, one row per item,
+    see flatten_item. read_items reads them back.
+
+    Items are buffered and written as a row group every `row_group_size` items, so
+    memory does not grow with the number of items. The dataset is a directory of part
+    files: the schema of a part is taken from its first row group, and a new part is
+    started when a row group has columns or types the current part can not hold, or
+    once a part reached `part_size` items. Parts are written to a `.tmp` file that is
+    renamed when the part is complete.
+
+    Attributes:
+        path (str): The directory of the dataset.
+        row_group_size (int): The number of items per row group.
+        part_size (int): The maximum number of items per part.
+        on_part (callable): Called with the tokens of the items of each completed part.
+        parts (list): The paths of the completed parts.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        row_group_size: int = 1000,
+        part_size: int = 1000000,
+        on_part: Optional[Callable[[List[Any]], None]] = None,
+    ):
+        if pyarrow is None:
+            raise ImportError(
+                "pyarrow is required to write GeoParquet, install the geoparquet extra "
+                "(poetry install -E geoparquet)"
+            )
+        self.path = path
+        self.row_group_size = row_group_size
+        self.part_size = part_size
+        self.on_part = on_part
+        self.parts: List[str] = []
+        self._rows: List[Dict[str, Any]] = []
+        self._tokens: List[Any] = []
+        self._writer = None
+        self._part_path = None
+        self._part_rows = 0
+        self._part_tokens: List[Any] = []
+        os.makedirs(path, exist_ok=True)
+        # Parts left incomplete by an interrupted run can not be read
+        for name in os.listdir(path):
+            if name.startswith("part-") and name.endswith(".parquet.tmp"):
+                logger.warning(f"Removing the incomplete part {name} of {path}")
+                os.remove(os.path.join(path, name))
+
+    def write(self, item: dict, token: Any = None):
+        """
+        Add an item, writing a row group once enough items are buffered.
+
+        Args:
+            item (dict): The STAC item.
+            token (any): Passed to on_part once the part holding the item is complete.
+        """
+        self._rows.append(flatten_item(item))
+        self._tokens.append(token)
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered items as a row group.
+        """
+        if not self._rows:
+            return
+        rows, tokens = self._rows, self._tokens
+        self._rows, self._tokens = [], []
+        self._write_rows(rows, tokens)
+
+    def _write_rows(self, rows: List[Dict[str, Any]], tokens: List[Any]):
+        # Table.from_pylist only keeps the columns of the first row
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        try:
+            table = pyarrow.Table.from_pydict({name: [row.get(name) for row in rows] for name in names})
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            # The items have different types for a column, split them until each half fits
+            if len(rows) == 1:
+                raise
+            half = len(rows) // 2
+            self._write_rows(rows[:half], tokens[:half])
+            self._write_rows(rows[half:], tokens[half:])
+            return
+
+        if self._writer is not None:
+            conformed = self._conform(table, self._writer.schema)
+            if conformed is None or self._part_rows + len(rows) > self.part_size:
+                self._close_part()
+            else:
+                table = conformed
+        if self._writer is None:
+            self._open_part(table.schema)
+
+        self._writer.write_table(table)
+        self._part_rows += len(rows)
+        self._part_tokens.extend(tokens)
+
+    def close(self):
+        """
+        Write the buffered items and complete the current part.
+        """
+        self.flush()
+        self._close_part()
+
+    @staticmethod
+    def _conform(table, schema):
+        """
+        Return the table with the columns and types of a part schema, or None if it can not fit.
+        """
+        if any(name not in schema.names for name in table.column_names):
+            return None
+        columns = []
+        for field in schema:
+            if field.name in table.column_names:
+                column = table.column(field.name)
+            else:
+                column = pyarrow.nulls(len(table), type=field.type)
+            try:
+                columns.append(column.cast(field.type))
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError, pyarrow.ArrowTypeError):
+                return None
+        return pyarrow.Table.from_arrays(columns, schema=schema)
+
+    def _open_part(self, schema):
+        metadata = dict(schema.metadata or {})
+        metadata[b"geo"] = json.dumps(_GEO_METADATA).encode()
+        self._part_path = os.path.join(self.path, f"part-{uuid.uuid4().hex}.parquet")
+        self._writer = pyarrow.parquet.ParquetWriter(
+            self._part_path + ".tmp", schema.with_metadata(metadata), compression="zstd"
+        )
+
+    def _close_part(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        os.replace(self._part_path + ".tmp", self._part_path)
+        self.parts.append(self._part_path)
+        logger.info(f"Wrote {self._part_rows} items to {self._part_path}")
+        tokens = self._part_tokens
+        self._writer, self._part_path, self._part_rows, self._part_tokens = None, None, 0, []
+        if self.on_part is not None:
+            self.on_part(tokens)
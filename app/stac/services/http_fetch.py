@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# One session per process, requests sessions are safe to share between threads for GETs
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Documents fetched recently, by URL, as (expiry, content) tuples
+_cache: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+# Fetches in progress, by URL, so that concurrent fetches of a document share one request
+_in_flight: Dict[str, Future] = {}
+_cache_lock = threading.Lock()
+_stats = {"requests": 0, "hits": 0, "coalesced": 0}
+
+
+def get_fetch_timeout() -> float:
+    """
+    Return the timeout in seconds for fetching documents and file headers.
+
+    Reads `HTTP_FETCH_TIMEOUT`, defaults to 30 seconds.
+    """
+    return float(os.getenv("HTTP_FETCH_TIMEOUT", "30"))
+
+
+def get_http_session() -> requests.Session:
+    """
+    Return the pooled HTTP session of the process, creating it on first use.
+
+    The pool size is read from `HTTP_FETCH_MAX_CONNECTIONS`, defaults to 20.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            max_connections = int(os.getenv("HTTP_FETCH_MAX_CONNECTIONS", "20"))
+            adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def close_http_session():
+    """
+    Close the HTTP session and drop the cached documents.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+    with _cache_lock:
+        _cache.clear()
+
+
+def fetch_bytes(url: str) -> bytes:
+    """
+    Fetch a document over HTTP(S) through the shared session.
+
+    Successful responses are kept for HTTP_FETCH_CACHE_TTL seconds (defaults to 60, 0
+    disables the cache), up to HTTP_FETCH_CACHE_SIZE documents (defaults to 128).
+    Concurrent fetches of the same URL wait for a single request.
+
+    Args:
+        url (str): The URL of the document.
+
+    Returns:
+        bytes: The content of the document.
+
+    Raises:
+        requests.RequestException: If the request failed or returned an error status.
+    """
+    ttl = float(os.getenv("HTTP_FETCH_CACHE_TTL", "60"))
+    with _cache_lock:
+        cached = _cache.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            _cache.move_to_end(url)
+            _stats["hits"] += 1
+            return cached[1]
+
+        future = _in_flight.get(url)
+        waiting = future is not None
+        if waiting:
+            _stats["coalesced"] += 1
+        else:
+            future = Future()
+            _in_flight[url] = future
+            _stats["requests"] += 1
+    if waiting:
+        return future.result()
+
+    try:
+        logger.info(f"Fetching {url.split('?')[0]}")
+        response = get_http_session().get(url, timeout=get_fetch_timeout())
+        response.raise_for_status()
+        content = response.content
+    except Exception as e:
+        with _cache_lock:
+            del _in_flight[url]
+        future.set_exception(e)
+        raise
+
+    with _cache_lock:
+        del _in_flight[url]
+        if ttl > 0:
+            _cache[url] = (time.monotonic() + ttl, content)
+            _cache.move_to_end(url)
+            while len(_cache) > int(os.getenv("HTTP_FETCH_CACHE_SIZE", "128")):
+                _cache.popitem(last=False)
+    future.set_result(content)
+    return content
+
+
+def fetch_json(url: str) -> Any:
+    """
+    Fetch and parse a JSON document, see fetch_bytes.
+    """
+    return orjson.loads(fetch_bytes(url))
+
+
+def probe_remote_file(
+    url: str, session: Optional[requests.Session] = None
+) -> Tuple[Optional[int], CaseInsensitiveDict]:
+    """
+    Return the size and the response headers of a remote file, without downloading it.
+
+    The first byte of the file is requested, instead of sending a HEAD request that the
+    presigned URLs of S3 and Azure, which are only signed for GET, reject. The size is
+    read from the Content-Range header, or from the Content-Length header when the server
+    ignores the range, in which case the body is not read.
+
+    Args:
+        url (str): The URL of the file.
+        session (requests.Session, optional): Defaults to the shared session.
+
+    Returns:
+        tuple: The size of the file (None if the server does not tell it) and the headers.
+
+    Raises:
+        requests.RequestException: If the request failed or returned an error status.
+    """
+    session = session or get_http_session()
+    with session.get(
+        url, headers={"Range": "bytes=0-0"}, allow_redirects=True, stream=True, timeout=get_fetch_timeout()
+    ) as response:
+        response.raise_for_status()
+        if response.status_code == 206:
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            size = int(total) if total.isdigit() else None
+        else:
+            length = response.headers.get("Content-Length")
+            size = int(length) if length is not None and length.isdigit() else None
+        return size, response.headers
+
+
+def get_fetch_stats() -> Dict[str, int]:
+    """
+    Return the number of requests made, cache hits and fetches that waited for another one.
+    """
+    with _cache_lock:
+        return dict(_stats)
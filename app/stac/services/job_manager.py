@@ -0,0 +1,280 @@
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .executors import get_generation_max_workers, run_in_generation_executor
+from .job_store import HEARTBEAT_INTERVAL, get_job_store
+from .metrics import STAGE_PUBLISH, get_metric_labels, observe_stage
+from .publisher.publish_queue import publish_queue
+from .publisher.publisher_utility import publish_to_stac_fastapi
+from .stac_item_creator import STACItemCreator
+from ..models import GenerateSTACPayload
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class JobQueueFullError(Exception):
+    """
+    Raised when a job is submitted while the job queue is full.
+    """
+
+
+class JobManager:
+    """
+    Runs item generation jobs in the background on a bounded queue.
+
+    Jobs are processed by a fixed number of worker tasks. Finished jobs are kept for
+    a retention period so that their status and result can be fetched.
+
+    A job runs in the process it was submitted to. Its record is kept in the memory of
+    that process, or in the job store when `JOB_STORE_PATH` is set (see
+    job_store.get_job_store), so that it can be polled from any process sharing it.
+
+    Attributes:
+        concurrency (int): The number of jobs processed at the same time.
+        max_queue_size (int): The number of jobs that can wait in the queue.
+        retention_seconds (float): How long finished jobs are kept.
+        max_retained_jobs (int): The maximum number of jobs kept, oldest are dropped first.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        max_queue_size: Optional[int] = None,
+        retention_seconds: Optional[float] = None,
+        max_retained_jobs: Optional[int] = None,
+    ):
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self.retention_seconds = retention_seconds
+        self.max_retained_jobs = max_retained_jobs
+        # The jobs of this process, only until they finish when the job store is enabled
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._finished_at: Dict[str, float] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Identifies this process in the job store, set when it starts after a fork
+        self._owner: Optional[str] = None
+
+    async def start(self):
+        """
+        Start the worker tasks, this must be called from the running event loop.
+
+        Settings that were not given to the constructor are read from the environment:
+        JOB_CONCURRENCY, JOB_QUEUE_MAX_SIZE, JOB_RETENTION_SECONDS and JOB_MAX_RETAINED.
+        """
+        if self._workers:
+            return
+        self.concurrency = self.concurrency or int(
+            os.getenv("JOB_CONCURRENCY") or get_generation_max_workers()
+        )
+        self.max_queue_size = self.max_queue_size or int(os.getenv("JOB_QUEUE_MAX_SIZE", "1000"))
+        self.retention_seconds = self.retention_seconds or float(
+            os.getenv("JOB_RETENTION_SECONDS", "3600")
+        )
+        self.max_retained_jobs = self.max_retained_jobs or int(
+            os.getenv("JOB_MAX_RETAINED", "10000")
+        )
+        logger.info(
+            f"Starting {self.concurrency} job workers with a queue of {self.max_queue_size}"
+        )
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._owner = uuid.uuid4().hex
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        if get_job_store() is not None:
+            self._workers.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        """
+        Cancel the worker tasks. Jobs still queued are marked as failed.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        for job in list(self._jobs.values()):
+            if job["status"] in (JOB_QUEUED, JOB_RUNNING):
+                await self._finish(job, JOB_FAILED, detail="The service was stopped")
+
+    async def submit(self, payload: GenerateSTACPayload) -> Dict[str, Any]:
+        """
+        Queue a payload for generation and return the job right away.
+
+        Raises:
+            JobQueueFullError: If the queue is full.
+        """
+        if self._queue is None:
+            raise RuntimeError("The job manager has not been started.")
+        if self._queue.full():
+            raise self._queue_full_error()
+
+        await self._purge()
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": JOB_QUEUED,
+            "submitted_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "detail": None,
+        }
+        # Recorded before it is queued, so that a worker does not update it first
+        self._jobs[job["id"]] = job
+        await self._save(job)
+        try:
+            self._queue.put_nowait((job["id"], payload))
+        except asyncio.QueueFull:
+            self._jobs.pop(job["id"], None)
+            store = get_job_store()
+            if store is not None:
+                await _run_in_thread(store.delete, job["id"])
+            raise self._queue_full_error()
+        return dict(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the job with the given ID, or None if it is unknown or expired.
+        """
+        await self._purge()
+        store = get_job_store()
+        if store is not None:
+            return await _run_in_thread(store.get, job_id)
+        return self._jobs.get(job_id)
+
+    def queue_size(self) -> int:
+        """
+        Return the number of jobs waiting in the queue.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            job_id, payload = await self._queue.get()
+            try:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job["status"] = JOB_RUNNING
+                job["started_at"] = _now()
+                await self._save(job)
+                try:
+                    result = await generate_and_publish(payload)
+                except Exception as e:
+                    logger.exception(e)
+                    await self._finish(job, JOB_FAILED, detail=str(e))
+                else:
+                    await self._finish(job, JOB_SUCCEEDED, result=result)
+            finally:
+                self._queue.task_done()
+
+    async def _heartbeat(self):
+        store = get_job_store()
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await _run_in_thread(store.beat, self._owner)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not mark the jobs of this process as alive: {e}")
+
+    async def _finish(self, job: Dict[str, Any], status: str, result=None, detail=None):
+        job["status"] = status
+        job["finished_at"] = _now()
+        job["result"] = result
+        job["detail"] = detail
+        store = get_job_store()
+        if store is not None:
+            await _run_in_thread(store.put, job, self._owner, time.time())
+            self._jobs.pop(job["id"], None)
+        else:
+            self._finished_at[job["id"]] = time.monotonic()
+
+    async def _save(self, job: Dict[str, Any]):
+        store = get_job_store()
+        if store is not None:
+            await _run_in_thread(store.put, dict(job), self._owner)
+
+    async def _purge(self):
+        """
+        Drop finished jobs past their retention period, and the oldest finished jobs
+        when more than max_retained_jobs are kept.
+        """
+        store = get_job_store()
+        if store is not None:
+            await _run_in_thread(store.purge, self.retention_seconds, self.max_retained_jobs)
+            return
+
+        expiry = time.monotonic() - self.retention_seconds
+        # Jobs are recorded in the order they finished, the oldest come first
+        while self._finished_at:
+            job_id, finished_at = next(iter(self._finished_at.items()))
+            if finished_at >= expiry:
+                break
+            self._drop(job_id)
+
+        excess = len(self._jobs) - self.max_retained_jobs
+        if excess > 0:
+            for job_id in list(self._finished_at)[:excess]:
+                self._drop(job_id)
+
+    def _drop(self, job_id: str):
+        self._finished_at.pop(job_id, None)
+        self._jobs.pop(job_id, None)
+
+    def _queue_full_error(self) -> JobQueueFullError:
+        return JobQueueFullError(
+            f"The job queue is full ({self.max_queue_size} jobs), retry later."
+        )
+
+
+async def generate_and_publish(payload: GenerateSTACPayload):
+    """
+    Generate the STAC item of a payload on the generation executor, and publish it if
+    configured to do so.
+
+    When the publish queue is enabled (PUBLISH_QUEUE_PATH), the item is queued and
+    published in the background instead.
+
+    Returns:
+        The STAC item, or its URL once published or queued.
+
+    Raises:
+        PublishQueueFullError: If the publish queue stayed full.
+    """
+    stac = await run_in_generation_executor(
+        lambda: STACItemCreator(payload.dict()).create_item()
+    )
+
+    if os.getenv("HTTP_PUBLISH_TO_STAC_API", "false").lower() == "true":
+        collection = payload.collection or payload.parser or "default"
+        if publish_queue.enabled:
+            return await publish_queue.enqueue(stac, collection, payload.parser)
+        with observe_stage(STAGE_PUBLISH, get_metric_labels(payload.parser, collection)):
+            return await publish_to_stac_fastapi(stac, collection)
+
+    return stac
+
+
+async def _run_in_thread(function, *args):
+    # SQLite calls wait for the locks of other processes, they are kept off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+job_manager = JobManager()
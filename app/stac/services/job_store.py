@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+
+from .sqlite_store import SQLiteStore, get_shared_store
+
+# The fields of a job record returned by the jobs routes
+JOB_FIELDS = ("id", "status", "submitted_at", "started_at", "finished_at", "result", "detail")
+
+# How often the process running jobs marks them as alive, see JobStore.beat
+HEARTBEAT_INTERVAL = 10.0
+
+
+class JobStore(SQLiteStore):
+    """
+    The records of the jobs submitted to `/stac/jobs`, stored in a SQLite database, so
+    that a job can be polled from any of the worker processes sharing the database.
+
+    A job runs in the process it was submitted to, its owner, which marks its unfinished
+    jobs as alive every HEARTBEAT_INTERVAL seconds: a job whose owner stopped doing so,
+    e.g. because it died, is reported as failed.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+    """
+
+    def _create(self, connection: sqlite3.Connection):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, submitted_at TEXT NOT NULL, "
+            "started_at TEXT, finished_at TEXT, result BLOB, detail TEXT, "
+            "owner TEXT NOT NULL, heartbeat REAL NOT NULL, finished REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+
+    def put(self, job: Dict[str, Any], owner: str, finished: Optional[float] = None):
+        """
+        Insert or update a job record.
+
+        Args:
+            job (dict): The job, with the JOB_FIELDS.
+            owner (str): The identifier of the process running the job.
+            finished (float): When the job finished, as a time.time() timestamp.
+        """
+        result = orjson.dumps(job["result"], option=orjson.OPT_SERIALIZE_NUMPY) if job["result"] is not None else None
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(id, status, submitted_at, started_at, finished_at, result, detail, owner, heartbeat, finished) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job["id"], job["status"], job["submitted_at"], job["started_at"], job["finished_at"],
+                    result, job["detail"], owner, time.time(), finished,
+                ),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the job with the given ID, or None if it is unknown.
+        """
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_FIELDS)}, heartbeat FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        if job["result"] is not None:
+            job["result"] = orjson.loads(job["result"])
+        if job["finished_at"] is None and row[-1] < time.time() - 3 * HEARTBEAT_INTERVAL:
+            job.update(status="failed", detail="The worker running the job stopped")
+        return job
+
+    def beat(self, owner: str):
+        """
+        Mark the unfinished jobs of a process as alive.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND finished IS NULL", (time.time(), owner)
+            )
+
+    def delete(self, job_id: str):
+        """
+        Remove the record of a job that could not be queued.
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def purge(self, retention_seconds: float, max_retained: int):
+        """
+        Drop finished jobs past their retention period, and the oldest finished jobs when
+        more than max_retained jobs are kept. Jobs whose owner stopped are dropped once
+        their last heartbeat is past the retention period.
+        """
+        expiry = time.time() - retention_seconds
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM jobs WHERE finished < ? OR (finished IS NULL AND heartbeat < ?)", (expiry, expiry)
+            )
+            excess = connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - max_retained
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM jobs WHERE id IN "
+                    "(SELECT id FROM jobs WHERE finished IS NOT NULL ORDER BY finished LIMIT ?)",
+                    (excess,),
+                )
+
+
+def get_job_store() -> Optional[JobStore]:
+    """
+    Return the job store, or None if jobs are kept in the memory of their process.
+
+    The store is enabled by setting `JOB_STORE_PATH` to the path of its SQLite database.
+    """
+    path = os.getenv("JOB_STORE_PATH")
+    if not path:
+        return None
+    return get_shared_store(JobStore, path)
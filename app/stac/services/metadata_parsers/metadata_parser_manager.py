@@ -2,31 +2,76 @@ import importlib.util
 import logging
 logger = logging.getLogger(__name__)
 import os
+import threading
+import time
+
+from .spec_parser import SPEC_EXTENSIONS, load_parser_spec
 
 
 class MetadataParserManager:
+    # Directories holding the parsers, in the order they are searched
+    parser_directories = ["standard", "proprietary"]
+    parsers_root = os.path.dirname(__file__)
+
+    # Loaded parsers by metadata type, as (parser_path, mtime, parser, checked_at) tuples
+    _registry = {}
+    _registry_lock = threading.RLock()
+    _registry_stats = {"hits": 0, "loads": 0, "reloads": 0}
+
     @staticmethod
     def get_parser(metadata_type):
-        # Check for standard parsers
-        standard_parser = MetadataParserManager.load_parser("standard", metadata_type)
-        if standard_parser:
-            return standard_parser
-
-        # Check for proprietary parsers
-        proprietary_parser = MetadataParserManager.load_parser(
-            "proprietary", metadata_type
-        )
-        if proprietary_parser:
-            return proprietary_parser
+        # Serve the parser from the registry unless its file has changed since it was loaded,
+        # which is checked at most once per PARSER_RELOAD_INTERVAL seconds, outside the lock
+        entry = MetadataParserManager._registry.get(metadata_type)
+        if entry is not None:
+            parser_path, mtime, parser, checked_at = entry
+            now = time.monotonic()
+            if now - checked_at < float(os.getenv("PARSER_RELOAD_INTERVAL", "1")):
+                with MetadataParserManager._registry_lock:
+                    MetadataParserManager._registry_stats["hits"] += 1
+                return parser
+
+            if MetadataParserManager._get_mtime(parser_path) == mtime:
+                with MetadataParserManager._registry_lock:
+                    if MetadataParserManager._registry.get(metadata_type) is entry:
+                        MetadataParserManager._registry[metadata_type] = (parser_path, mtime, parser, now)
+                    MetadataParserManager._registry_stats["hits"] += 1
+                return parser
+
+        with MetadataParserManager._registry_lock:
+            # Another thread may have (re)loaded the parser meanwhile
+            current = MetadataParserManager._registry.get(metadata_type)
+            if current is not None and current is not entry:
+                MetadataParserManager._registry_stats["hits"] += 1
+                return current[2]
+            if entry is not None:
+                logger.info(f"Parser file {entry[0]} changed, reloading {metadata_type} parser")
+                del MetadataParserManager._registry[metadata_type]
+                MetadataParserManager._registry_stats["reloads"] += 1
+            else:
+                MetadataParserManager._registry_stats["loads"] += 1
+
+            for directory in MetadataParserManager.parser_directories:
+                parser_path = MetadataParserManager._get_parser_path(directory, metadata_type)
+                # Read before loading, so a change made during the load triggers a reload
+                mtime = MetadataParserManager._get_mtime(parser_path)
+                parser = MetadataParserManager.load_parser(directory, metadata_type)
+                if parser:
+                    MetadataParserManager._registry[metadata_type] = (
+                        parser_path, mtime, parser, time.monotonic()
+                    )
+                    return parser
 
         raise ValueError(f"Unsupported metadata type: {metadata_type}")
 
     @staticmethod
     def load_parser(directory, metadata_type):
         # Construct the path to the parser
-        parser_path = os.path.join(
-            os.path.dirname(__file__), directory, f"{metadata_type}_parser.py"
-        )
+        parser_path = MetadataParserManager._get_parser_path(directory, metadata_type)
+
+        # Parser specs are compiled once here, every path they declare included
+        if parser_path.endswith(SPEC_EXTENSIONS) and os.path.exists(parser_path):
+            return load_parser_spec(parser_path, metadata_type)
 
         # Check if the parser file exists and load it dynamically
         if os.path.exists(parser_path):
@@ -41,19 +86,81 @@ class MetadataParserManager:
 
         return None
 
+    @staticmethod
+    def load_parsers():
+        """
+        Load every available parser into the registry, so requests do not pay for imports.
+        """
+        available_parsers = MetadataParserManager.list_available_parsers()
+        for directory in MetadataParserManager.parser_directories:
+            for metadata_type in available_parsers[directory]:
+                try:
+                    MetadataParserManager.get_parser(metadata_type)
+                except Exception as e:
+                    logger.exception(f"Failed to load {metadata_type} parser from {directory}: {e}")
+        return available_parsers
+
+    @staticmethod
+    def get_registry_stats():
+        """
+        Return the registry counters: hits, first loads and reloads after a file change.
+        """
+        with MetadataParserManager._registry_lock:
+            stats = dict(MetadataParserManager._registry_stats)
+            stats["parsers"] = sorted(MetadataParserManager._registry)
+        return stats
+
+    @staticmethod
+    def is_available_parser(metadata_type):
+        """
+        Whether a parser of a metadata type is loaded or can be loaded from a parser file.
+        """
+        if metadata_type in MetadataParserManager._registry:
+            return True
+        if not isinstance(metadata_type, str) or not metadata_type.replace("_", "").replace("-", "").isalnum():
+            return False
+        return any(
+            os.path.exists(MetadataParserManager._get_parser_path(directory, metadata_type))
+            for directory in MetadataParserManager.parser_directories
+        )
+
     @staticmethod
     def list_available_parsers():
-        parser_directories = ["standard", "proprietary"]
-        available_parsers = {"standard": [], "proprietary": []}
+        parser_directories = MetadataParserManager.parser_directories
+        available_parsers = {directory: [] for directory in parser_directories}
 
         for directory in parser_directories:
-            directory_path = os.path.join(os.path.dirname(__file__), directory)
+            directory_path = os.path.join(MetadataParserManager.parsers_root, directory)
             if os.path.exists(directory_path):
-                for filename in os.listdir(directory_path):
-                    if filename.endswith("_parser.py"):
-                        parser_name = filename.replace("_parser.py", "")
-                        available_parsers[directory].append(parser_name)
+                for filename in sorted(os.listdir(directory_path)):
+                    for extension in (".py",) + SPEC_EXTENSIONS:
+                        if filename.endswith(f"_parser{extension}"):
+                            parser_name = filename[:-len(f"_parser{extension}")]
+                            if parser_name not in available_parsers[directory]:
+                                available_parsers[directory].append(parser_name)
 
         logger.info(f"Available metadata parsers: {available_parsers}")
 
         return available_parsers
+
+    @staticmethod
+    def _get_parser_path(directory, metadata_type):
+        # A Python parser takes precedence over a parser spec of the same name
+        parser_path = os.path.join(
+            MetadataParserManager.parsers_root, directory, f"{metadata_type}_parser.py"
+        )
+        if not os.path.exists(parser_path):
+            for extension in SPEC_EXTENSIONS:
+                spec_path = os.path.join(
+                    MetadataParserManager.parsers_root, directory, f"{metadata_type}_parser{extension}"
+                )
+                if os.path.exists(spec_path):
+                    return spec_path
+        return parser_path
+
+    @staticmethod
+    def _get_mtime(parser_path):
+        try:
+            return os.stat(parser_path).st_mtime_ns
+        except OSError:
+            return None
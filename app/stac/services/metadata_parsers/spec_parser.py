@@ -0,0 +1,291 @@
+import fnmatch
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+import yaml
+from pystac.utils import datetime_to_str, str_to_datetime
+
+from app.stac.services.http_fetch import fetch_bytes
+
+logger = logging.getLogger(__name__)
+
+FORMAT_XML = "xml"
+FORMAT_JSON = "json"
+
+# The file extensions of parser specs, in the order they are looked up
+SPEC_EXTENSIONS = (".yaml", ".yml", ".json")
+
+# The top level keys of a parser spec
+SPEC_KEYS = {
+    "description", "sidecar", "format", "namespaces", "stac_extensions", "id", "properties",
+    "raster_statistics", "footprint",
+}
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+def _to_datetime(value: Any) -> str:
+    return datetime_to_str(str_to_datetime(str(value)))
+
+
+# The converters a property can declare with its `type`
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "str": str,
+    "float": float,
+    "int": int,
+    "bool": _to_bool,
+    "datetime": _to_datetime,
+}
+
+# XML paths that are not a plain list of child tags, evaluated by ElementTree
+_XPATH_SYNTAX = re.compile(r"[\[\]*().]|//")
+
+# A namespace prefix of an XML path, e.g. ns0: in ns0:product
+_XML_PREFIX = re.compile(r"([A-Za-z_][\w-]*):(?=[A-Za-z_*])")
+
+# A step of a JSON path with a list index, e.g. bands[0]
+_JSON_INDEX = re.compile(r"^(.*?)\[(-?\d+)\]$")
+
+
+class SpecParser:
+    """
+    A metadata parser declared by a YAML or JSON spec instead of Python code.
+
+    The spec names the sidecar file holding the metadata, its format and the STAC
+    properties read from it. Each path is compiled once, when the parser is loaded, into
+    a function doing plain lookups: the child tags of an XML path are resolved to their
+    namespace URIs, and JSON paths are split into keys and list indexes.
+
+    A spec looks like:
+
+        sidecar: "*_metadata.json"    # fnmatch pattern of the name of a payload file,
+                                      # the payload metadata is used when it is not set
+        format: json                  # or xml, with its `namespaces` prefixes
+        stac_extensions:
+          - https://stac-extensions.github.io/view/v1.0.0/schema.json
+        id: properties.id             # optional
+        properties:
+          eo:cloud_cover: {path: properties.cloud_cover, type: float}
+          platform: properties.satellite_id    # a path alone is read as a string
+
+    `raster_statistics` and `footprint` can also be set, like the attributes of a Python
+    parser.
+
+    Attributes:
+        name (str): The name of the parser, used in log messages.
+        sidecar (str): The fnmatch pattern of the metadata file, or None for the payload metadata.
+        format (str): "xml" or "json".
+        stac_extensions (list): The extensions of the parsed item.
+    """
+
+    def __init__(self, spec: Dict[str, Any], name: str = "spec"):
+        unknown = set(spec) - SPEC_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys in the {name} parser spec: {sorted(unknown)}")
+
+        self.name = name
+        self.sidecar = spec.get("sidecar")
+        self.format = spec.get("format", FORMAT_JSON)
+        if self.format not in (FORMAT_XML, FORMAT_JSON):
+            raise ValueError(f"Unsupported format in the {name} parser spec: {self.format}")
+        if self.format == FORMAT_XML and not self.sidecar:
+            raise ValueError(f"The {name} parser spec reads XML, it needs a sidecar file")
+        self.stac_extensions = list(spec.get("stac_extensions", []))
+        for attribute in ("raster_statistics", "footprint"):
+            if spec.get(attribute):
+                setattr(self, attribute, spec[attribute])
+
+        namespaces = spec.get("namespaces", {})
+        self._id = self._compile_field("id", spec["id"], namespaces) if spec.get("id") else None
+        self._properties = [
+            self._compile_field(name, field, namespaces)
+            for name, field in spec.get("properties", {}).items()
+        ]
+
+    def parse(self, payload, **kwargs) -> Dict[str, Any]:
+        """
+        Read the metadata of a payload into a partial STAC item, to be merged into its item.
+        """
+        document = self.load_document(payload)
+        if document is None:
+            return self._new_item()
+        return self.extract(document)
+
+    def load_document(self, payload) -> Optional[Any]:
+        """
+        Return the parsed sidecar file of a payload, or its metadata when the spec has no
+        sidecar, or None if the payload has no sidecar file.
+        """
+        if not self.sidecar:
+            return payload.metadata
+
+        metadata_file = next(
+            (
+                file for file in payload.files
+                if fnmatch.fnmatchcase(file.split("?")[0].rsplit("/", 1)[-1], self.sidecar)
+            ),
+            None,
+        )
+        if not metadata_file:
+            logger.error(f"Metadata file {self.sidecar} not found in the provided payload.")
+            return None
+        logger.info(f"Found metadata file {metadata_file.split('?')[0]} in the provided payload.")
+
+        content = fetch_bytes(metadata_file)
+        return ET.fromstring(content) if self.format == FORMAT_XML else orjson.loads(content)
+
+    def extract(self, document: Any) -> Dict[str, Any]:
+        """
+        Return the partial STAC item read from a parsed metadata document.
+        """
+        item = self._new_item()
+        properties = item["properties"]
+        if self._id is not None:
+            value = self._id[1](document)
+            if value is not None:
+                item["id"] = value
+        for name, extractor in self._properties:
+            value = extractor(document)
+            if value is not None:
+                properties[name] = value
+        return item
+
+    def _new_item(self) -> Dict[str, Any]:
+        return {"type": "Feature", "stac_extensions": list(self.stac_extensions), "properties": {}}
+
+    def _compile_field(self, name: str, field: Any, namespaces: Dict[str, str]) -> Tuple[str, Callable[[Any], Any]]:
+        """
+        Compile the path and converter of a field into a function of a parsed document.
+        """
+        if isinstance(field, str):
+            field = {"path": field}
+        if not isinstance(field, dict) or not field.get("path"):
+            raise ValueError(f"The {name} field of the {self.name} parser spec needs a path")
+        converter_name = field.get("type", "str")
+        converter = CONVERTERS.get(converter_name)
+        if converter is None:
+            raise ValueError(f"Unsupported type {converter_name} of the {name} field of the {self.name} parser spec")
+
+        path = field["path"]
+        if self.format == FORMAT_XML:
+            lookup = _compile_xml_path(path, namespaces)
+        else:
+            lookup = _compile_json_path(path)
+        parser_name = self.name
+
+        def extract(document):
+            value = lookup(document)
+            if value is None:
+                logger.error(f"{path} not found within the {parser_name} metadata.")
+                return None
+            try:
+                return converter(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid {name} value {value!r} in the {parser_name} metadata: {e}")
+
+        return name, extract
+
+
+def _compile_xml_path(path: str, namespaces: Dict[str, str]) -> Callable[[ET.Element], Optional[str]]:
+    """
+    Compile a path relative to the root element into a function returning the text of
+    the element, or its attribute when the last step is `@name`.
+
+    Paths made of child tags are resolved to `{uri}tag` tags once, and looked up one
+    child at a time. Other ElementTree XPath expressions are evaluated by ElementTree,
+    with their prefixes resolved once.
+    """
+
+    def resolve_prefix(prefix: str) -> str:
+        if prefix not in namespaces:
+            raise ValueError(f"Unknown namespace prefix {prefix} in {path}")
+        return f"{{{namespaces[prefix]}}}"
+
+    def resolve(name: str) -> str:
+        if ":" not in name:
+            return name
+        prefix, local = name.split(":", 1)
+        return resolve_prefix(prefix) + local
+
+    steps = path.split("/")
+    attribute = None
+    if steps[-1].startswith("@"):
+        attribute = resolve(steps.pop()[1:])
+
+    element_path = "/".join(steps)
+    if _XPATH_SYNTAX.search(element_path):
+        resolved = _XML_PREFIX.sub(lambda match: resolve_prefix(match.group(1)), element_path)
+
+        def find(root):
+            return root.find(resolved)
+    else:
+        tags = tuple(resolve(step) for step in steps if step)
+
+        def find(root):
+            element = root
+            for tag in tags:
+                element = element.find(tag)
+                if element is None:
+                    return None
+            return element
+
+    def lookup(root):
+        element = find(root)
+        if element is None:
+            return None
+        return element.get(attribute) if attribute is not None else element.text
+
+    return lookup
+
+
+def _compile_json_path(path: str) -> Callable[[Any], Any]:
+    """
+    Compile a dotted path, e.g. `$.properties.bands[0].name`, into a function returning
+    the value it points to.
+    """
+    keys: List[Any] = []
+    for step in path.lstrip("$").lstrip(".").split("."):
+        match = _JSON_INDEX.match(step)
+        if match:
+            if match.group(1):
+                keys.append(match.group(1))
+            keys.append(int(match.group(2)))
+        elif step:
+            keys.append(step)
+    keys = tuple(keys)
+
+    def lookup(document):
+        value = document
+        for key in keys:
+            if isinstance(key, int):
+                if not isinstance(value, list) or not -len(value) <= key < len(value):
+                    return None
+                value = value[key]
+            else:
+                if not isinstance(value, dict):
+                    return None
+                value = value.get(key)
+                if value is None:
+                    return None
+        return value
+
+    return lookup
+
+
+def load_parser_spec(path: str, name: str) -> SpecParser:
+    """
+    Read a YAML or JSON parser spec and compile it.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    spec = orjson.loads(content) if path.endswith(".json") else yaml.safe_load(content)
+    if not isinstance(spec, dict):
+        raise ValueError(f"The parser spec {path} must be a mapping")
+    return SpecParser(spec, name)
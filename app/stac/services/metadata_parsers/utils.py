@@ -28,3 +28,37 @@ def merge_stac_items(primary_item, metadata_item):
     :return: A new STAC item which is the result of merging primary_item and metadata_item.
     """
     return deep_merge_dicts(primary_item, metadata_item)
+
+
+def deep_merge_dicts_in_place(dict1, dict2):
+    """
+    Merge dict2 into dict1 recursively, with dict2 taking precedence over dict1.
+
+    This is deep_merge_dicts without the copies: dict1 and its nested dictionaries are
+    updated in place, and the values of dict2 are not copied.
+
+    :param dict1: The primary dictionary, which is updated.
+    :param dict2: The secondary dictionary which takes precedence over dict1.
+    :return: dict1.
+    """
+    for key, value in dict2.items():
+        current = dict1.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            deep_merge_dicts_in_place(current, value)
+        elif isinstance(value, list) and isinstance(current, list):
+            current.extend(value)
+        else:
+            dict1[key] = value
+
+    return dict1
+
+
+def merge_stac_items_in_place(primary_item, metadata_item):
+    """
+    Merge metadata_item into primary_item in place, with metadata_item taking precedence.
+
+    :param primary_item: The primary STAC item, as a dictionary, which is updated.
+    :param metadata_item: The secondary STAC item which takes precedence over primary_item.
+    :return: primary_item.
+    """
+    return deep_merge_dicts_in_place(primary_item, metadata_item)
@@ -0,0 +1,256 @@
+import contextlib
+import os
+import time
+from typing import Iterator, Optional, Set, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .block_cache import get_block_cache
+from .publisher.publish_spool import get_publish_spool
+
+# The stages of item generation, in the order they happen
+STAGE_VALIDATION = "validation"
+STAGE_METADATA_FETCH = "metadata_fetch"
+STAGE_PARSER_LOAD = "parser_load"
+STAGE_RIO_STAC = "rio_stac"
+STAGE_FOOTPRINT = "footprint"
+STAGE_COG_VALIDATION = "cog_validation"
+STAGE_TAG_READ = "tag_read"
+STAGE_PARSE = "parse"
+STAGE_MERGE = "merge"
+STAGE_PUBLISH = "publish"
+
+# Remote rasters can take minutes to read, the default buckets stop at 10 seconds
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "stac_generator_stage_seconds",
+    "Time spent in each stage of item generation.",
+    ["stage", "parser", "collection"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "stac_generator_stage_errors_total",
+    "Stages of item generation that raised an error.",
+    ["stage", "parser", "collection"],
+)
+COALESCED_REQUESTS = Counter(
+    "stac_generator_generate_requests_total",
+    "Requests to /stac/generate, by whether they ran, waited for an identical request or reused its result.",
+    ["outcome"],
+)
+WARMUP_SECONDS = Gauge(
+    "stac_generator_warmup_seconds",
+    "Duration of the warm-up stages of a process, and its cold start time.",
+    ["stage"],
+    multiprocess_mode="max",
+)
+PUBLISH_QUEUE_ITEMS = Counter(
+    "stac_generator_publish_queue_items_total",
+    "Items of the publish queue that were published, will be retried or were given up on.",
+    ["outcome"],
+)
+
+
+class BlockCacheCollector:
+    """
+    Reports the counters of the block cache, which are shared by every process using it.
+    """
+
+    def collect(self):
+        cache = get_block_cache()
+        if cache is None:
+            return
+        stats = cache.get_stats()
+        for name, stat, documentation in (
+            ("hits", "hits", "Blocks of remote files served from the block cache."),
+            ("misses", "misses", "Blocks of remote files fetched into the block cache."),
+            ("saved_bytes", "bytes_saved", "Bytes of remote files served from the block cache."),
+            ("fetched_bytes", "bytes_fetched", "Bytes of remote files fetched into the block cache."),
+            ("evictions", "evictions", "Blocks evicted from the block cache."),
+        ):
+            yield CounterMetricFamily(f"stac_generator_block_cache_{name}", documentation, value=stats[stat])
+        yield GaugeMetricFamily("stac_generator_block_cache_bytes", "Size of the cached blocks.", value=stats["bytes"])
+
+
+class PublishQueueCollector:
+    """
+    Reports the depth and lag of the publish queue, which is shared by every process using it.
+    """
+
+    def collect(self):
+        spool = get_publish_spool()
+        if spool is None:
+            return
+        stats = spool.get_stats()
+        yield GaugeMetricFamily("stac_generator_publish_queue_depth", "Items waiting to be published.", value=stats["depth"])
+        yield GaugeMetricFamily(
+            "stac_generator_publish_queue_lag_seconds", "Age of the oldest item waiting to be published.",
+            value=stats["lag_seconds"],
+        )
+        yield GaugeMetricFamily(
+            "stac_generator_publish_queue_failed", "Items kept in the publish queue after their last attempt.",
+            value=stats["failed"],
+        )
+
+
+class RasterCacheCollector:
+    """
+    Reports the counters of the raster metadata cache in this process, and its size.
+    """
+
+    def describe(self):
+        # Not collected when registered, the module it reads imports this one
+        return []
+
+    def collect(self):
+        from .raster_cache import get_raster_cache
+
+        cache = get_raster_cache()
+        if cache is None:
+            return
+        stats = cache.get_stats()
+        for name, documentation in (
+            ("hits", "Rasters served from the raster metadata cache."),
+            ("misses", "Rasters inspected because they were not in the raster metadata cache."),
+            ("stores", "Raster inspections stored in the raster metadata cache."),
+            ("evictions", "Entries evicted from the raster metadata cache."),
+        ):
+            yield CounterMetricFamily(f"stac_generator_raster_cache_{name}", documentation, value=stats[name])
+        yield GaugeMetricFamily("stac_generator_raster_cache_entries", "Rasters in the raster metadata cache.", value=stats["entries"])
+        yield GaugeMetricFamily("stac_generator_raster_cache_bytes", "Size of the raster metadata cache.", value=stats["bytes"])
+
+
+class ParserRegistryCollector:
+    """
+    Reports the counters of the parser registry of this process.
+    """
+
+    def describe(self):
+        # Not collected when registered, the module it reads imports this one
+        return []
+
+    def collect(self):
+        from .metadata_parsers.metadata_parser_manager import MetadataParserManager
+
+        stats = MetadataParserManager.get_registry_stats()
+        for name, documentation in (
+            ("hits", "Parsers served from the parser registry."),
+            ("loads", "Parsers loaded into the parser registry."),
+            ("reloads", "Parsers loaded again after their file changed."),
+        ):
+            yield CounterMetricFamily(f"stac_generator_parser_registry_{name}", documentation, value=stats[name])
+        yield GaugeMetricFamily("stac_generator_parser_registry_parsers", "Parsers in the parser registry.", value=len(stats["parsers"]))
+
+
+class HttpFetchCollector:
+    """
+    Reports the counters of the metadata files fetched over HTTP by this process.
+    """
+
+    def describe(self):
+        # Not collected when registered, the module it reads imports this one
+        return []
+
+    def collect(self):
+        from .http_fetch import get_fetch_stats
+
+        stats = get_fetch_stats()
+        for name, documentation in (
+            ("requests", "HTTP requests made to fetch metadata files."),
+            ("hits", "Metadata files served from the fetch cache."),
+            ("coalesced", "Metadata file fetches that waited for an identical fetch in progress."),
+        ):
+            yield CounterMetricFamily(f"stac_generator_http_fetch_{name}", documentation, value=stats[name])
+
+
+# The collectors of the state of the caches and queues, added to the registry of /metrics
+COLLECTORS = (
+    BlockCacheCollector(),
+    PublishQueueCollector(),
+    RasterCacheCollector(),
+    ParserRegistryCollector(),
+    HttpFetchCollector(),
+)
+
+for collector in COLLECTORS:
+    REGISTRY.register(collector)
+
+
+def get_metric_labels(parser: Optional[str], collection: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Return the parser and collection labels of a payload, with the collection defaulting
+    like the generation routes do.
+
+    Both come from requests, so their values are bounded: parsers that are not available
+    are labeled "other", and so are the collections that are not listed in
+    `METRICS_COLLECTIONS` and are not the name of their parser.
+    """
+    from .metadata_parsers.metadata_parser_manager import MetadataParserManager
+
+    if parser is None:
+        parser_label = "none"
+    elif parser == "mixed" or MetadataParserManager.is_available_parser(parser):
+        parser_label = parser
+    else:
+        parser_label = "other"
+
+    collection = collection or parser
+    if collection is None:
+        collection_label = "default"
+    elif collection == parser_label or collection in _get_metric_collections():
+        collection_label = collection
+    else:
+        collection_label = "other"
+    return parser_label, collection_label
+
+
+def _get_metric_collections() -> Set[str]:
+    return {collection.strip() for collection in os.getenv("METRICS_COLLECTIONS", "").split(",") if collection.strip()}
+
+
+@contextlib.contextmanager
+def observe_stage(stage: str, labels: Tuple[str, str]) -> Iterator[None]:
+    """
+    Time a stage of item generation, counting it as an error if it raises.
+
+    Args:
+        stage (str): One of the STAGE_* names.
+        labels (tuple): The parser and collection labels, see get_metric_labels.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage, *labels).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage, *labels).observe(time.perf_counter() - started)
+
+
+def generate_metrics() -> Tuple[bytes, str]:
+    """
+    Return the metrics in the Prometheus text format, with their content type.
+
+    When `PROMETHEUS_MULTIPROC_DIR` is set, the metrics of every process writing to
+    that directory (e.g. the batch workers) are aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in COLLECTORS:
+            registry.register(collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from .publish_spool import get_publish_spool
+from .publisher_utility import (
+    get_publish_mode,
+    get_stac_api_url,
+    publish_many_to_stac_fastapi,
+    publish_to_stac_fastapi,
+)
+from ..metrics import PUBLISH_QUEUE_ITEMS, STAGE_PUBLISH, get_metric_labels, observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+class PublishQueueFullError(Exception):
+    """
+    Raised when an item can not be queued for publication because the queue stayed full.
+    """
+
+
+class PublishQueue:
+    """
+    Publishes generated items to the STAC API in the background (write-behind).
+
+    Items are persisted to the publish spool (see publish_spool.get_publish_spool) before
+    `enqueue` returns, and published by a fixed number of worker tasks, in batches of the
+    items of a collection. A batch that fails is retried with an exponential backoff, so
+    generation does not wait for the STAC API, and queued items survive restarts.
+
+    When the spool is full, `enqueue` waits for room up to a timeout before giving up, so
+    that generation slows down to the pace of the STAC API instead of failing right away.
+
+    Attributes:
+        concurrency (int): The number of batches published at the same time.
+        batch_size (int): The maximum number of items in a batch.
+        flush_interval (float): How long an idle worker waits before checking the spool,
+            for items queued by other processes.
+        put_timeout (float): How long enqueue waits for room in a full queue.
+        retry_delay (float): The delay before the first retry of a failed batch.
+        max_retry_delay (float): The maximum delay between retries.
+        max_attempts (int): The number of attempts after which an item is marked as failed.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        put_timeout: Optional[float] = None,
+        retry_delay: Optional[float] = None,
+        max_retry_delay: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+    ):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self._workers: List[asyncio.Task] = []
+        self._claimed: Dict[int, Dict[str, Any]] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether generated items are queued instead of being published right away.
+        """
+        return get_publish_spool() is not None
+
+    async def start(self):
+        """
+        Start the worker tasks when the spool is enabled, this must be called from the
+        running event loop.
+
+        Settings that were not given to the constructor are read from the environment:
+        PUBLISH_QUEUE_CONCURRENCY, PUBLISH_QUEUE_BATCH_SIZE, PUBLISH_QUEUE_FLUSH_INTERVAL,
+        PUBLISH_QUEUE_PUT_TIMEOUT, PUBLISH_QUEUE_RETRY_DELAY, PUBLISH_QUEUE_MAX_RETRY_DELAY
+        and PUBLISH_QUEUE_MAX_ATTEMPTS.
+        """
+        self._configure()
+        if self._workers or not self.enabled:
+            return
+        logger.info(f"Starting {self.concurrency} publish queue workers")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """
+        Cancel the worker tasks. The batches being published are released, to be
+        published again after a restart.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        if self._claimed:
+            await _run_in_thread(get_publish_spool().release, list(self._claimed))
+            self._claimed.clear()
+
+    async def enqueue(self, item: Dict[str, Any], collection: str, parser: Optional[str] = None) -> str:
+        """
+        Queue an item for publication.
+
+        Returns:
+            str: The URL the item will be published at.
+
+        Raises:
+            ValueError: If STAC_API_URL environment variable is not set.
+            PublishQueueFullError: If the queue is still full after put_timeout seconds.
+        """
+        self._configure()
+        url = f"{get_stac_api_url()}/collections/{collection}/items/{item['id']}"
+        spool = get_publish_spool()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.put_timeout
+        while not await _run_in_thread(spool.put, item, collection, parser):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise PublishQueueFullError(
+                    f"The publish queue is full ({spool.max_size} items), retry later."
+                )
+            # The queue may also be flushed by other processes, check it again regularly
+            await self._wait(self._get_flushed(), min(remaining, self.flush_interval))
+
+        self._get_queued().set()
+        return url
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return whether the queue is enabled, with its depth, failed items and lag when it is.
+        """
+        spool = get_publish_spool()
+        if spool is None:
+            return {"enabled": False}
+        return {"enabled": True, **spool.get_stats()}
+
+    async def _worker(self):
+        spool = get_publish_spool()
+        while True:
+            entries = await _run_in_thread(spool.claim, self.batch_size, self._get_lease())
+            if not entries:
+                await self._wait(self._get_queued(), self.flush_interval)
+                continue
+
+            for entry in entries:
+                self._claimed[entry["id"]] = entry
+            try:
+                await self._flush(spool, entries)
+            except Exception as e:
+                # The batch is taken again once its lease has expired
+                logger.exception(e)
+            # A cancelled batch stays claimed, for stop to release it
+            for entry in entries:
+                self._claimed.pop(entry["id"], None)
+            self._get_flushed().set()
+
+    async def _flush(self, spool, entries: List[Dict[str, Any]]):
+        """
+        Publish a batch of items of a collection, in a single bulk request per chunk in
+        bulk mode, else concurrently one by one, and complete or retry them: in bulk mode
+        only the items of the chunks that failed are retried.
+        """
+        collection = entries[0]["collection"]
+        logger.info(f"Publishing {len(entries)} queued items to collection {collection}")
+
+        bulk = get_publish_mode() == "bulk"
+
+        async def publish(batch):
+            # The items of a batch are published together, whatever their parser
+            parsers = {entry["parser"] for entry in batch}
+            labels = get_metric_labels(parsers.pop() if len(parsers) == 1 else "mixed", collection)
+            try:
+                with observe_stage(STAGE_PUBLISH, labels):
+                    # Failed items are retried by the queue, not by the publisher
+                    if bulk:
+                        results = await publish_many_to_stac_fastapi(
+                            [entry["item"] for entry in batch], collection, max_retries=1,
+                            return_exceptions=True,
+                        )
+                    else:
+                        results = [await publish_to_stac_fastapi(batch[0]["item"], collection, max_retries=1)]
+            except Exception as e:
+                results = [e] * len(batch)
+
+            published = [entry["id"] for entry, result in zip(batch, results) if not isinstance(result, Exception)]
+            if published:
+                await _run_in_thread(spool.complete, published)
+                PUBLISH_QUEUE_ITEMS.labels("published").inc(len(published))
+            # The items of a failed bulk chunk share its error, and are retried together
+            failures: Dict[int, Tuple[Exception, List[Dict[str, Any]]]] = {}
+            for entry, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    failures.setdefault(id(result), (result, []))[1].append(entry)
+            for error, failed in failures.values():
+                await self._retry(spool, failed, error)
+
+        if bulk:
+            await publish(entries)
+        else:
+            # Items published one by one are retried one by one
+            await asyncio.gather(*[publish([entry]) for entry in entries])
+
+    async def _retry(self, spool, batch: List[Dict[str, Any]], error: Exception):
+        # Items of a batch were queued together, the least attempted one sets the delay
+        attempts = min(entry["attempts"] for entry in batch) + 1
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+        failed = await _run_in_thread(
+            spool.retry, [entry["id"] for entry in batch], str(error), delay, self.max_attempts
+        )
+        if failed:
+            logger.error(f"Giving up publishing {failed} queued items after {self.max_attempts} attempts: {error}")
+            PUBLISH_QUEUE_ITEMS.labels("failed").inc(failed)
+        if len(batch) > failed:
+            logger.warning(f"Publishing {len(batch) - failed} queued items failed ({error}), retrying in {delay}s")
+            PUBLISH_QUEUE_ITEMS.labels("retried").inc(len(batch) - failed)
+
+    def _configure(self):
+        self.concurrency = self.concurrency or int(os.getenv("PUBLISH_QUEUE_CONCURRENCY", "4"))
+        self.batch_size = self.batch_size or int(os.getenv("PUBLISH_QUEUE_BATCH_SIZE", "100"))
+        self.flush_interval = self.flush_interval or float(os.getenv("PUBLISH_QUEUE_FLUSH_INTERVAL", "1"))
+        if self.put_timeout is None:
+            self.put_timeout = float(os.getenv("PUBLISH_QUEUE_PUT_TIMEOUT", "30"))
+        self.retry_delay = self.retry_delay or float(os.getenv("PUBLISH_QUEUE_RETRY_DELAY", "1"))
+        self.max_retry_delay = self.max_retry_delay or float(os.getenv("PUBLISH_QUEUE_MAX_RETRY_DELAY", "300"))
+        if self.max_attempts is None:
+            self.max_attempts = int(os.getenv("PUBLISH_QUEUE_MAX_ATTEMPTS", "10"))
+
+    def _get_lease(self) -> float:
+        # A batch is retried by another worker if it is not published in time, e.g. its process died
+        return float(os.getenv("STAC_API_TIMEOUT", "30")) * 2 + 30
+
+    def _get_queued(self) -> asyncio.Event:
+        return self._get_event("queued")
+
+    def _get_flushed(self) -> asyncio.Event:
+        return self._get_event("flushed")
+
+    def _get_event(self, name: str) -> asyncio.Event:
+        # Events are bound to the event loop they are first waited on
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._events = {}
+        if name not in self._events:
+            self._events[name] = asyncio.Event()
+        return self._events[name]
+
+    @staticmethod
+    async def _wait(event: asyncio.Event, timeout: float):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+
+async def _run_in_thread(function, *args):
+    # SQLite calls wait for the locks of other processes, they are kept off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+publish_queue = PublishQueue()
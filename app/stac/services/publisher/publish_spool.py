@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+from ..sqlite_store import SQLiteStore, get_shared_store
+
+
+class PublishSpool(SQLiteStore):
+    """
+    A durable queue of the items waiting to be published, stored in a SQLite database.
+
+    Items are taken in batches of a single collection, oldest first. A batch is claimed
+    for `lease` seconds: its items are not taken again meanwhile, and are taken again
+    once the lease has expired if they were neither completed nor retried, e.g. when the
+    process publishing them died. Enqueuing an item replaces the unclaimed version of the
+    same item waiting in the same collection.
+
+    The database can be shared by several processes, and items left in it are published
+    after a restart.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        max_size (int): The number of pending items above which put refuses new items.
+    """
+
+    def __init__(self, path: str, max_size: int = 10000, timeout: float = 10):
+        self.max_size = max_size
+        super().__init__(path, timeout)
+
+    def _create(self, connection: sqlite3.Connection):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS publish_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, "
+            "item_id TEXT NOT NULL, parser TEXT, item BLOB NOT NULL, "
+            "enqueued_at REAL NOT NULL, available_at REAL NOT NULL, "
+            "claimed_until REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, "
+            "failed INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS publish_queue_pending "
+            "ON publish_queue (failed, collection, available_at)"
+        )
+
+    def put(self, item: Dict[str, Any], collection: str, parser: Optional[str] = None) -> bool:
+        """
+        Add an item to the queue.
+
+        Returns:
+            bool: False if the queue holds max_size pending items, the item is then not added.
+        """
+        now = time.time()
+        value = orjson.dumps(item, option=orjson.OPT_SERIALIZE_NUMPY)
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM publish_queue WHERE collection = ? AND item_id = ? AND claimed_until <= ?",
+                (collection, item["id"], now),
+            )
+            depth = connection.execute("SELECT COUNT(*) FROM publish_queue WHERE failed = 0").fetchone()[0]
+            if depth >= self.max_size:
+                return False
+            connection.execute(
+                "INSERT INTO publish_queue (collection, item_id, parser, item, enqueued_at, available_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (collection, item["id"], parser, value, now, now),
+            )
+        return True
+
+    def claim(self, batch_size: int, lease: float) -> List[Dict[str, Any]]:
+        """
+        Claim up to `batch_size` items of the collection of the oldest item due.
+
+        Returns:
+            list: The items, oldest first, as dictionaries with the "id" of their entry,
+            and their "collection", "parser", "item", "enqueued_at" and "attempts".
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT collection FROM publish_queue "
+                "WHERE failed = 0 AND available_at <= ? AND claimed_until <= ? ORDER BY id LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return []
+            rows = connection.execute(
+                "SELECT id, collection, parser, item, enqueued_at, attempts FROM publish_queue "
+                "WHERE failed = 0 AND collection = ? AND available_at <= ? AND claimed_until <= ? "
+                "ORDER BY id LIMIT ?",
+                (row[0], now, now, batch_size),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE publish_queue SET claimed_until = ? WHERE id = ?",
+                [(now + lease, entry[0]) for entry in rows],
+            )
+        return [
+            {
+                "id": entry_id,
+                "collection": collection,
+                "parser": parser,
+                "item": orjson.loads(item),
+                "enqueued_at": enqueued_at,
+                "attempts": attempts,
+            }
+            for entry_id, collection, parser, item, enqueued_at, attempts in rows
+        ]
+
+    def complete(self, entry_ids: List[int]):
+        """
+        Remove published items from the queue.
+        """
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM publish_queue WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def retry(self, entry_ids: List[int], error: str, delay: float, max_attempts: int = 0) -> int:
+        """
+        Release claimed items after a failed attempt, to be taken again in `delay` seconds.
+
+        Items that have been attempted `max_attempts` times (0 for no limit) are marked as
+        failed instead: they are kept in the queue, but no longer published or counted as
+        pending.
+
+        Returns:
+            int: The number of items marked as failed.
+        """
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE publish_queue SET attempts = attempts + 1, available_at = ?, claimed_until = 0, "
+                "last_error = ?, failed = (? > 0 AND attempts + 1 >= ?) WHERE id = ?",
+                [(time.time() + delay, error, max_attempts, max_attempts, entry_id) for entry_id in entry_ids],
+            )
+            return connection.execute(
+                f"SELECT COUNT(*) FROM publish_queue WHERE failed = 1 AND id IN ({','.join('?' * len(entry_ids))})",
+                entry_ids,
+            ).fetchone()[0]
+
+    def release(self, entry_ids: List[int]):
+        """
+        Release claimed items without counting an attempt, e.g. when the service stops.
+        """
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE publish_queue SET claimed_until = 0 WHERE id = ?", [(entry_id,) for entry_id in entry_ids]
+            )
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Return the number of pending and failed items, and the lag: the age in seconds of
+        the oldest pending item, 0 when none is pending.
+        """
+        with self._connect() as connection:
+            depth, oldest = connection.execute(
+                "SELECT COUNT(*), MIN(enqueued_at) FROM publish_queue WHERE failed = 0"
+            ).fetchone()
+            failed = connection.execute("SELECT COUNT(*) FROM publish_queue WHERE failed = 1").fetchone()[0]
+        return {
+            "depth": depth,
+            "failed": failed,
+            "lag_seconds": max(0.0, time.time() - oldest) if oldest is not None else 0.0,
+        }
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM publish_queue")
+
+
+def get_publish_spool() -> Optional[PublishSpool]:
+    """
+    Return the publish spool, or None if write-behind publishing is disabled.
+
+    Write-behind publishing is enabled by setting `PUBLISH_QUEUE_PATH` to the path of the
+    SQLite database of the spool, which holds at most `PUBLISH_QUEUE_MAX_SIZE` (defaults
+    to 10000) pending items.
+    """
+    path = os.getenv("PUBLISH_QUEUE_PATH")
+    if not path:
+        return None
+
+    return get_shared_store(PublishSpool, path, max_size=int(os.getenv("PUBLISH_QUEUE_MAX_SIZE", "10000")))
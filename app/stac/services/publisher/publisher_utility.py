@@ -1,75 +1,235 @@
-import json
+import asyncio
 import os
-import time
-import requests
+import weakref
+from typing import Dict, List, Union
+
+import httpx
 import logging
+import orjson
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 
 logger = logging.getLogger(__name__)
 
+# Status codes worth retrying, e.g. the database of the STAC API being locked
+RETRYABLE_STATUS_CODES = {408, 423, 425, 429, 500, 502, 503, 504}
+
+# One client per event loop, httpx clients can not be shared between loops
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class RetryablePublishError(Exception):
+    """
+    Raised when the STAC API returned a response that is worth retrying.
+    """
+
+
+def get_publish_timeout() -> float:
+    """
+    Return the timeout in seconds for requests made to the STAC API.
+
+    Reads `STAC_API_TIMEOUT`, defaults to 30 seconds.
+    """
+    return float(os.getenv("STAC_API_TIMEOUT", "30"))
+
+
+def get_publish_mode() -> str:
+    """
+    Return how items are sent to the STAC API.
+
+    Reads `STAC_API_PUBLISH_MODE`: "item" (the default) POSTs each item and PUTs it when
+    it already exists, "bulk" upserts items through the bulk items transaction endpoint.
+    """
+    mode = os.getenv("STAC_API_PUBLISH_MODE", "item").lower()
+    if mode not in ("item", "bulk"):
+        raise ValueError(f"Unsupported STAC_API_PUBLISH_MODE: {mode}")
+    return mode
+
+
+def get_stac_api_url() -> str:
+    stac_api_url = os.getenv("STAC_API_URL", None)
+
+    # Check if environment variables are set
+    if not stac_api_url:
+        logger.error("STAC_API_URL environment variable is not set.")
+        raise ValueError("STAC_API_URL environment variable is not set.")
+
+    return stac_api_url
+
+
+def get_stac_api_client() -> httpx.AsyncClient:
+    """
+    Return the pooled HTTP client of the running event loop, creating it on first use.
+
+    The pool size is read from `STAC_API_MAX_CONNECTIONS`, defaults to 20.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        max_connections = int(os.getenv("STAC_API_MAX_CONNECTIONS", "20"))
+        client = httpx.AsyncClient(
+            timeout=get_publish_timeout(),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+        _clients[loop] = client
+    return client
+
 
-def publish_to_stac_fastapi(stac, collection, max_retries=5, retry_delay=5) -> str:
+async def close_stac_api_client():
+    """
+    Close the HTTP client of the running event loop, if it has been created.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _send_with_retries(send, max_retries, retry_delay, max_retry_delay):
+    """
+    Call send until it succeeds, waiting an exponentially growing, jittered delay
+    between attempts that raised RetryablePublishError or a transport error.
+    """
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(max_retries),
+        wait=wait_random_exponential(multiplier=retry_delay, max=max_retry_delay),
+        retry=retry_if_exception_type((RetryablePublishError, httpx.TransportError)),
+        before_sleep=lambda state: logger.warning(
+            f"Publishing failed ({state.outcome.exception()}), retrying..."
+        ),
+        reraise=True,
+    )
+    try:
+        async for attempt in retrying:
+            with attempt:
+                return await send()
+    except (RetryablePublishError, httpx.TransportError) as e:
+        logger.error(f"Max retries reached. Giving up. Last error: {e}")
+        raise Exception(f"Max retries reached. Giving up. Last error: {e}")
+
+
+def _dumps(data) -> bytes:
+    # rio_stac statistics can hold numpy scalars, which the json module accepted as floats
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _check_response(response: httpx.Response):
+    if response.status_code in (200, 201):
+        return
+    message = f"STAC API returned {response.status_code}: {response.text}"
+    if response.status_code in RETRYABLE_STATUS_CODES:
+        raise RetryablePublishError(message)
+    logger.error(message)
+    raise Exception(message)
+
+
+async def publish_to_stac_fastapi(
+    stac, collection, max_retries=5, retry_delay=1, max_retry_delay=30
+) -> str:
     """
     Publish data to a STAC FastAPI.
 
     This function sends data to a STAC FastAPI service. If the item does not exist,
     it performs a POST to the /items/ endpoint. If it does exist, it performs a PUT
-    to the /items/{id} endpoint.
+    to the /items/{id} endpoint. When STAC_API_PUBLISH_MODE is "bulk", the item is
+    upserted through the bulk items endpoint in a single request instead.
+
+    Requests go through a pooled client and retry delays are awaited, so the event
+    loop keeps serving other requests while publishing.
 
     :param stac: The data to be published.
     :param collection: The collection where the data belongs.
-    :param max_retries: Maximum number of retries in case of a DB lock error.
-    :param retry_delay: Delay between retries in seconds.
-    :return: True if successful, False otherwise.
+    :param max_retries: Maximum number of attempts in case of a DB lock or transient error.
+    :param retry_delay: Base delay in seconds of the exponential backoff between attempts.
+    :param max_retry_delay: Maximum delay in seconds between attempts.
+    :return: The URL of the published item.
 
     :raises ValueError: If STAC_API_URL environment variable is not set.
     :raises Exception: If max_retries is reached or if there is an error.
-    :raises requests.RequestException: If there is a request error.
     """
-    stac_api_url = os.getenv("STAC_API_URL", None)
-
-    # Check if environment variables are set
-    if not stac_api_url:
-        logger.error("STAC_API_URL environment variable is not set.")
-        raise ValueError("STAC_API_URL environment variable is not set.")
+    if get_publish_mode() == "bulk":
+        urls = await publish_many_to_stac_fastapi(
+            [stac], collection, max_retries, retry_delay, max_retry_delay
+        )
+        return urls[0]
 
+    stac_api_url = get_stac_api_url()
     item_id = stac["id"]
     item_url = f"{stac_api_url}/collections/{collection}/items/{item_id}"
     logger.info(f"Publishing to {item_url}")
 
-    for _ in range(max_retries):
+    client = get_stac_api_client()
+    # Serialized once, and reused for the PUT and any retry
+    content = _dumps(stac)
+
+    async def send():
+        response = await client.post(
+            f"{stac_api_url}/collections/{collection}/items", content=content
+        )
+        # Assuming 409 Conflict indicates item already exists
+        if response.status_code == 409:
+            response = await client.put(item_url, content=content)
+        _check_response(response)
+        return item_url
+
+    return await _send_with_retries(send, max_retries, retry_delay, max_retry_delay)
+
+
+async def publish_many_to_stac_fastapi(
+    items: List[Dict], collection, max_retries=5, retry_delay=1, max_retry_delay=30,
+    return_exceptions=False,
+) -> List[Union[str, Exception]]:
+    """
+    Publish many items of a collection through the STAC FastAPI bulk items transaction endpoint.
+
+    Items are upserted in chunks of STAC_API_BULK_CHUNK_SIZE (defaults to 100) with a
+    single POST to /collections/{collection}/bulk_items per chunk.
+
+    :param items: The items to be published.
+    :param collection: The collection where the items belong.
+    :param max_retries: Maximum number of attempts per chunk.
+    :param retry_delay: Base delay in seconds of the exponential backoff between attempts.
+    :param max_retry_delay: Maximum delay in seconds between attempts.
+    :param return_exceptions: Whether the chunks after a failed chunk are still published,
+        the items of a failed chunk then get its error instead of their URL.
+    :return: The URLs of the published items, in the order they were given.
+
+    :raises ValueError: If STAC_API_URL environment variable is not set.
+    :raises Exception: If max_retries is reached or if there is an error, unless
+        return_exceptions is set.
+    """
+    stac_api_url = get_stac_api_url()
+    chunk_size = int(os.getenv("STAC_API_BULK_CHUNK_SIZE", "100"))
+    bulk_url = f"{stac_api_url}/collections/{collection}/bulk_items"
+    client = get_stac_api_client()
+
+    results: List[Union[str, Exception]] = []
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        logger.info(f"Publishing {len(chunk)} items to {bulk_url}")
+        content = _dumps(
+            {"items": {item["id"]: item for item in chunk}, "method": "upsert"}
+        )
+
+        async def send():
+            _check_response(await client.post(bulk_url, content=content))
+
         try:
-            # Attempt POST request
-            response = requests.post(
-                f"{stac_api_url}/collections/{collection}/items",
-                data=json.dumps(stac),
-                headers={"Content-Type": "application/json"},
-            )
-
-            # If POST fails, attempt PUT request
-            if (
-                    response.status_code == 409
-            ):  # Assuming 409 Conflict indicates item already exists
-                response = requests.put(
-                    item_url,
-                    data=json.dumps(stac),
-                    headers={"Content-Type": "application/json"},
-                )
-
-            # Check if successful
-            if response.status_code in [200, 201]:
-                return item_url
-            else:
-                logger.warning("DB is locked, retrying...")
-                time.sleep(retry_delay)
-                continue
-
-
-        except requests.RequestException as e:
-            logger.error(f"Request error: {e}")
-            raise e
+            await _send_with_retries(send, max_retries, retry_delay, max_retry_delay)
         except Exception as e:
-            logger.error(f"An error occurred: {e}")
-            raise e
+            if not return_exceptions:
+                raise
+            results.extend([e] * len(chunk))
+            continue
+        results.extend(f"{stac_api_url}/collections/{collection}/items/{item['id']}" for item in chunk)
 
-    logger.error("Max retries reached. Giving up.")
-    raise Exception("Max retries reached. Giving up.")
+    return results
@@ -0,0 +1,174 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import orjson
+import requests
+
+from .http_fetch import probe_remote_file
+from .raster_inspection import RasterInspection
+from .sqlite_store import LRUStore, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class RasterMetadataCache(LRUStore):
+    """
+    A persistent cache of raster inspections, stored in a SQLite database.
+
+    Entries are keyed by the href of the raster without its query string (so signed
+    URLs of the same file share an entry), the identity of its content (ETag,
+    Last-Modified and size for HTTP(S) files, mtime and size for local files) and
+    the inspection options. Rasters without a known identity are not cached.
+
+    The least recently used entries are evicted once the cache holds more than
+    `max_bytes`, see sqlite_store.LRUStore. The database can be shared by several
+    processes.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        max_bytes (int): The maximum size of the cached values.
+        stats (dict): Counters of the hits, misses, stores and evictions of this process.
+    """
+
+    table = "raster_metadata"
+
+    def __init__(self, path: str, max_bytes: int = 268435456, timeout: float = 10):
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+        super().__init__(path, max_bytes, timeout)
+
+    def _create(self, connection: sqlite3.Connection):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS raster_metadata ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS raster_metadata_last_access "
+            "ON raster_metadata (last_access)"
+        )
+        super()._create(connection)
+
+    def get_key(self, filepath: str, variant: str = "") -> Optional[str]:
+        """
+        Return the cache key of a raster, or None if its identity can not be determined.
+
+        Args:
+            filepath (str): The path or URL of the raster.
+            variant (str): The inspection options that change the cached value.
+        """
+        identity = get_asset_identity(filepath)
+        if identity is None:
+            return None
+        return self._get_versioned_key(filepath.split("?")[0], identity, variant)
+
+    def get(self, key: str) -> Optional[RasterInspection]:
+        """
+        Return the cached inspection for a key, or None on a miss.
+        """
+        row = self._connect().execute(
+            "SELECT rowid, value FROM raster_metadata WHERE key = ?", (key,)
+        ).fetchone()
+
+        self._count("hits" if row is not None else "misses")
+        if row is None:
+            return None
+        self._touch([row[0]])
+        return RasterInspection.from_dict(orjson.loads(row[1]))
+
+    def put(self, key: str, inspection: RasterInspection):
+        """
+        Store an inspection, then evict the least recently used entries above max_bytes.
+        """
+        entry = inspection.to_dict()
+        # Signed query strings must not be persisted
+        href = inspection.filepath.split("?")[0]
+        entry["filepath"] = href
+        entry["generated_stac"]["id"] = entry["generated_stac"]["id"].split("?")[0]
+        entry["generated_stac"]["assets"]["asset"]["href"] = href
+        value = orjson.dumps(entry, option=orjson.OPT_SERIALIZE_NUMPY)
+        if len(value) > self.max_bytes:
+            return
+
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO raster_metadata (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            evicted = self._evict(connection)
+        self._count("stores")
+        self._count("evictions", evicted)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Return the counters of this process, with the number and size of the cached entries.
+        """
+        connection = self._connect()
+        entries = connection.execute("SELECT COUNT(*) FROM raster_metadata").fetchone()[0]
+        size = self._get_size(connection)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({"entries": entries, "bytes": size})
+        return stats
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM raster_metadata")
+
+    def _count(self, name: str, value: int = 1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+
+def get_asset_identity(filepath: str) -> Optional[str]:
+    """
+    Return a string identifying the content of a raster, or None if it is unknown.
+
+    Local files are identified by their mtime and size, HTTP(S) files by the ETag,
+    Last-Modified and size read with a request of their first byte, see
+    http_fetch.probe_remote_file.
+    """
+    scheme = urlparse(filepath).scheme
+    if scheme in ("http", "https"):
+        try:
+            size, headers = probe_remote_file(filepath)
+        except requests.RequestException as e:
+            logger.warning(f"Could not get the identity of {filepath.split('?')[0]}: {e}")
+            return None
+
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return None
+        return f"etag:{etag}|modified:{last_modified}|size:{size}"
+
+    if scheme in ("", "file") and not filepath.startswith("/vsi"):
+        try:
+            stat = os.stat(urlparse(filepath).path if scheme == "file" else filepath)
+        except OSError:
+            return None
+        return f"mtime:{stat.st_mtime_ns}|size:{stat.st_size}"
+
+    return None
+
+
+def get_raster_cache() -> Optional[RasterMetadataCache]:
+    """
+    Return the raster metadata cache, or None if it is disabled.
+
+    The cache is enabled by setting `RASTER_CACHE_PATH` to the path of its SQLite
+    database, and its size is capped by `RASTER_CACHE_MAX_BYTES` (defaults to 256 MiB).
+    """
+    path = os.getenv("RASTER_CACHE_PATH")
+    if not path:
+        return None
+
+    return get_shared_store(
+        RasterMetadataCache, path, max_bytes=int(os.getenv("RASTER_CACHE_MAX_BYTES", "268435456"))
+    )
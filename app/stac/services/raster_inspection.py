@@ -0,0 +1,288 @@
+import copy
+import datetime
+import functools
+import logging
+import os
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import rasterio
+import rio_stac
+from pystac import Asset, Item
+from pystac.utils import str_to_datetime
+from rasterio.crs import CRS
+from rasterio.coords import BoundingBox
+from rasterio.io import DatasetReader
+from rasterio.transform import Affine
+from rio_stac.stac import (
+    EO_EXT_VERSION,
+    PROJECTION_EXT_VERSION,
+    RASTER_EXT_VERSION,
+    get_dataset_geom,
+    get_eobands_info,
+    get_media_type,
+    get_projection_info,
+)
+
+from .file_operations import (
+    checks_remote_tiff_header,
+    open_raster,
+    return_remote_tiff_media_type,
+    return_tiff_media_type,
+)
+from .footprint import FOOTPRINT_VALID_DATA, get_geometry_bbox, get_valid_data_footprint
+from .gdal_profiles import gdal_env
+from .metrics import (
+    STAGE_COG_VALIDATION,
+    STAGE_FOOTPRINT,
+    STAGE_RIO_STAC,
+    STAGE_TAG_READ,
+    get_metric_labels,
+    observe_stage,
+)
+from .raster_statistics import get_default_statistics_method, get_raster_bands
+
+logger = logging.getLogger(__name__)
+
+
+class RasterInspection:
+    """
+    Everything the STAC item creator needs from a raster asset, read from a single open dataset.
+
+    Attributes:
+        filepath (str): The path or URL of the raster, as given in the payload.
+        generated_stac (Item): The item generated by rio_stac for the raster.
+        media_type (str): The media type of the raster, checked for COG layout if enabled.
+        tags (dict): The tags of the default metadata domain (e.g. TIFFTAG_DATETIME).
+        resolution (tuple): The (x, y) resolution of the raster.
+        overviews (list): The decimation factors of the overviews of the first band.
+        read_stats (dict): The number of requests and bytes read over HTTP to inspect the
+            raster, when GDAL_READ_STATS is enabled. It is not kept in the raster cache.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        generated_stac: Item,
+        media_type: str,
+        tags: Dict[str, str],
+        resolution: Optional[Tuple[float, float]],
+        overviews: List[int],
+        read_stats: Optional[Dict[str, int]] = None,
+    ):
+        self.filepath = filepath
+        self.generated_stac = generated_stac
+        self.media_type = media_type
+        self.tags = tags
+        self.resolution = resolution
+        self.overviews = overviews
+        self.read_stats = read_stats
+
+    def to_dict(self) -> Dict:
+        """
+        Return the inspection as a JSON serializable dictionary.
+        """
+        return {
+            "filepath": self.filepath,
+            "generated_stac": self.generated_stac.to_dict(),
+            "media_type": self.media_type,
+            "tags": self.tags,
+            "resolution": list(self.resolution) if self.resolution is not None else None,
+            "overviews": self.overviews,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "RasterInspection":
+        """
+        Create an inspection from a dictionary returned by to_dict.
+        """
+        return cls(
+            filepath=d["filepath"],
+            generated_stac=Item.from_dict(d["generated_stac"], migrate=False),
+            media_type=d["media_type"],
+            tags=d["tags"],
+            resolution=tuple(d["resolution"]) if d["resolution"] is not None else None,
+            overviews=d["overviews"],
+        )
+
+
+def inspect_raster(
+    filepath: str,
+    statistics_method: Optional[str] = None,
+    metric_labels: Optional[Tuple[str, str]] = None,
+    footprint_method: Optional[str] = None,
+) -> RasterInspection:
+    """
+    Open a raster once and read everything needed to describe it as a STAC asset.
+
+    The rio_stac item, the COG check, the tags, the resolution and the overviews are
+    all produced from the same dataset handle, so a remote file is only opened once. The
+    COG layout of remote files that are not read through the block cache is checked from
+    their header instead, see file_operations.checks_remote_tiff_header.
+
+    Args:
+        filepath (str): The path or URL of the raster.
+        statistics_method (str, optional): How the band statistics of `raster:bands` are
+            computed, see raster_statistics.get_raster_bands. Defaults to RASTER_STATISTICS_METHOD.
+        metric_labels (tuple, optional): The parser and collection labels of the stage metrics.
+        footprint_method (str, optional): "valid-data" to replace the bounds geometry of
+            the item by the polygon of the valid pixels, see footprint.get_valid_data_footprint.
+            Defaults to the bounds.
+
+    Returns:
+        RasterInspection: The result of the inspection.
+    """
+    statistics_method = statistics_method or get_default_statistics_method()
+    metric_labels = metric_labels or get_metric_labels(None)
+    logger.info(f"Opening {filepath} for inspection")
+    with gdal_env(filepath) as read_stats:
+        media_type = None
+        if checks_remote_tiff_header(filepath):
+            # A few range requests, where the open dataset would read every overview IFD
+            with observe_stage(STAGE_COG_VALIDATION, metric_labels):
+                media_type = return_remote_tiff_media_type(filepath)
+        with open_raster(filepath) as src:
+            with observe_stage(STAGE_RIO_STAC, metric_labels):
+                generated_stac = create_stac_item(src)
+                _add_raster_bands(generated_stac, get_raster_bands(src, statistics_method))
+            if footprint_method == FOOTPRINT_VALID_DATA:
+                with observe_stage(STAGE_FOOTPRINT, metric_labels):
+                    footprint = get_valid_data_footprint(src)
+                if footprint is not None:
+                    generated_stac.geometry = footprint
+                    generated_stac.bbox = get_geometry_bbox(footprint)
+            if media_type is None:
+                with observe_stage(STAGE_COG_VALIDATION, metric_labels):
+                    media_type = return_tiff_media_type(filepath, src)
+            with observe_stage(STAGE_TAG_READ, metric_labels):
+                tags, resolution, overviews = src.tags(), src.res, src.overviews(1)
+            inspection = RasterInspection(
+                filepath=filepath,
+                generated_stac=generated_stac,
+                media_type=media_type,
+                tags=tags,
+                resolution=resolution,
+                overviews=overviews,
+            )
+    if read_stats is not None:
+        inspection.read_stats = read_stats.to_dict()
+    logger.info(f"Closed {filepath}")
+    return inspection
+
+
+def create_stac_item(src: DatasetReader) -> Item:
+    """
+    Create the item of a raster like rio_stac, with the eo and projection extensions.
+
+    The geometry, the bbox and the `proj:*` fields only depend on the grid of the raster,
+    they are computed once per grid (see get_grid_metadata), so the bands of a product
+    stored one per file share that work. The raster extension is added by inspect_raster,
+    rio_stac always computes statistics.
+
+    Args:
+        src (DatasetReader): The open raster.
+
+    Returns:
+        Item: The item, with the raster as its "asset" asset.
+    """
+    if src.gcps[0]:
+        # Georeferenced by ground control points, rio_stac warps it first
+        return rio_stac.create_stac_item(
+            src,
+            with_eo=True,
+            with_proj=True,
+            with_raster=False,
+            geom_densify_pts=_GEOM_DENSIFY_PTS,
+        )
+
+    grid = copy.deepcopy(get_grid_metadata(src.crs, src.transform, src.height, src.width, src.bounds))
+    properties = {f"proj:{name}": value for name, value in grid["projection"].items()}
+    cloudcover = src.get_tag_item("CLOUDCOVER", "IMAGERY")
+    if cloudcover is not None:
+        properties["eo:cloud_cover"] = int(cloudcover)
+
+    acquisition_datetime = src.get_tag_item("ACQUISITIONDATETIME", "IMAGERY")
+    item = Item(
+        id=os.path.basename(src.name),
+        geometry=grid["geometry"],
+        bbox=grid["bbox"],
+        stac_extensions=[
+            f"https://stac-extensions.github.io/projection/{PROJECTION_EXT_VERSION}/schema.json",
+            f"https://stac-extensions.github.io/eo/{EO_EXT_VERSION}/schema.json",
+        ],
+        datetime=str_to_datetime(acquisition_datetime) if acquisition_datetime else datetime.datetime.utcnow(),
+        properties=properties,
+    )
+    item.add_asset(
+        key="asset",
+        asset=Asset(
+            href=src.name,
+            media_type=get_media_type(src),
+            extra_fields={"eo:bands": get_eobands_info(src)},
+            roles=[],
+        ),
+    )
+    return item
+
+
+# Number of points added to each edge of the bounds before reprojecting them, like GDAL
+_GEOM_DENSIFY_PTS = 21
+
+
+# The locks of the grids being computed, with the number of threads using each, so that
+# the TIFFs of an item read concurrently compute their grid once without waiting for others
+_grid_locks: Dict[tuple, list] = {}
+_grid_locks_lock = threading.Lock()
+
+
+def get_grid_metadata(
+    crs: Optional[CRS], transform: Affine, height: int, width: int, bounds: BoundingBox
+) -> Dict:
+    """
+    Return the geometry and bbox in EPSG:4326 and the projection fields of a grid, as
+    computed by rio_stac.
+
+    The result is memoized by grid and shared, copy it before changing it. The bounds
+    follow from the other arguments, they are passed as the dataset computed them.
+    """
+    key = (crs, transform, height, width, bounds)
+    with _grid_locks_lock:
+        entry = _grid_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            return _compute_grid_metadata(crs, transform, height, width, bounds)
+    finally:
+        with _grid_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _grid_locks[key]
+
+
+@functools.lru_cache(maxsize=256)
+def _compute_grid_metadata(
+    crs: Optional[CRS], transform: Affine, height: int, width: int, bounds: BoundingBox
+) -> Dict:
+    grid = SimpleNamespace(crs=crs, transform=transform, height=height, width=width, bounds=bounds)
+    geometry = get_dataset_geom(grid, densify_pts=_GEOM_DENSIFY_PTS)
+    return {
+        "geometry": geometry["footprint"],
+        "bbox": geometry["bbox"],
+        "projection": get_projection_info(grid),
+    }
+
+
+def _add_raster_bands(item: Item, raster_bands: List[Dict]):
+    """
+    Add the raster extension to an item generated by rio_stac, where rio_stac would have put it.
+    """
+    extension = f"https://stac-extensions.github.io/raster/{RASTER_EXT_VERSION}/schema.json"
+    eo_index = next(
+        (ix for ix, url in enumerate(item.stac_extensions) if "/eo/" in url),
+        len(item.stac_extensions),
+    )
+    item.stac_extensions.insert(eo_index, extension)
+
+    asset = item.assets["asset"]
+    asset.extra_fields = {"raster:bands": raster_bands, **asset.extra_fields}
@@ -0,0 +1,277 @@
+import logging
+import math
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+from rasterio.io import DatasetReader
+from rasterio.windows import Window
+
+logger = logging.getLogger(__name__)
+
+STATISTICS_NONE = "none"
+STATISTICS_OVERVIEW = "overview"
+STATISTICS_SAMPLED = "sampled"
+STATISTICS_EXACT = "exact"
+STATISTICS_METHODS = (STATISTICS_NONE, STATISTICS_OVERVIEW, STATISTICS_SAMPLED, STATISTICS_EXACT)
+
+
+def get_default_statistics_method() -> str:
+    """
+    Return the statistics method used when neither the request nor the parser sets one.
+
+    Reads `RASTER_STATISTICS_METHOD`, defaults to "overview".
+    """
+    method = os.getenv("RASTER_STATISTICS_METHOD", STATISTICS_OVERVIEW).lower()
+    if method not in STATISTICS_METHODS:
+        raise ValueError(f"Unsupported RASTER_STATISTICS_METHOD: {method}")
+    return method
+
+
+def get_raster_bands(src: DatasetReader, method: str) -> List[Dict]:
+    """
+    Describe the bands of a raster for the `raster:bands` field of its asset.
+
+    The band statistics and histograms are computed with the given method:
+        - "none": no statistics are computed, no pixels are read.
+        - "overview": from the coarsest overview at least RASTER_STATISTICS_MAX_SIZE
+          (defaults to 1024) pixels wide or high, or from a read decimated to that size
+          when there is no such overview.
+        - "sampled": from RASTER_STATISTICS_SAMPLE_WINDOWS (defaults to 16) windows of
+          RASTER_STATISTICS_SAMPLE_SIZE (defaults to 256) pixels square of the full
+          resolution image, picked at random with a fixed seed.
+        - "exact": from every pixel of the full resolution image, read a block at a time.
+
+    Each band records the method used in its `statistics_method` field.
+
+    Args:
+        src (DatasetReader): The open raster.
+        method (str): One of STATISTICS_METHODS.
+
+    Returns:
+        list: One dictionary per band.
+    """
+    if method not in STATISTICS_METHODS:
+        raise ValueError(f"Unsupported raster statistics method: {method}")
+
+    read_kwargs = {}
+    windows = None
+    if method == STATISTICS_OVERVIEW:
+        read_kwargs["out_shape"] = get_overview_read_shape(
+            src, int(os.getenv("RASTER_STATISTICS_MAX_SIZE", "1024"))
+        )
+    elif method == STATISTICS_SAMPLED:
+        windows = _get_sample_windows(
+            src,
+            int(os.getenv("RASTER_STATISTICS_SAMPLE_WINDOWS", "16")),
+            int(os.getenv("RASTER_STATISTICS_SAMPLE_SIZE", "256")),
+        )
+
+    area_or_point = src.tags().get("AREA_OR_POINT", "").lower()
+    bands = []
+    for band in src.indexes:
+        value = {
+            "data_type": src.dtypes[band - 1],
+            "scale": src.scales[band - 1],
+            "offset": src.offsets[band - 1],
+        }
+        if area_or_point:
+            value["sampling"] = area_or_point
+
+        # If the nodata is not set it is not forwarded
+        if src.nodata is not None:
+            if numpy.isnan(src.nodata):
+                value["nodata"] = "nan"
+            elif numpy.isposinf(src.nodata):
+                value["nodata"] = "inf"
+            elif numpy.isneginf(src.nodata):
+                value["nodata"] = "-inf"
+            else:
+                value["nodata"] = src.nodata
+
+        if src.units[band - 1] is not None:
+            value["unit"] = src.units[band - 1]
+
+        if method == STATISTICS_EXACT:
+            value.update(_get_exact_statistics(src, band))
+        elif method != STATISTICS_NONE:
+            if windows is not None:
+                arr = numpy.ma.concatenate(
+                    [src.read(band, window=window, masked=True).ravel() for window in windows]
+                )
+            else:
+                arr = src.read(band, masked=True, **read_kwargs)
+            value.update(_get_statistics(arr))
+
+        value["statistics_method"] = method
+        bands.append(value)
+
+    return bands
+
+
+def get_overview_read_shape(src: DatasetReader, max_size: int) -> Tuple[int, int]:
+    """
+    Return the (height, width) to read so that GDAL serves the read from an overview.
+    """
+    # Overview dimensions, computed like GDAL by rounding up the division by the factor
+    shapes = [
+        (math.ceil(src.height / factor), math.ceil(src.width / factor))
+        for factor in src.overviews(1)
+    ]
+    suitable = [shape for shape in shapes if max(shape) >= max_size]
+    if suitable:
+        return min(suitable, key=max)
+
+    if max(src.width, src.height) <= max_size:
+        return src.height, src.width
+
+    # Same decimation as rio_stac, GDAL picks the closest overview if there is one
+    ratio = src.height / src.width
+    if ratio > 1:
+        return max_size, math.ceil(max_size / ratio)
+    return math.ceil(max_size * ratio), max_size
+
+
+def _get_sample_windows(src: DatasetReader, count: int, size: int) -> List[Window]:
+    """
+    Pick `count` windows of `size` pixels square at random, or all of them if there are fewer.
+
+    The windows tile the image from its top left corner. They do not follow the blocks of
+    the raster, which are single rows of striped rasters. They are sampled with a fixed
+    seed so that the statistics of a raster are reproducible.
+    """
+    rows = math.ceil(src.height / size)
+    columns = math.ceil(src.width / size)
+    cells = [(row, column) for row in range(rows) for column in range(columns)]
+    if len(cells) > count:
+        cells = sorted(random.Random(0).sample(cells, count))
+
+    return [
+        Window(
+            column * size,
+            row * size,
+            min(size, src.width - column * size),
+            min(size, src.height - row * size),
+        )
+        for row, column in cells
+    ]
+
+
+# The number of pixels of the windows the strips of a striped raster are read in
+_EXACT_READ_PIXELS = 1 << 20
+
+
+def _get_read_windows(src: DatasetReader, band: int) -> List[Window]:
+    """
+    Return the windows covering a band, one per block, or a few strips at a time.
+    """
+    block_height, block_width = src.block_shapes[band - 1]
+    if block_width < src.width:
+        return [window for _, window in src.block_windows(band)]
+
+    rows = max(block_height, _EXACT_READ_PIXELS // src.width // block_height * block_height)
+    return [Window(0, row, src.width, min(rows, src.height - row)) for row in range(0, src.height, rows)]
+
+
+def _read_valid(src: DatasetReader, band: int, window: Window) -> numpy.ndarray:
+    arr = src.read(band, window=window, masked=True)
+    # Mask the nan/inf values so they do not end up in the statistics
+    numpy.ma.fix_invalid(arr, copy=False)
+    return arr.compressed()
+
+
+def _get_exact_statistics(src: DatasetReader, band: int) -> Dict:
+    """
+    Compute the statistics and histogram of every pixel of a band, like _get_statistics,
+    without reading the whole band at once.
+
+    A first pass over the blocks accumulates the minimum, maximum and moments of the
+    valid pixels, and a second pass the histogram, whose bins span their range.
+    """
+    windows = _get_read_windows(src, band)
+    count, mean, m2 = 0, 0.0, 0.0
+    minimum = maximum = None
+    for window in windows:
+        valid = _read_valid(src, band, window)
+        if valid.size == 0:
+            continue
+        # Merged into the running moments as in the parallel algorithm of Chan et al.
+        block_mean = valid.mean(dtype="float64")
+        block_m2 = numpy.square(valid - block_mean).sum()
+        total = count + valid.size
+        delta = block_mean - mean
+        mean += delta * valid.size / total
+        m2 += block_m2 + delta * delta * count * valid.size / total
+        count = total
+        block_minimum, block_maximum = valid.min(), valid.max()
+        minimum = block_minimum if minimum is None else min(minimum, block_minimum)
+        maximum = block_maximum if maximum is None else max(maximum, block_maximum)
+
+    if count == 0:
+        return {"statistics": {"valid_percent": 0.0}}
+
+    buckets = numpy.zeros(10, dtype="int64")
+    for window in windows:
+        sample, edges = numpy.histogram(_read_valid(src, band, window), bins=10, range=(minimum, maximum))
+        buckets += sample
+    return {
+        "statistics": {
+            "mean": float(mean),
+            "minimum": minimum.item(),
+            "maximum": maximum.item(),
+            "stddev": math.sqrt(m2 / count),
+            "valid_percent": count / float(src.width * src.height) * 100,
+        },
+        "histogram": {
+            "count": len(edges),
+            "min": float(edges.min()),
+            "max": float(edges.max()),
+            "buckets": buckets.tolist(),
+        },
+    }
+
+
+def _get_statistics(arr: numpy.ma.MaskedArray) -> Dict:
+    """
+    Compute the statistics and histogram of a band, in the format used by rio_stac.
+    """
+    # Mask the nan/inf values so they do not end up in the statistics
+    numpy.ma.fix_invalid(arr, copy=False)
+    valid = arr.compressed()
+    if valid.size == 0:
+        return {"statistics": {"valid_percent": 0.0}}
+
+    sample, edges = numpy.histogram(valid)
+    return {
+        "statistics": {
+            "mean": arr.mean().item(),
+            "minimum": arr.min().item(),
+            "maximum": arr.max().item(),
+            "stddev": arr.std().item(),
+            "valid_percent": numpy.count_nonzero(~numpy.ma.getmaskarray(arr))
+            / float(arr.data.size)
+            * 100,
+        },
+        "histogram": {
+            "count": len(edges),
+            "min": float(edges.min()),
+            "max": float(edges.max()),
+            "buckets": sample.tolist(),
+        },
+    }
+
+
+def resolve_statistics_method(request_method: Optional[str], parser=None) -> str:
+    """
+    Return the statistics method of a request: the one it sets, else the `raster_statistics`
+    attribute of its parser, else the default.
+    """
+    if request_method:
+        return request_method
+    parser_method = getattr(parser, "raster_statistics", None)
+    if parser_method:
+        if parser_method not in STATISTICS_METHODS:
+            raise ValueError(f"Unsupported raster statistics method: {parser_method}")
+        return parser_method
+    return get_default_statistics_method()
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+import orjson
+
+from .metrics import COALESCED_REQUESTS
+from ..models import GenerateSTACPayload
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of a request counted by COALESCED_REQUESTS
+OUTCOME_RUN = "run"
+OUTCOME_COALESCED = "coalesced"
+OUTCOME_CACHED = "cached"
+
+# Results kept for the result TTL, the oldest are dropped first
+_MAX_RESULTS = 256
+
+
+def get_payload_fingerprint(payload: GenerateSTACPayload) -> str:
+    """
+    Return a fingerprint of a payload, equal for payloads generating the same item.
+
+    The query strings of the files and of the metadata URL are kept: a signed URL only
+    matches requests that are authorized to read the same files. The metadata is hashed
+    with its keys sorted.
+    """
+    normalized = payload.dict()
+    normalized["metadata"] = hashlib.sha1(
+        orjson.dumps(payload.metadata, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    ).hexdigest()
+    return hashlib.sha1(orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class RequestCoalescer:
+    """
+    Runs identical concurrent requests once, on the event loop.
+
+    The first request with a key runs the work, the requests with the same key that
+    arrive while it runs wait for it and share its result or error. Successful results
+    can then be reused for `GENERATE_COALESCE_TTL` seconds (defaults to 0, which disables it).
+
+    The work runs in its own task, so a request that is cancelled does not cancel the
+    work the other requests are waiting for.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._results: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the result of `work`, shared with the concurrent or recent runs of the same key.
+        """
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                COALESCED_REQUESTS.labels(OUTCOME_CACHED).inc()
+                return cached[1]
+            del self._results[key]
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            COALESCED_REQUESTS.labels(OUTCOME_COALESCED).inc()
+            logger.info(f"Waiting for the identical request {key} in progress")
+        else:
+            COALESCED_REQUESTS.labels(OUTCOME_RUN).inc()
+            future = asyncio.ensure_future(work())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future):
+        self._in_flight.pop(key, None)
+        ttl = float(os.getenv("GENERATE_COALESCE_TTL", "0"))
+        if ttl <= 0 or future.cancelled() or future.exception() is not None:
+            return
+        self._results[key] = (time.monotonic() + ttl, future.result())
+        while len(self._results) > _MAX_RESULTS:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop the kept results.
+        """
+        self._results.clear()
+
+
+generation_coalescer = RequestCoalescer()
@@ -0,0 +1,186 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Tuple, Type, TypeVar
+
+# One store per class and path, shared by the threads of a process
+_stores: Dict[Tuple[type, str], "SQLiteStore"] = {}
+_stores_lock = threading.Lock()
+
+StoreType = TypeVar("StoreType", bound="SQLiteStore")
+
+
+class SQLiteStore:
+    """
+    The base of the caches and queues persisted in a SQLite database.
+
+    The database is in WAL mode, so that readers do not wait for writers, and can be
+    shared by several processes. Each thread uses its own connection. Subclasses create
+    their tables in `_create`, which runs under the write lock when the store is created.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        timeout (float): How long to wait for the locks of other connections.
+    """
+
+    def __init__(self, path: str, timeout: float = 10):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as connection:
+            self._create(connection)
+
+    def _create(self, connection: sqlite3.Connection):
+        pass
+
+    def _transaction(self) -> sqlite3.Connection:
+        # Taking the write lock first, so that concurrent processes do not read stale rows
+        # between their reads and writes
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can not be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            # REPLACE deletes the rows it replaces, the size triggers must see it
+            connection.execute("PRAGMA recursive_triggers = ON")
+            self._local.connection = connection
+        return connection
+
+
+class LRUStore(SQLiteStore):
+    """
+    A SQLiteStore of rows with a `size` and a `last_access`, whose least recently used
+    rows are evicted above `max_bytes`.
+
+    The total size of the rows is maintained by triggers, so that writes do not sum the
+    whole table. Reads only record which rows they used: these touches are written with
+    the next write of the process, or once the oldest of them is `touch_interval` seconds
+    old, so that a read does not take the write lock.
+
+    Attributes:
+        table (str): The table of the rows, created by the subclass before calling
+            LRUStore._create.
+        version (int): The version of the stored format, see _get_versioned_key.
+        max_bytes (int): The maximum size of the rows.
+    """
+
+    table = ""
+    # Bump when the stored format changes, the rows of older versions are then ignored
+    version = 1
+    touch_interval = 5.0
+
+    def __init__(self, path: str, max_bytes: int, timeout: float = 10):
+        self.max_bytes = max_bytes
+        self._touches: Dict[int, float] = {}
+        self._touches_since = time.monotonic()
+        self._touches_lock = threading.Lock()
+        super().__init__(path, timeout)
+
+    def _get_versioned_key(self, *parts) -> str:
+        """
+        Return a key made of parts, prefixed with the version of the stored format.
+        """
+        return "|".join([f"v{self.version}", *(str(part) for part in parts)])
+
+    def get_size(self) -> int:
+        """
+        Return the total size of the stored rows.
+        """
+        return self._get_size(self._connect())
+
+    def flush(self):
+        """
+        Write the pending touches of this process.
+        """
+        with self._connect() as connection:
+            self._write_touches(connection)
+
+    def _create(self, connection: sqlite3.Connection):
+        connection.execute("CREATE TABLE IF NOT EXISTS store_sizes (name TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+        # Rows stored before the triggers existed are counted once
+        connection.execute(
+            f"INSERT OR IGNORE INTO store_sizes (name, size) "
+            f"SELECT ?, COALESCE(SUM(size), 0) FROM {self.table}",
+            (self.table,),
+        )
+        update = f"UPDATE store_sizes SET size = size + {{}} WHERE name = '{self.table}'"
+        for name, event, change in (
+            ("insert", "INSERT", "NEW.size"),
+            ("delete", "DELETE", "-OLD.size"),
+            ("update", "UPDATE OF size", "NEW.size - OLD.size"),
+        ):
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_size_{name} AFTER {event} ON {self.table} "
+                f"BEGIN {update.format(change)}; END"
+            )
+
+    def _get_size(self, connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT size FROM store_sizes WHERE name = ?", (self.table,)).fetchone()[0]
+
+    def _touch(self, rowids: Iterable[int]):
+        """
+        Record that rows were read, writing the touches of this process once they are due.
+        """
+        now = time.time()
+        with self._touches_lock:
+            if not self._touches:
+                self._touches_since = time.monotonic()
+            for rowid in rowids:
+                self._touches[rowid] = now
+            due = self._touches and time.monotonic() - self._touches_since >= self.touch_interval
+        if due:
+            self.flush()
+
+    def _write_touches(self, connection: sqlite3.Connection):
+        with self._touches_lock:
+            touches, self._touches = self._touches, {}
+        if touches:
+            connection.executemany(
+                f"UPDATE {self.table} SET last_access = ? WHERE rowid = ?",
+                [(last_access, rowid) for rowid, last_access in touches.items()],
+            )
+
+    def _evict(self, connection: sqlite3.Connection) -> int:
+        """
+        Write the pending touches, then delete the least recently used rows above
+        max_bytes, in the transaction of a write. Returns the number of rows deleted.
+        """
+        self._write_touches(connection)
+        total = self._get_size(connection)
+        evicted = 0
+        while total > self.max_bytes:
+            rows = connection.execute(
+                f"SELECT rowid, size FROM {self.table} ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            deleted = []
+            for rowid, size in rows:
+                if total <= self.max_bytes:
+                    break
+                deleted.append((rowid,))
+                total -= size
+            connection.executemany(f"DELETE FROM {self.table} WHERE rowid = ?", deleted)
+            evicted += len(deleted)
+        return evicted
+
+
+def get_shared_store(store_class: Type[StoreType], path: str, *args, **kwargs) -> StoreType:
+    """
+    Return the store of a class for a database path, created with the given arguments on
+    first use and then shared by the threads of the process.
+    """
+    with _stores_lock:
+        store = _stores.get((store_class, path))
+        if store is None:
+            store = store_class(path, *args, **kwargs)
+            _stores[(store_class, path)] = store
+    return store
+
@@ -6,19 +6,35 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-import rasterio
-import rio_stac
 from pystac import Asset, Item
+from pystac.utils import datetime_to_str, str_to_datetime
 
 from .file_operations import (
     get_file_type,
     is_tiff,
-    get_mounted_file,
-    return_tiff_media_type,
     return_asset_name,
 )
+from .executors import get_asset_executor
+from .footprint import (
+    FOOTPRINT_BOUNDS,
+    get_footprint_settings,
+    resolve_footprint_method,
+    union_footprints,
+)
 from .metadata_parsers.metadata_parser_manager import MetadataParserManager
-from .metadata_parsers.utils import merge_stac_items
+from .metadata_parsers.utils import merge_stac_items_in_place
+from .metrics import (
+    STAGE_MERGE,
+    STAGE_METADATA_FETCH,
+    STAGE_PARSE,
+    STAGE_PARSER_LOAD,
+    STAGE_VALIDATION,
+    get_metric_labels,
+    observe_stage,
+)
+from .raster_cache import get_raster_cache
+from .raster_inspection import RasterInspection, inspect_raster
+from .raster_statistics import resolve_statistics_method
 from ..models import GenerateSTACPayload
 
 
@@ -30,6 +46,8 @@ class STACItemCreator:
         payload (GenerateSTACPayload): The input data for creating a STAC item.
         item (Item): The STAC item being created.
         generated_rio_stac_items (list): List of generated items using the rio_stac package.
+        raster_inspections (list): List of the inspections of the TIFF files, in payload order.
+        metric_labels (tuple): The parser and collection labels of the stage metrics.
     """
 
     def __init__(self, payload: dict):
@@ -42,7 +60,12 @@ class STACItemCreator:
         logger.info(f"Initializing STAC item creator")
         if not isinstance(payload, dict):
             raise ValueError("Payload should be a dictionary.")
-        self.payload = GenerateSTACPayload(**payload)
+        self.metric_labels = get_metric_labels(payload.get("parser"), payload.get("collection"))
+        with observe_stage(STAGE_VALIDATION, self.metric_labels):
+            self.payload = GenerateSTACPayload(**payload)
+        if not self.payload.metadata and self.payload.metadata_url:
+            with observe_stage(STAGE_METADATA_FETCH, self.metric_labels):
+                self.payload.fetch_metadata()
         self.item = Item(
             id=str(uuid.uuid4()),
             geometry=None,
@@ -51,22 +74,31 @@ class STACItemCreator:
             properties={},
         )
         self.generated_rio_stac_items = []
+        self.raster_inspections = []
         logger.info(f"Initialized STAC item creator")
 
-    def create_item(self) -> Item:
+    def create_item(self) -> dict:
         """
         Create a STAC Item from the provided dictionary.
 
+        The item is converted to a dictionary once, the parsed metadata is merged into
+        it in place, and the result is validated once.
+
         Returns:
-            Item: The created STAC item.
+            dict: The created STAC item.
         """
         logger.info(f"Creating STAC item from payload")
+        # Later lookups are served from the registry
+        with observe_stage(STAGE_PARSER_LOAD, self.metric_labels):
+            MetadataParserManager.get_parser(self.payload.parser)
         self._add_assets()
         self._add_tiff_stac_metadata()
 
+        # The dictionary shares its nested values with self.item, which is not used afterwards
+        item = self.item.to_dict()
         if self.payload.parser:
-            self._add_parsed_metadata()
-        return self.item.to_dict()
+            self._add_parsed_metadata(item)
+        return validate_item(item)
 
     def _add_assets(self):
         """
@@ -91,21 +123,65 @@ class STACItemCreator:
                 self.item.add_asset(key=asset_key, asset=asset)
         logger.info(f"Added assets to STAC item")
 
-    def _generate_and_add_metadata(self, filepath, add_asset=True):
+    def _generate_metadata(self, filepath) -> RasterInspection:
         """
-        Generate STAC metadata for the given TIFF file using rio_stac and add to the STAC item.
+        Inspect the given TIFF file, generating its STAC metadata using rio_stac and checking its COG layout.
+
+        This only reads the file and does not touch the STAC item, so it is safe to run
+        for several files at once.
+        """
+        logger.info(f"Generating metadata for {filepath}")
+        statistics_method = self._get_statistics_method()
+        footprint_method = self._get_footprint_method()
+        cache = get_raster_cache()
+        cache_key = None
+        inspection = None
+        if cache is not None:
+            # The media type depends on whether the COG layout is checked
+            check_cog = os.getenv("CHECK_COG_TYPE", "false").lower() == "true"
+            variant = f"statistics={statistics_method}|cog={check_cog}"
+            if footprint_method != FOOTPRINT_BOUNDS:
+                variant += f"|footprint={footprint_method}:{get_footprint_settings()}"
+            cache_key = cache.get_key(filepath, variant)
+            if cache_key is not None:
+                inspection = cache.get(cache_key)
+                if inspection is not None:
+                    logger.info(f"Using cached metadata for {filepath.split('?')[0]}")
+
+        if inspection is None:
+            inspection = inspect_raster(filepath, statistics_method, self.metric_labels, footprint_method)
+            if cache_key is not None:
+                cache.put(cache_key, inspection)
+        else:
+            inspection.filepath = filepath
+
+        inspection.generated_stac.assets["asset"].media_type = inspection.media_type
+        inspection.generated_stac.assets["asset"].href = filepath.split('?')[0]
+        logger.info(f"Generated metadata for {filepath}")
+        return inspection
+
+    def _get_statistics_method(self) -> str:
+        """
+        Return how band statistics are computed: set by the payload, else by the parser, else by default.
         """
         parser = MetadataParserManager.get_parser(self.payload.parser)
-        logger.info(f"Generating metadata for {filepath} using {parser}")
-        generated_stac = rio_stac.create_stac_item(
-            get_mounted_file(filepath),
-            with_eo=True,
-            with_proj=True,
-            with_raster=True,
-            geom_densify_pts=21,
-        )
-        logger.info(f"Generated metadata for {filepath} using {parser}")
+        return resolve_statistics_method(self.payload.raster_statistics, parser)
+
+    def _get_footprint_method(self) -> str:
+        """
+        Return how the item geometry is computed: set by the payload, else by the parser, else by default.
+        """
+        parser = MetadataParserManager.get_parser(self.payload.parser)
+        return resolve_footprint_method(self.payload.footprint, parser)
+
+    def _add_generated_metadata(self, filepath, inspection: RasterInspection, add_asset=True):
+        """
+        Add STAC metadata generated by _generate_metadata for the given TIFF file to the STAC item.
+        """
+        parser = MetadataParserManager.get_parser(self.payload.parser)
+        generated_stac = inspection.generated_stac
         self.generated_rio_stac_items.append(generated_stac)
+        self.raster_inspections.append(inspection)
         logger.info(f"Added metadata into generated_rio_stac_items for {filepath} using {parser}")
 
         if add_asset:
@@ -118,8 +194,6 @@ class STACItemCreator:
                 logger.info(
                     f"Could not get asset key for {filepath} using {parser} to STAC item, using filename {asset_key} as asset key")
 
-            generated_stac.assets["asset"].media_type = return_tiff_media_type(filepath)
-            generated_stac.assets["asset"].href = filepath.split('?')[0]
             logger.info(f"Adding asset to stac record for {filepath} using {parser} to STAC item")
             self.item.add_asset(
                 key=asset_key, asset=generated_stac.assets["asset"]
@@ -128,54 +202,108 @@ class STACItemCreator:
         logger.info(f"Added metadata for {filepath} using {parser} to STAC item")
         return generated_stac
 
+    def _generate_and_add_metadata(self, filepath, add_asset=True):
+        """
+        Generate STAC metadata for the given TIFF file using rio_stac and add to the STAC item.
+        """
+        inspection = self._generate_metadata(filepath)
+        return self._add_generated_metadata(filepath, inspection, add_asset=add_asset)
+
     def _add_tiff_stac_metadata(self):
         """
         Generate STAC metadata for each TIFF file using rio_stac, and add to the STAC item.
+
+        The TIFF files are read concurrently on the asset executor, the results are then
+        added to the STAC item in the order of the files in the payload.
         """
         logger.info(f"Adding TIFF STAC metadata to STAC item from payload")
-        tiff_filepath = None
-        for filepath in self.payload.files:
-            if is_tiff(filepath):
-                generated_item = self._generate_and_add_metadata(filepath)
-                tiff_filepath = filepath
+        tiff_filepaths = [filepath for filepath in self.payload.files if is_tiff(filepath)]
+
+        if len(tiff_filepaths) > 1:
+            inspections = list(
+                get_asset_executor().map(self._generate_metadata, tiff_filepaths)
+            )
+        else:
+            inspections = [self._generate_metadata(filepath) for filepath in tiff_filepaths]
+
+        for filepath, inspection in zip(tiff_filepaths, inspections):
+            self._add_generated_metadata(filepath, inspection)
 
         if not self.generated_rio_stac_items:
             raise ValueError("No rio_stac generated items found.")
 
+        # The item level metadata comes from the last TIFF of the payload, its footprint
+        # covers the footprints of every TIFF
+        inspection = self.raster_inspections[-1]
+        generated_item = inspection.generated_stac
         self.item.properties.update(generated_item.properties)
-        self.item.bbox = generated_item.bbox
-        self.item.geometry = generated_item.geometry
+        self.item.geometry, self.item.bbox = union_footprints(
+            [generated.geometry for generated in self.generated_rio_stac_items],
+            [generated.bbox for generated in self.generated_rio_stac_items],
+        )
         self.item.stac_extensions = generated_item.stac_extensions
 
-        if tiff_filepath:
-            logger.info(f"Opening {tiff_filepath} to get TIFFTAG_DATETIME")
-            with rasterio.open(get_mounted_file(tiff_filepath)) as ds:
-                tags = ds.tags()
-                tag_datetime = tags.get("TIFFTAG_DATETIME")  # 2022:09:09 15:27:53
-                if tag_datetime is not None:
-                    self.item.datetime = datetime.datetime.strptime(
-                        tag_datetime, "%Y:%m:%d %H:%M:%S"
-                    )
+        tag_datetime = inspection.tags.get("TIFFTAG_DATETIME")  # 2022:09:09 15:27:53
+        if tag_datetime is not None:
+            self.item.datetime = datetime.datetime.strptime(
+                tag_datetime, "%Y:%m:%d %H:%M:%S"
+            )
 
-                self.item.properties["license"] = os.getenv(
-                    "STAC_LICENSE_TYPE", "proprietary"
-                )
+        self.item.properties["license"] = os.getenv(
+            "STAC_LICENSE_TYPE", "proprietary"
+        )
 
-                tag_resolution = ds.res
-                if tag_resolution is not None:
-                    self.item.properties["gsd"] = tag_resolution[0]
-            logger.info(f"Closed {tiff_filepath}")
+        tag_resolution = inspection.resolution
+        if tag_resolution is not None:
+            self.item.properties["gsd"] = tag_resolution[0]
 
-    def _add_parsed_metadata(self):
+    def _add_parsed_metadata(self, item: dict):
         """
-        Parse the metadata using the appropriate parser and add it to the STAC item.
+        Parse the metadata using the appropriate parser and merge it into the STAC item dictionary.
         """
         # Using MetadataParserManager to get the appropriate parser
         parser = MetadataParserManager.get_parser(self.payload.parser)
 
-        metadata_stac_item = parser.parse(self.payload)
+        with observe_stage(STAGE_PARSE, self.metric_labels):
+            metadata_stac_item = parser.parse(self.payload)
 
-        # Now merge the metadata_stac_item into the item
-        self.item = Item.from_dict(
-            merge_stac_items(self.item.to_dict(), metadata_stac_item)
-        )
+        # Now merge the metadata_stac_item into the item, without copying it
+        with observe_stage(STAGE_MERGE, self.metric_labels):
+            merge_stac_items_in_place(item, metadata_stac_item)
+
+
+def validate_item(item: dict) -> dict:
+    """
+    Check that a STAC item dictionary has the fields of an item, and normalize its datetimes.
+
+    This replaces rebuilding a pystac Item from the dictionary, which checked the same
+    fields and formatted the datetimes the same way.
+
+    Args:
+        item (dict): The STAC item, which is updated in place.
+
+    Returns:
+        dict: The item.
+
+    Raises:
+        ValueError: If a required field is missing or a datetime can not be parsed.
+    """
+    for field in ("type", "stac_version", "id", "geometry", "properties", "assets", "links"):
+        if field not in item:
+            raise ValueError(f"The STAC item is missing the {field} field.")
+
+    properties = item["properties"]
+    for field in ("datetime", "start_datetime", "end_datetime"):
+        value = properties.get(field)
+        if value is not None:
+            try:
+                properties[field] = datetime_to_str(str_to_datetime(value))
+            except ValueError as e:
+                raise ValueError(f"Invalid {field} {value} in the STAC item: {e}")
+
+    if properties.get("datetime") is None and (
+        properties.get("start_datetime") is None or properties.get("end_datetime") is None
+    ):
+        raise ValueError("The STAC item needs a datetime, or a start_datetime and end_datetime.")
+
+    return item
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Dict
+
+import orjson
+from pydantic import ValidationError
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .executors import get_generation_max_workers
+from .job_manager import generate_and_publish
+from ..models import GenerateSTACPayload, MetadataFetchError
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the generated entries
+_DONE = object()
+
+
+def get_stream_max_in_flight() -> int:
+    """
+    Return the number of payloads of a stream generated at the same time.
+
+    Reads `STREAM_MAX_IN_FLIGHT`, defaults to the number of generation workers.
+    """
+    return int(os.getenv("STREAM_MAX_IN_FLIGHT") or get_generation_max_workers())
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    A streaming response that is sent while the request body is still being read.
+
+    StreamingResponse listens for the client disconnecting by reading request messages,
+    which would take the chunks of a body that is read while the response is streamed.
+    Here the body reader sees the disconnection instead, and sending fails once it happened.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split a stream of byte chunks into lines, skipping blank ones.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def _generate_entry(index: int, line: bytes) -> Dict[str, Any]:
+    """
+    Generate the item of one NDJSON line, returning an entry like the batch endpoint does.
+    """
+    try:
+        payload = GenerateSTACPayload(**orjson.loads(line))
+    except (orjson.JSONDecodeError, ValidationError, TypeError) as e:
+        return {"index": index, "status": "error", "detail": f"Invalid payload: {e}"}
+
+    try:
+        result = await generate_and_publish(payload)
+    except MetadataFetchError as e:
+        return {"index": index, "status": "error", "detail": f"Invalid payload: {e}"}
+    except Exception as e:
+        logger.exception(e)
+        return {"index": index, "status": "error", "detail": str(e)}
+    return {"index": index, "status": "success", "result": result}
+
+
+async def generate_stream(
+    chunks: AsyncIterator[bytes], max_in_flight: int = None
+) -> AsyncIterator[bytes]:
+    """
+    Generate STAC items for a stream of NDJSON payloads, yielding NDJSON entries as they finish.
+
+    At most `max_in_flight` payloads (STREAM_MAX_IN_FLIGHT by default) are being generated
+    or waiting to be sent at any time. The input is not read further until one of them has
+    been sent, so a slow client, on either side, holds back the whole pipeline and memory
+    stays bounded whatever the length of the stream.
+
+    Args:
+        chunks: The request body, as an async iterator of byte chunks.
+        max_in_flight (int, optional): The number of payloads processed at the same time.
+
+    Yields:
+        bytes: One line per payload, in completion order, with the "index" of the payload in
+        the stream and a "status" of "success" (and a "result") or "error" (and a "detail").
+    """
+    max_in_flight = max_in_flight or get_stream_max_in_flight()
+    slots = asyncio.Semaphore(max_in_flight)
+    entries: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+
+    async def process(index, line):
+        await entries.put(await _generate_entry(index, line))
+
+    async def read():
+        try:
+            index = 0
+            async for line in _iter_lines(chunks):
+                # Released once the entry has been sent to the client
+                await slots.acquire()
+                task = asyncio.ensure_future(process(index, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+        except Exception as e:
+            logger.exception(e)
+            await entries.put({"index": None, "status": "error", "detail": f"Reading the stream failed: {e}"})
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await entries.put(_DONE)
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            entry = await entries.get()
+            if entry is _DONE:
+                break
+            yield orjson.dumps(entry, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+            if entry["index"] is not None:
+                slots.release()
+    finally:
+        # The client went away, stop reading and generating
+        reader.cancel()
+        for task in list(tasks):
+            task.cancel()
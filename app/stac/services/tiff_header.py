@@ -0,0 +1,381 @@
+import logging
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from .block_cache import get_cached_url
+from .http_fetch import get_fetch_timeout, get_http_session
+
+logger = logging.getLogger(__name__)
+
+# TIFF tags needed to validate the layout of a COG
+NEW_SUBFILE_TYPE = 254
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+STRIP_OFFSETS = 273
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+
+# NewSubfileType flags
+REDUCED_RESOLUTION = 0x1
+TRANSPARENCY_MASK = 0x4
+
+# TIFF field types: (struct format, size in bytes)
+FIELD_TYPES = {
+    1: ("B", 1),  # BYTE
+    2: ("c", 1),  # ASCII
+    3: ("H", 2),  # SHORT
+    4: ("I", 4),  # LONG
+    5: ("II", 8),  # RATIONAL
+    6: ("b", 1),  # SBYTE
+    7: ("c", 1),  # UNDEFINED
+    8: ("h", 2),  # SSHORT
+    9: ("i", 4),  # SLONG
+    10: ("ii", 8),  # SRATIONAL
+    11: ("f", 4),  # FLOAT
+    12: ("d", 8),  # DOUBLE
+    13: ("I", 4),  # IFD
+    16: ("Q", 8),  # LONG8
+    17: ("q", 8),  # SLONG8
+    18: ("Q", 8),  # IFD8
+}
+
+SUPPORTED_SCHEMES = ("", "file", "http", "https")
+
+
+class TiffHeaderError(Exception):
+    """
+    Raised when a file can not be read or parsed as a TIFF.
+    """
+
+
+class RangeReader:
+    """
+    Reads byte ranges of a local file or of a HTTP(S) URL, caching what has been read.
+
+    Remote files are read with HTTP range requests of at least `block_size` bytes,
+    and no more than `max_bytes` bytes are read in total.
+
+    Attributes:
+        path (str): The path or URL being read.
+        requests_made (int): The number of reads made against the file or server.
+        bytes_read (int): The number of bytes read from the file or server.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        block_size: int = 16384,
+        max_bytes: int = 1048576,
+        session: Optional[requests.Session] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.path = path
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self.session = session or get_http_session()
+        self.timeout = timeout or get_fetch_timeout()
+        self.requests_made = 0
+        self.bytes_read = 0
+        self._ranges: List[Tuple[int, bytes]] = []
+        self.remote = urlparse(path).scheme in ("http", "https")
+        # Remote files are read through the block cache when it is enabled
+        self.url = get_cached_url(path) if self.remote else path
+
+    def read(self, offset: int, size: int) -> bytes:
+        """
+        Return `size` bytes starting at `offset`, reading them if they are not cached.
+        """
+        for start, data in self._ranges:
+            if start <= offset and offset + size <= start + len(data):
+                return data[offset - start:offset - start + size]
+
+        length = max(size, self.block_size)
+        if self.bytes_read + length > self.max_bytes:
+            raise TiffHeaderError(
+                f"Reading the TIFF header of {self.path} needs more than {self.max_bytes} bytes"
+            )
+        data = self._fetch(offset, length)
+        self.requests_made += 1
+        self.bytes_read += len(data)
+        if len(data) < size:
+            raise TiffHeaderError(f"Unexpected end of file in {self.path} at byte {offset}")
+        self._ranges.append((offset, data))
+        return data[:size]
+
+    def _fetch(self, offset: int, length: int) -> bytes:
+        if not self.remote:
+            with open(urlparse(self.path).path if self.path.startswith("file:") else self.path, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+
+        response = self.session.get(
+            self.url,
+            headers={"Range": f"bytes={offset}-{offset + length - 1}"},
+            timeout=self.timeout,
+            stream=True,
+        )
+        try:
+            if response.status_code == 416:
+                return b""
+            response.raise_for_status()
+            if response.status_code == 206:
+                return response.content
+            # The server ignored the range, only keep what was asked for
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                data += chunk
+                if len(data) >= offset + length:
+                    break
+            return bytes(data[offset:offset + length])
+        finally:
+            response.close()
+
+
+class TiffIFD:
+    """
+    The tags of an image file directory that are needed to validate a COG.
+
+    Attributes:
+        offset (int): The offset of the IFD in the file.
+        width (int): The width of the image.
+        height (int): The height of the image.
+        subfile_type (int): The NewSubfileType flags of the image.
+        tile_width (int): The tile width, or None if the image is not tiled.
+        first_block_offset (int): The offset of the first tile or strip, 0 if it is missing.
+    """
+
+    def __init__(self, offset, width, height, subfile_type, tile_width, first_block_offset):
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.subfile_type = subfile_type
+        self.tile_width = tile_width
+        self.first_block_offset = first_block_offset
+
+    @property
+    def is_tiled(self) -> bool:
+        # Same definition as rasterio, a single tile spanning the width is not tiled
+        return self.tile_width is not None and self.tile_width != self.width
+
+    @property
+    def is_overview(self) -> bool:
+        return bool(self.subfile_type & REDUCED_RESOLUTION) and not self.is_mask
+
+    @property
+    def is_mask(self) -> bool:
+        return bool(self.subfile_type & TRANSPARENCY_MASK)
+
+
+def read_tiff_ifds(reader: RangeReader, max_ifds: int = 64) -> List[TiffIFD]:
+    """
+    Parse the chain of IFDs of a TIFF or BigTIFF file.
+
+    Only the IFD entries and the first value of the tile or strip offsets are read.
+
+    Raises:
+        TiffHeaderError: If the file is not a TIFF.
+    """
+    header = reader.read(0, 16)
+    if header[:2] == b"II":
+        endian = "<"
+    elif header[:2] == b"MM":
+        endian = ">"
+    else:
+        raise TiffHeaderError(f"{reader.path} is not a TIFF file")
+
+    magic = struct.unpack(endian + "H", header[2:4])[0]
+    if magic == 42:
+        bigtiff = False
+        ifd_offset = struct.unpack(endian + "I", header[4:8])[0]
+    elif magic == 43:
+        bigtiff = True
+        ifd_offset = struct.unpack(endian + "Q", header[8:16])[0]
+    else:
+        raise TiffHeaderError(f"{reader.path} is not a TIFF file")
+
+    count_format, count_size = ("Q", 8) if bigtiff else ("H", 2)
+    entry_size = 20 if bigtiff else 12
+    value_format, value_size = ("Q", 8) if bigtiff else ("I", 4)
+
+    ifds = []
+    while ifd_offset and len(ifds) < max_ifds:
+        entry_count = struct.unpack(endian + count_format, reader.read(ifd_offset, count_size))[0]
+        data = reader.read(ifd_offset + count_size, entry_count * entry_size + value_size)
+
+        tags: Dict[int, Tuple[int, int, bytes]] = {}
+        for index in range(entry_count):
+            entry = data[index * entry_size:(index + 1) * entry_size]
+            if bigtiff:
+                tag, field_type, count = struct.unpack(endian + "HHQ", entry[:12])
+                value = entry[12:20]
+            else:
+                tag, field_type, count = struct.unpack(endian + "HHI", entry[:8])
+                value = entry[8:12]
+            tags[tag] = (field_type, count, value)
+
+        def first_value(tag, default=None):
+            if tag not in tags:
+                return default
+            field_type, count, value = tags[tag]
+            if field_type not in FIELD_TYPES or count == 0:
+                return default
+            fmt, size = FIELD_TYPES[field_type]
+            if count * size > value_size:
+                # The values do not fit in the entry, which holds their offset instead
+                offset = struct.unpack(endian + value_format, value)[0]
+                value = reader.read(offset, size)
+            return struct.unpack(endian + fmt, value[:size])[0]
+
+        block_offsets = TILE_OFFSETS if TILE_OFFSETS in tags else STRIP_OFFSETS
+        ifds.append(
+            TiffIFD(
+                offset=ifd_offset,
+                width=first_value(IMAGE_WIDTH, 0),
+                height=first_value(IMAGE_LENGTH, 0),
+                subfile_type=first_value(NEW_SUBFILE_TYPE, 0),
+                tile_width=first_value(TILE_WIDTH),
+                first_block_offset=first_value(block_offsets, 0),
+            )
+        )
+        ifd_offset = struct.unpack(endian + value_format, data[entry_count * entry_size:])[0]
+
+    return ifds
+
+
+def supports_header_validation(src_path: str) -> bool:
+    """
+    Return True if the file can be read by RangeReader (a local path or a HTTP(S) URL).
+    """
+    return urlparse(str(src_path)).scheme in SUPPORTED_SCHEMES and not str(src_path).startswith("/vsi")
+
+
+def validate_cog_header(
+    src_path: str,
+    strict: bool = False,
+    reader: Optional[RangeReader] = None,
+) -> Tuple[bool, List[str], List[str]]:
+    """
+    Validate the layout of a Cloud Optimized GeoTIFF from its header only.
+
+    This reports the same errors and warnings as file_operations.is_cog, but instead of
+    opening the file with GDAL it reads the first kilobytes of the file (and more with
+    bounded range requests if the IFDs do not fit) and parses the TIFF/BigTIFF IFD chain.
+
+    Args:
+        src_path (str): A local path or a HTTP(S) URL.
+        strict (bool): Treat warnings as errors.
+        reader (RangeReader, optional): The reader to use, e.g. to share its cache.
+
+    Returns:
+        tuple: (is_valid, errors, warnings)
+
+    Raises:
+        TiffHeaderError: If the header could not be read within the byte budget, or
+            the overviews of a local file are in an external .ovr file.
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+    reader = reader or RangeReader(
+        str(src_path),
+        block_size=int(os.getenv("COG_HEADER_BYTES", "16384")),
+        max_bytes=int(os.getenv("COG_HEADER_MAX_BYTES", "1048576")),
+    )
+
+    # GDAL merges the overviews of a sidecar .ovr file into the checks, leave those to it
+    if not reader.remote and os.path.exists(f"{src_path}.ovr"):
+        raise TiffHeaderError(f"Overviews of {src_path} are in an external .ovr file")
+
+    if reader.read(0, 4) not in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        errors.append("The file is not a GeoTIFF")
+        return False, errors, warnings
+
+    ifds = read_tiff_ifds(reader)
+    if not ifds:
+        raise TiffHeaderError(f"No image found in {src_path}")
+
+    main = ifds[0]
+    overviews = [ifd for ifd in ifds[1:] if ifd.is_overview]
+    # Decimation factors, computed like rasterio does from the overview widths
+    decimations = [int(round(main.width / ifd.width)) if ifd.width else 0 for ifd in overviews]
+
+    if main.width > 512 and main.height > 512:
+        if not main.is_tiled:
+            errors.append("The file is greater than 512xH or 512xW, but is not tiled")
+
+        if not overviews:
+            warnings.append(
+                "The file is greater than 512xH or 512xW, it is recommended "
+                "to include internal overviews"
+            )
+
+    if main.offset > 300:
+        errors.append(
+            f"The offset of the main IFD should be < 300. It is {main.offset} instead"
+        )
+
+    ifd_offsets = [main.offset]
+
+    if decimations and decimations != sorted(decimations):
+        errors.append("Overviews should be sorted")
+
+    for ix, (dec, ovr) in enumerate(zip(decimations, overviews)):
+        if not dec > 1:
+            errors.append("Invalid Decimation {} for overview level {}".format(dec, ix))
+
+        # Check that the IFD of descending overviews are sorted by increasing offsets
+        ifd_offsets.append(ovr.offset)
+        if ifd_offsets[-1] < ifd_offsets[-2]:
+            if ix == 0:
+                errors.append(
+                    "The offset of the IFD for overview of index {} is {}, "
+                    "whereas it should be greater than the one of the main "
+                    "image, which is at byte {}".format(ix, ifd_offsets[-1], ifd_offsets[-2])
+                )
+            else:
+                errors.append(
+                    "The offset of the IFD for overview of index {} is {}, "
+                    "whereas it should be greater than the one of index {}, "
+                    "which is at byte {}".format(ix, ifd_offsets[-1], ix - 1, ifd_offsets[-2])
+                )
+
+    data_offsets = [main.first_block_offset] + [ovr.first_block_offset for ovr in overviews]
+
+    if data_offsets[-1] != 0 and data_offsets[-1] < ifd_offsets[-1]:
+        if len(overviews) > 0:
+            errors.append(
+                "The offset of the first block of the smallest overview "
+                "should be after its IFD"
+            )
+        else:
+            errors.append(
+                "The offset of the first block of the image should be after its IFD"
+            )
+
+    for i in range(len(data_offsets) - 2, 0, -1):
+        if data_offsets[i] < data_offsets[i + 1]:
+            errors.append(
+                "The offset of the first block of overview of index {} should "
+                "be after the one of the overview of index {}".format(i - 1, i)
+            )
+
+    if len(data_offsets) >= 2 and data_offsets[0] < data_offsets[1]:
+        errors.append(
+            "The offset of the first block of the main resolution image "
+            "should be after the one of the overview of index {}".format(len(overviews) - 1)
+        )
+
+    for ix, ovr in enumerate(overviews):
+        if ovr.width > 512 and ovr.height > 512 and not ovr.is_tiled:
+            errors.append("Overview of index {} is not tiled".format(ix))
+
+    logger.debug(
+        f"Validated COG header of {src_path} with {reader.requests_made} reads of {reader.bytes_read} bytes"
+    )
+    is_valid = False if errors or (warnings and strict) else True
+
+    return is_valid, errors, warnings
@@ -1,9 +1,13 @@
-from os import getenv
+from typing import List
 
-from fastapi import APIRouter, HTTPException
-from .models import GenerateSTACPayload
-from .services.stac_item_creator import STACItemCreator
-from .services.publisher.publisher_utility import publish_to_stac_fastapi
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from .models import GenerateSTACPayload, MetadataFetchError
+from .services.batch_generator import generate_batch
+from .services.job_manager import JobQueueFullError, generate_and_publish, job_manager
+from .services.publisher.publish_queue import PublishQueueFullError, publish_queue
+from .services.request_coalescer import generation_coalescer, get_payload_fingerprint
+from .services.stream_generator import DuplexStreamingResponse, generate_stream
 
 import json
 import logging
@@ -11,36 +15,139 @@ import logging
 router = APIRouter()
 
 
-@router.post("/stac/generate")
+@router.post("/stac/generate", response_class=ORJSONResponse)
 async def generate_stac(item: GenerateSTACPayload):
     """
     Generate a STAC (SpatioTemporal Asset Catalog) item from the provided payload.
 
     This endpoint receives a POST request containing data for a STAC item generation.
     The payload (item) is passed to the STACItemCreator service which handles the creation
-    of the STAC item.
+    of the STAC item. The creation is blocking (GDAL reads and metadata fetches), so it runs
+    on the generation executor and other requests are served in the meantime.
+
+    Identical payloads (see get_payload_fingerprint) received while one is being generated
+    share its generation and publication, and its result can be reused for
+    GENERATE_COALESCE_TTL seconds.
 
     Args:
         item (GenerateSTACPayload): The payload received from the POST request.
 
     Returns:
-        GenerateSTACPayload: The created STAC item.
+        ORJSONResponse: The created STAC item, or its URL once published. It is serialized
+        with orjson directly, skipping FastAPI's JSON encoder.
 
     Raises:
-        HTTPException: If the STAC item creation fails.
+        HTTPException: If the STAC item creation fails, 422 if the metadata can not be
+        fetched from metadata_url, 503 if the publish queue is full.
     """
     try:
-        stac = STACItemCreator(item.dict()).create_item()
+        result = await generation_coalescer.run(
+            get_payload_fingerprint(item), lambda: generate_and_publish(item)
+        )
+    except MetadataFetchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except PublishQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logging.exception(e)
         raise HTTPException(status_code=500, detail=str(e))
-    
-    collection = item.collection or item.parser or "default"
-    
-    if getenv("HTTP_PUBLISH_TO_STAC_API").lower() == "true":
-        try:
-            return publish_to_stac_fastapi(stac, collection)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-    return stac
+
+    return ORJSONResponse(result)
+
+
+@router.post("/stac/generate/batch", response_class=ORJSONResponse)
+async def generate_stac_batch(items: List[GenerateSTACPayload]):
+    """
+    Generate STAC items for a list of payloads in parallel.
+
+    Each payload is processed by STACItemCreator in a pool of worker processes
+    (sized by BATCH_MAX_WORKERS), and published to the STAC API when
+    HTTP_PUBLISH_TO_STAC_API is enabled, exactly as `/stac/generate` would.
+
+    Args:
+        items (List[GenerateSTACPayload]): The payloads received from the POST request.
+
+    Returns:
+        list: One entry per payload, in request order, with a "status" of "success"
+        and the "result", or a "status" of "error" and the error "detail".
+    """
+    return ORJSONResponse(await generate_batch([item.dict() for item in items]))
+
+
+@router.post("/stac/generate/stream")
+async def generate_stac_stream(request: Request):
+    """
+    Generate STAC items for a newline-delimited JSON stream of payloads.
+
+    The request body holds one GenerateSTACPayload per line. The items are streamed back
+    as NDJSON as each one finishes, with at most STREAM_MAX_IN_FLIGHT payloads being
+    generated at once: the request body is only read as fast as results are consumed, so
+    neither side holds the whole stream in memory.
+
+    Args:
+        request (Request): The request, with an `application/x-ndjson` body.
+
+    Returns:
+        DuplexStreamingResponse: One line per payload, in completion order, with the "index" of
+        the payload in the stream and a "status" of "success" and the "result" (the item,
+        or its URL once published), or a "status" of "error" and the error "detail".
+    """
+    return DuplexStreamingResponse(
+        generate_stream(request.stream()), media_type="application/x-ndjson"
+    )
+
+
+@router.post("/stac/jobs", status_code=202)
+async def submit_stac_job(item: GenerateSTACPayload):
+    """
+    Submit a STAC item generation job and return its ID right away.
+
+    The payload is processed in the background like `/stac/generate` would, by a bounded
+    number of job workers (JOB_CONCURRENCY). Use `/stac/jobs/{job_id}` to follow the job.
+
+    Args:
+        item (GenerateSTACPayload): The payload received from the POST request.
+
+    Returns:
+        dict: The queued job, with its "id" and "status".
+
+    Raises:
+        HTTPException: 503 if the job queue is full.
+    """
+    try:
+        return await job_manager.submit(item)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/stac/jobs/{job_id}", response_class=ORJSONResponse)
+async def get_stac_job(job_id: str):
+    """
+    Return the status of a STAC item generation job, with its result once it has succeeded.
+
+    Args:
+        job_id (str): The ID returned when the job was submitted.
+
+    Returns:
+        dict: The job, with a "status" of "queued", "running", "succeeded" or "failed".
+
+    Raises:
+        HTTPException: 404 if the job is unknown or has expired.
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return ORJSONResponse(job)
+
+
+@router.get("/stac/publish-queue", response_class=ORJSONResponse)
+async def get_publish_queue():
+    """
+    Return the state of the write-behind publish queue.
+
+    Returns:
+        dict: Whether the queue is "enabled", and when it is its "depth" (items waiting to
+        be published), "lag_seconds" (age of the oldest of them) and "failed" (items given
+        up on after PUBLISH_QUEUE_MAX_ATTEMPTS attempts).
+    """
+    return ORJSONResponse(publish_queue.get_stats())
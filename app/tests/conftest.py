@@ -0,0 +1,93 @@
+import functools
+import http.server
+import io
+import os
+import threading
+
+import numpy
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+
+@pytest.fixture
+def make_geotiff(tmp_path):
+    """
+    Returns a factory writing a small synthetic GeoTIFF into a temporary directory.
+    """
+
+    def _make_geotiff(name="band.tif", width=256, height=256, count=1, **profile):
+        path = tmp_path / name
+        options = {
+            "driver": "GTiff",
+            "width": width,
+            "height": height,
+            "count": count,
+            "dtype": "uint8",
+            "crs": "EPSG:32630",
+            "transform": from_origin(500000, 5600000, 10, 10),
+            "nodata": 0,
+        }
+        options.update(profile)
+        data = numpy.arange(width * height, dtype="uint32").reshape(height, width) % 250 + 1
+        with rasterio.open(path, "w", **options) as dst:
+            for band in range(1, count + 1):
+                dst.write(data.astype(options["dtype"]), band)
+        return str(path)
+
+    return _make_geotiff
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves files like a blob store would, honouring single byte range requests.
+    """
+
+    def send_head(self):
+        self.server.requests.append((self.command, self.path))
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start, end = range_header.replace("bytes=", "").split("-")
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+        if start >= size:
+            self.send_error(416)
+            return None
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Last-Modified", self.date_time_string(int(os.path.getmtime(path))))
+        self.end_headers()
+        self.server.range_requests.append((self.path, start, end))
+        return io.BytesIO(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """
+    Serves the temporary directory over HTTP, returning the server.
+
+    The base URL is `server.url`, the requests are recorded in `server.requests` as (method, path)
+    and the byte ranges served in `server.range_requests` as (path, start, end).
+    """
+    handler = functools.partial(RangeRequestHandler, directory=str(tmp_path))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.requests = []
+    server.range_requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,35 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_batch.py`
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+client = TestClient(app)
+
+BATCH_ROUTE = "/stac/generate/batch"
+
+
+def test_generate_batch(make_geotiff, monkeypatch):
+    """
+    Tests that every payload of a batch gets its own success or error entry
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_batch.py::test_generate_batch
+    """
+    monkeypatch.setenv("BATCH_MAX_WORKERS", "2")
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    tiff = make_geotiff()
+    payloads = [
+        {"files": [tiff], "metadata": {"ID": "first"}, "parser": "example"},
+        {"files": ["readme.md"], "metadata": {"ID": "second"}, "parser": "example"},
+    ]
+
+    with TestClient(app) as batch_client:
+        response = batch_client.post(BATCH_ROUTE, json=payloads)
+
+    assert response.status_code == 200
+    entries = response.json()
+    assert [entry["index"] for entry in entries] == [0, 1]
+    assert entries[0]["status"] == "success"
+    assert entries[0]["result"]["id"] == "first"
+    assert entries[1]["status"] == "error"
+    assert "No rio_stac generated items found" in entries[1]["detail"]
@@ -0,0 +1,46 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_benchmarks.py`
+
+import copy
+
+from app.stac.services.file_operations import is_cog
+from benchmarks.rasters import make_raster
+from benchmarks.suite import compare_to_baseline, run_suite
+
+
+def test_synthetic_rasters(tmp_path):
+    """
+    Tests that the synthetic COGs are valid COGs and the striped rasters are not
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_benchmarks.py::test_synthetic_rasters
+    """
+    assert is_cog(make_raster(str(tmp_path), "cog", 1024, 2)) == (True, [], [])
+    assert not is_cog(make_raster(str(tmp_path), "striped-overviews", 1024, 2))[0]
+
+
+def test_suite_flags_regressions(tmp_path):
+    """
+    Tests that the suite measures every operation and flags results worse than the baseline
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_benchmarks.py::test_suite_flags_regressions
+    """
+    results = run_suite("quick", str(tmp_path), repeat=1, kinds=("cog",))
+
+    assert sorted(results) == [
+        f"cog-1024px-{bands}b/{operation}"
+        for bands in (1, 4)
+        for operation in ("create_item", "is_cog", "publish")
+    ]
+    create_item = results["cog-1024px-1b/create_item"]
+    assert create_item["requests"] > 0 and create_item["bytes"] > 0
+    assert {"validation", "rio_stac", "cog_validation"} <= set(create_item["stages"])
+    assert results["cog-1024px-1b/publish"]["requests"] == 1
+    assert compare_to_baseline(results, results) == []
+
+    baseline = copy.deepcopy(results)
+    baseline["cog-1024px-1b/is_cog"]["requests"] -= 1
+    baseline["cog-1024px-4b/create_item"]["ms"] = results["cog-1024px-4b/create_item"]["ms"] / 3 - 10
+    regressions = compare_to_baseline(results, baseline)
+    assert [regression.split(":")[0] for regression in regressions] == [
+        "cog-1024px-1b/is_cog",
+        "cog-1024px-4b/create_item",
+    ]
@@ -0,0 +1,120 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_block_cache.py`
+
+import pytest
+import rasterio
+import requests
+from rasterio.enums import Resampling
+
+from app.stac.services.block_cache import BlockCache, get_block_cache, get_cached_url, stop_block_cache_proxy
+from app.stac.services.metrics import generate_metrics
+from app.stac.services.stac_item_creator import STACItemCreator
+from benchmarks.stand_in import StandInServer
+
+
+@pytest.fixture
+def block_cache_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "blocks.db")
+    monkeypatch.setenv("BLOCK_CACHE_PATH", path)
+    monkeypatch.setenv("BLOCK_CACHE_BLOCK_SIZE", "16384")
+    monkeypatch.setenv("GDAL_READ_PROFILES", '{"127.0.0.1": {"BLOCK_CACHE": "YES"}}')
+    yield path
+    stop_block_cache_proxy()
+
+
+def test_remote_reads_are_served_from_the_block_cache(make_geotiff, tmp_path, block_cache_path, monkeypatch):
+    """
+    Tests that generating an item again only asks the server for the identity of its TIFF
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_block_cache.py::test_remote_reads_are_served_from_the_block_cache
+    """
+    monkeypatch.setenv("CHECK_COG_TYPE", "true")
+    path = make_geotiff("cog.tif", width=1024, height=1024, tiled=True)
+    with rasterio.open(path, "r+") as dst:
+        dst.build_overviews([2, 4], Resampling.nearest)
+
+    # The server runs in its own process, GDAL may hold the GIL while it waits for the proxy
+    with StandInServer(str(tmp_path)) as server:
+        def generate(signature):
+            payload = {"files": [f"{server.url}/cog.tif?sig={signature}"], "metadata": {"ID": "cog"}, "parser": "example"}
+            before = server.get_stats()
+            item = STACItemCreator(payload).create_item()
+            after = server.get_stats()
+            return item, after["requests"] - before["requests"], after["bytes"] - before["bytes"]
+
+        first, first_requests, first_bytes = generate("a")
+        second, second_requests, second_bytes = generate("b")
+
+    assert first_bytes > 0
+    # A request of the first byte to check that the file did not change
+    assert (second_requests, second_bytes) == (1, 1)
+    assert second["assets"]["cog.tif"] == first["assets"]["cog.tif"]
+    assert second["assets"]["cog.tif"]["href"] == f"{server.url}/cog.tif"
+
+    stats = get_block_cache().get_stats()
+    assert stats["misses"] > 0 and stats["hits"] >= stats["misses"]
+    assert stats["bytes_fetched"] == stats["bytes"] > 0
+    assert stats["bytes_saved"] > 0
+    assert 0.5 <= stats["hit_ratio"] < 1
+    metrics = dict(
+        line.split(" ") for line in generate_metrics()[0].decode().splitlines() if line.startswith("stac_generator_block_cache")
+    )
+    assert float(metrics["stac_generator_block_cache_saved_bytes_total"]) == stats["bytes_saved"]
+
+
+def test_block_cache_is_shared_and_evicts_least_recently_used(tmp_path):
+    """
+    Tests that caches opened on the same database share blocks and counters, and that the
+    least recently used blocks are evicted above the size cap
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_block_cache.py::test_block_cache_is_shared_and_evicts_least_recently_used
+    """
+    path = str(tmp_path / "blocks.db")
+    cache = BlockCache(path, block_size=4, max_bytes=12)
+    other = BlockCache(path, block_size=4, max_bytes=12)
+    key = cache.get_key("https://example.com/file.tif?sig=a", "etag:1")
+    assert key == other.get_key("https://example.com/file.tif?sig=b", "etag:1")
+
+    cache.put_blocks(key, {0: b"aaaa", 1: b"bbbb"})
+    assert other.get_blocks(key, 0, 5) == {0: b"aaaa", 1: b"bbbb"}
+    other.count(hits=2, bytes_saved=8)
+
+    cache.get_blocks(key, 1, 1)
+    # Reads are marked with the next write of their process
+    cache.flush()
+    other.put_blocks(key, {2: b"cccc", 3: b"dd"})
+    # Block 0 was used least recently
+    assert cache.get_blocks(key, 0, 3) == {1: b"bbbb", 2: b"cccc", 3: b"dd"}
+    assert cache.get_stats() == {
+        "hits": 2,
+        "misses": 0,
+        "bytes_saved": 8,
+        "bytes_fetched": 0,
+        "evictions": 1,
+        "hit_ratio": 1.0,
+        "blocks": 3,
+        "bytes": 10,
+    }
+
+
+def test_proxy_serves_suffix_ranges_and_refuses_others(tmp_path, block_cache_path):
+    """
+    Tests that the proxy serves the last bytes of a file, and answers ranges it can not serve with a 416
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_block_cache.py::test_proxy_serves_suffix_ranges_and_refuses_others
+    """
+    content = bytes(range(256)) * 100
+    (tmp_path / "file.bin").write_bytes(content)
+
+    with StandInServer(str(tmp_path)) as server:
+        url = get_cached_url(f"{server.url}/file.bin")
+        assert url != f"{server.url}/file.bin"
+
+        response = requests.get(url, headers={"Range": "bytes=-100"})
+        assert response.status_code == 206
+        assert response.content == content[-100:]
+        assert response.headers["Content-Range"] == f"bytes {len(content) - 100}-{len(content) - 1}/{len(content)}"
+
+        for range_header in ("bytes=0-1,5-6", "bytes=abc", f"bytes={len(content)}-"):
+            response = requests.get(url, headers={"Range": range_header})
+            assert response.status_code == 416
+            assert response.headers["Content-Range"] == f"bytes */{len(content)}"
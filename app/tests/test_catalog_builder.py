@@ -0,0 +1,74 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_catalog_builder.py`
+
+import json
+
+from app.cli import main
+from app.stac.services.catalog_builder import build_catalog, read_manifest
+
+
+def test_build_resumes_from_checkpoint(make_geotiff, tmp_path):
+    """
+    Tests that a build writes the items of an NDJSON manifest and skips them when run again
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_catalog_builder.py::test_build_resumes_from_checkpoint
+    """
+    manifest = tmp_path / "manifest.ndjson"
+    payloads = [
+        {"files": [make_geotiff("first.tif")], "metadata": {"ID": "first"}, "parser": "example"},
+        {"files": ["readme.md"], "metadata": {"ID": "second"}, "parser": "example"},
+    ]
+    manifest.write_text("\n".join(json.dumps(payload) for payload in payloads) + "\n")
+    output = tmp_path / "items.ndjson"
+
+    summary = build_catalog(str(manifest), str(output), workers=2)
+
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (1, 1, 0)
+    assert set(summary["timings"]) == {"mean", "p50", "p95", "max"}
+    items = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(item["id"], item["collection"]) for item in items] == [("first", "example")]
+    checkpoint = [json.loads(line) for line in (tmp_path / "items.ndjson.checkpoint").read_text().splitlines()]
+    assert sorted((entry["index"], entry["status"]) for entry in checkpoint) == [(0, "success"), (1, "error")]
+    assert all(entry["seconds"] > 0 for entry in checkpoint)
+
+    # Only the failed entry is generated again, and the first item is kept
+    summary = build_catalog(str(manifest), str(output), workers=2)
+
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (0, 1, 1)
+    assert len(output.read_text().splitlines()) == 1
+
+
+def test_build_static_catalog_from_csv(make_geotiff, tmp_path):
+    """
+    Tests that the CLI builds a static catalog from a CSV manifest
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_catalog_builder.py::test_build_static_catalog_from_csv
+    """
+    first, second = make_geotiff("first.tif"), make_geotiff("second.tif")
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(
+        "files,parser,collection,ID,metadata\n"
+        f"{first},example,scenes,first,\n"
+        f"{first};{second},example,scenes,both,\"{{\"\"source\"\": \"\"test\"\"}}\"\n"
+    )
+
+    assert list(read_manifest(str(manifest)))[1] == {
+        "files": [first, second],
+        "parser": "example",
+        "collection": "scenes",
+        "metadata": {"source": "test", "ID": "both"},
+    }
+
+    output = tmp_path / "catalog"
+    assert main(["build", str(manifest), str(output), "--format", "catalog", "--workers", "1", "--quiet"]) == 0
+
+    catalog = json.loads((output / "catalog.json").read_text())
+    assert [link["href"] for link in catalog["links"] if link["rel"] == "child"] == ["./scenes/collection.json"]
+    collection = json.loads((output / "scenes" / "collection.json").read_text())
+    assert [link["href"] for link in collection["links"] if link["rel"] == "item"] == [
+        "./both/both.json",
+        "./first/first.json",
+    ]
+    assert len(collection["extent"]["spatial"]["bbox"][0]) == 4
+    item = json.loads((output / "scenes" / "both" / "both.json").read_text())
+    assert item["collection"] == "scenes"
+    assert len(item["assets"]) == 2
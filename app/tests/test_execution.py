@@ -0,0 +1,112 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_execution.py`
+
+import asyncio
+import time
+
+import httpx
+import requests
+
+from app.main import app
+from app.stac import models
+from app.stac.services import job_manager
+from app.stac.services.request_coalescer import generation_coalescer
+
+
+class SlowCreator:
+    created = 0
+
+    def __init__(self, payload):
+        self.payload = payload
+        SlowCreator.created += 1
+
+    def create_item(self):
+        time.sleep(0.5)
+        return {"id": self.payload["metadata"]["ID"]}
+
+
+def test_generate_does_not_block_event_loop(monkeypatch):
+    """
+    Tests that blocking item generation runs on the executor, so concurrent requests overlap
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_execution.py::test_generate_does_not_block_event_loop
+    """
+    monkeypatch.setattr(job_manager, "STACItemCreator", SlowCreator)
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            payloads = [{"files": ["a.tif"], "metadata": {"ID": str(i)}} for i in range(4)]
+            start = time.perf_counter()
+            generate = [client.post("/stac/generate", json=payload) for payload in payloads]
+            responses = await asyncio.gather(*generate, client.get("/status"))
+            return time.perf_counter() - start, responses
+
+    elapsed, responses = asyncio.run(run())
+
+    assert all(response.status_code == 200 for response in responses)
+    assert [response.json()["id"] for response in responses[:4]] == ["0", "1", "2", "3"]
+    # Four sequential generations would take 2 seconds
+    assert elapsed < 1.5
+
+
+def test_identical_generate_requests_are_coalesced(monkeypatch):
+    """
+    Tests that identical concurrent requests share one generation, whose result can then be
+    reused for GENERATE_COALESCE_TTL seconds
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_execution.py::test_identical_generate_requests_are_coalesced
+    """
+    monkeypatch.setattr(job_manager, "STACItemCreator", SlowCreator)
+    monkeypatch.setattr(SlowCreator, "created", 0)
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    monkeypatch.delenv("GENERATE_COALESCE_TTL", raising=False)
+    generation_coalescer.clear()
+
+    async def run(payloads):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await asyncio.gather(*[client.post("/stac/generate", json=payload) for payload in payloads])
+
+    payloads = [{"files": ["https://host/a.tif?sig=1"], "metadata": {"ID": "a", "n": 1}} for _ in range(4)]
+    responses = asyncio.run(run(payloads + [
+        # Another signature may not be authorized to read the file
+        {"files": ["https://host/a.tif?sig=2"], "metadata": {"ID": "a", "n": 1}},
+        {"files": ["https://host/a.tif?sig=1"], "metadata": {"ID": "a", "n": 2}},
+    ]))
+
+    assert [response.json()["id"] for response in responses] == ["a"] * 6
+    assert SlowCreator.created == 3
+
+    # Results are not kept by default
+    asyncio.run(run(payloads[:1]))
+    assert SlowCreator.created == 4
+
+    monkeypatch.setenv("GENERATE_COALESCE_TTL", "60")
+    asyncio.run(run(payloads[:1]))
+    asyncio.run(run(payloads[:1]))
+    assert SlowCreator.created == 5
+
+
+def test_generate_with_unreachable_metadata_url(monkeypatch):
+    """
+    Tests that a metadata_url that can not be fetched is reported as an invalid payload
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_execution.py::test_generate_with_unreachable_metadata_url
+    """
+
+    def fetch_json(url):
+        raise requests.HTTPError("404 Client Error: Not Found")
+
+    monkeypatch.setattr(models, "fetch_json", fetch_json)
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    generation_coalescer.clear()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post(
+                "/stac/generate", json={"files": ["a.tif"], "metadata_url": "https://host/missing.json"}
+            )
+
+    response = asyncio.run(run())
+
+    assert response.status_code == 422
+    assert "Failed to fetch metadata from https://host/missing.json" in response.json()["detail"]
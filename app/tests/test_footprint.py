@@ -0,0 +1,67 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_footprint.py`
+
+import numpy
+import pytest
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.warp import transform_bounds
+
+from app.stac.services.footprint import get_valid_data_footprint
+from app.stac.services.stac_item_creator import STACItemCreator
+
+
+@pytest.fixture
+def collar_tiff(make_geotiff):
+    """
+    A raster whose valid pixels form a diamond, surrounded by a nodata collar.
+    """
+    path = make_geotiff("collar.tif", width=2048, height=2048, tiled=True)
+    rows, columns = numpy.mgrid[0:2048, 0:2048]
+    data = numpy.where(numpy.abs(rows - 1024) + numpy.abs(columns - 1024) < 1000, 100, 0).astype("uint8")
+    with rasterio.open(path, "r+") as dst:
+        dst.write(data, 1)
+        dst.build_overviews([2, 4, 8], Resampling.nearest)
+    return path
+
+
+def _polygon_area(ring):
+    x, y = numpy.asarray(ring).T
+    return abs(numpy.dot(x, numpy.roll(y, 1)) - numpy.dot(y, numpy.roll(x, 1))) / 2
+
+
+def test_valid_data_footprint(collar_tiff, monkeypatch):
+    """
+    Tests that the footprint follows the valid pixels of an overview with a few vertices
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_footprint.py::test_valid_data_footprint
+    """
+    monkeypatch.setenv("FOOTPRINT_MAX_SIZE", "256")
+    with rasterio.open(collar_tiff) as src:
+        footprint = get_valid_data_footprint(src)
+        west, south, east, north = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+
+    assert footprint["type"] == "Polygon"
+    exterior = footprint["coordinates"][0]
+    assert exterior[0] == exterior[-1]
+    assert len(exterior) < 20
+    # A diamond covers half of its bounding square
+    assert _polygon_area(exterior) / ((east - west) * (north - south)) == pytest.approx(0.48, abs=0.02)
+
+
+def test_footprint_method(collar_tiff, make_geotiff):
+    """
+    Tests that the item geometry and bbox are the valid data footprint only when requested
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_footprint.py::test_footprint_method
+    """
+    payload = {"files": [collar_tiff], "metadata": {"ID": "footprint"}, "parser": "example"}
+    bounds_item = STACItemCreator(payload).create_item()
+    item = STACItemCreator(dict(payload, footprint="valid-data")).create_item()
+
+    assert len(bounds_item["geometry"]["coordinates"][0]) > len(item["geometry"]["coordinates"][0])
+    # The diamond touches the bounds of the raster, less its collar
+    assert bounds_item["bbox"][0] < item["bbox"][0] < item["bbox"][2] < bounds_item["bbox"][2]
+
+    # Without nodata every pixel is valid and the bounds are kept without reading the mask
+    with rasterio.open(make_geotiff("valid.tif", nodata=None)) as src:
+        assert get_valid_data_footprint(src) is None
@@ -0,0 +1,68 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_gdal_profiles.py`
+
+import json
+import logging
+
+from app.stac.services.gdal_profiles import gdal_env, get_gdal_options
+from app.stac.services.raster_inspection import inspect_raster
+
+
+def test_profiles_are_selected_by_scheme_and_host(monkeypatch):
+    """
+    Tests that host profiles are merged over scheme profiles, and local files keep the defaults
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_gdal_profiles.py::test_profiles_are_selected_by_scheme_and_host
+    """
+    monkeypatch.setenv(
+        "GDAL_READ_PROFILES",
+        json.dumps({"https": {"VSI_CACHE_SIZE": 1000}, "data.example.com": {"GDAL_HTTP_MULTIPLEX": "NO"}}),
+    )
+
+    assert get_gdal_options("/data/band.tif") == {}
+    options = get_gdal_options("https://data.example.com/band.tif?sig=secret")
+    assert options["VSI_CACHE_SIZE"] == "1000"
+    assert options["GDAL_HTTP_MULTIPLEX"] == "NO"
+    assert options["GDAL_DISABLE_READDIR_ON_OPEN"] == "EMPTY_DIR"
+    assert get_gdal_options("https://other.example.com/band.tif")["GDAL_HTTP_MULTIPLEX"] == "YES"
+
+
+def test_remote_reads_are_counted_per_asset(make_geotiff, http_server, monkeypatch):
+    """
+    Tests that the requests and bytes read by GDAL for a remote raster are reported
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_gdal_profiles.py::test_remote_reads_are_counted_per_asset
+    """
+    monkeypatch.setenv("GDAL_READ_STATS", "true")
+    make_geotiff("counted.tif", width=1024, height=1024, tiled=True)
+
+    inspection = inspect_raster(f"{http_server.url}/counted.tif?sig=secret")
+
+    ranges = [request for request in http_server.range_requests if request[0].startswith("/counted.tif")]
+    assert ranges
+    assert inspection.read_stats["bytes"] == sum(end - start + 1 for _, start, end in ranges)
+    # The ranged GETs, and the HEAD request of the file size
+    assert inspection.read_stats["requests"] == len(ranges) + 1
+    # No sidecar files or directory listings were requested
+    assert {path.split("?")[0] for _, path in http_server.requests} == {"/counted.tif"}
+
+
+def test_counting_reads_restores_the_gdal_logger(make_geotiff, monkeypatch):
+    """
+    Tests that the rasterio GDAL logger gets its level and propagation back once reads are counted
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_gdal_profiles.py::test_counting_reads_restores_the_gdal_logger
+    """
+    monkeypatch.setenv("GDAL_READ_STATS", "true")
+    gdal_logger = logging.getLogger("rasterio._env")
+    level, propagate = gdal_logger.level, gdal_logger.propagate
+    gdal_logger.setLevel(logging.ERROR)
+    gdal_logger.propagate = False
+    try:
+        with gdal_env(str(make_geotiff("local.tif"))):
+            assert gdal_logger.isEnabledFor(logging.DEBUG)
+
+        assert (gdal_logger.level, gdal_logger.propagate) == (logging.ERROR, False)
+        assert not gdal_logger.isEnabledFor(logging.DEBUG)
+    finally:
+        gdal_logger.setLevel(level)
+        gdal_logger.propagate = propagate
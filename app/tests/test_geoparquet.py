@@ -0,0 +1,114 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_geoparquet.py`
+
+import json
+import struct
+
+import pytest
+
+from app.stac.services.geoparquet import GeoParquetWriter, flatten_item, geometry_to_wkb, read_items
+
+pyarrow = pytest.importorskip("pyarrow")
+import pyarrow.parquet  # noqa: E402
+
+
+def make_item(item_id, cloud_cover=10):
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "stac_extensions": [],
+        "id": item_id,
+        "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]},
+        "bbox": [0, 0, 1, 1],
+        "properties": {"datetime": "2022-09-09T15:27:53Z", "eo:cloud_cover": cloud_cover},
+        "links": [],
+        "assets": {
+            f"{item_id}.tif": {
+                "href": f"/data/{item_id}.tif",
+                "type": "image/tiff; application=geotiff",
+                "raster:bands": [
+                    {"data_type": "uint8", "statistics": {"minimum": 1, "maximum": 250}},
+                ],
+            }
+        },
+    }
+
+
+def test_geometry_to_wkb():
+    """
+    Tests that GeoJSON geometries are encoded as little endian ISO WKB
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_geoparquet.py::test_geometry_to_wkb
+    """
+    assert geometry_to_wkb({"type": "Point", "coordinates": [1, 2]}) == struct.pack("<BIdd", 1, 1, 1, 2)
+    assert geometry_to_wkb({"type": "Point", "coordinates": [1, 2, 3]}) == struct.pack("<BIddd", 1, 1001, 1, 2, 3)
+
+    polygon = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}
+    polygon_wkb = struct.pack("<BIII8d", 1, 3, 1, 4, 0, 0, 1, 0, 1, 1, 0, 0)
+    assert geometry_to_wkb(polygon) == polygon_wkb
+    multipolygon = {"type": "MultiPolygon", "coordinates": [polygon["coordinates"]] * 2}
+    assert geometry_to_wkb(multipolygon) == struct.pack("<BII", 1, 6, 2) + polygon_wkb * 2
+
+
+def test_writer_streams_row_groups(tmp_path):
+    """
+    Tests that items are written in row groups, flattened, and that an incompatible row group starts a new part
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_geoparquet.py::test_writer_streams_row_groups
+    """
+    completed = []
+    writer = GeoParquetWriter(str(tmp_path), row_group_size=2, on_part=completed.extend)
+    for index in range(5):
+        writer.write(make_item(f"item-{index}"), token=index)
+    # Only the full row groups are written until the part is closed
+    assert completed == [] and writer._rows
+    writer.write(make_item("text-cover", cloud_cover="low"), token=5)
+    writer.close()
+
+    assert completed == [0, 1, 2, 3, 4, 5]
+    assert len(writer.parts) == 2
+    first = pyarrow.parquet.ParquetFile(writer.parts[0])
+    assert first.metadata.num_row_groups == 3
+    assert json.loads(first.schema_arrow.metadata[b"geo"])["columns"]["geometry"]["encoding"] == "WKB"
+
+    table = first.read()
+    assert table.column("id").to_pylist() == [f"item-{index}" for index in range(5)]
+    assert table.schema.field("datetime").type == pyarrow.timestamp("us", tz="UTC")
+    assert table.column("geometry")[0].as_py() == flatten_item(make_item("item-0"))["geometry"]
+    asset = table.column("assets")[0].as_py()[0]
+    assert asset["key"] == "item-0.tif"
+    assert asset["raster:bands"][0]["statistics.maximum"] == 250
+    assert pyarrow.parquet.read_table(writer.parts[1]).column("eo:cloud_cover").to_pylist() == ["low"]
+
+
+def test_written_items_are_read_back(tmp_path):
+    """
+    Tests that the items of a written dataset are read back as they were written, across row groups and parts
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_geoparquet.py::test_written_items_are_read_back
+    """
+    items = [make_item(f"item-{index}") for index in range(3)]
+    items[0]["links"] = [{"rel": "self", "href": "https://stac.example.com/items/item-0"}]
+    items[1]["collection"] = "tests"
+    items[1]["geometry"] = {
+        "type": "MultiPolygon",
+        "coordinates": [[[[0, 0, 5], [1, 0, 5], [1, 1, 5], [0, 0, 5]]]],
+    }
+    items[1]["bbox"] = [0, 0, 5, 1, 1, 5]
+    items[1]["assets"]["item-1.tif"]["roles"] = ["data"]
+    items[2]["properties"] = {
+        "datetime": None,
+        "start_datetime": "2022-09-09T15:27:53.250000Z",
+        "end_datetime": "2022-09-10T00:00:00Z",
+        "view:angles": {"off_nadir": 3.5},
+    }
+    text_cover = make_item("text-cover", cloud_cover="low")
+
+    writer = GeoParquetWriter(str(tmp_path), row_group_size=2)
+    for item in items + [text_cover]:
+        writer.write(item)
+    writer.close()
+    assert len(writer.parts) == 2
+
+    read = {item["id"]: item for item in read_items(str(tmp_path))}
+    assert read == {item["id"]: item for item in items + [text_cover]}
+    assert b"stac-geoparquet" not in pyarrow.parquet.ParquetFile(writer.parts[0]).schema_arrow.metadata
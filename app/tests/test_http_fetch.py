@@ -0,0 +1,79 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_http_fetch.py`
+
+import json
+import threading
+import time
+
+import pytest
+
+from app.stac.services import http_fetch
+from app.stac.services.stac_item_creator import STACItemCreator
+
+
+@pytest.fixture(autouse=True)
+def fresh_fetch_layer():
+    http_fetch.close_http_session()
+    http_fetch._stats.update({"requests": 0, "hits": 0, "coalesced": 0})
+    yield
+    http_fetch.close_http_session()
+
+
+def test_metadata_url_is_fetched_once(make_geotiff, http_server, tmp_path):
+    """
+    Tests that generating items for the same metadata_url fetches it a single time
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_http_fetch.py::test_metadata_url_is_fetched_once
+    """
+    (tmp_path / "metadata.json").write_text(json.dumps({"ID": "fetched"}))
+    payload = {
+        "files": [make_geotiff()],
+        "metadata_url": f"{http_server.url}/metadata.json",
+        "parser": "example",
+    }
+
+    for _ in range(3):
+        assert STACItemCreator(payload).create_item()["id"] == "fetched"
+
+    assert http_server.requests.count(("GET", "/metadata.json")) == 1
+    assert http_fetch.get_fetch_stats() == {"requests": 1, "hits": 2, "coalesced": 0}
+
+
+def test_concurrent_fetches_are_coalesced(monkeypatch):
+    """
+    Tests that threads fetching the same URL at the same time share a single request
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_http_fetch.py::test_concurrent_fetches_are_coalesced
+    """
+    monkeypatch.setenv("HTTP_FETCH_CACHE_TTL", "0")
+    calls = []
+
+    class SlowResponse:
+        content = b'{"ID": "slow"}'
+
+        def raise_for_status(self):
+            pass
+
+    class SlowSession:
+        def get(self, url, timeout):
+            calls.append(url)
+            time.sleep(0.2)
+            return SlowResponse()
+
+    monkeypatch.setattr(http_fetch, "get_http_session", lambda: SlowSession())
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(http_fetch.fetch_json("http://metadata.test/a.json")))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{"ID": "slow"}] * 5
+    assert calls == ["http://metadata.test/a.json"]
+    assert http_fetch.get_fetch_stats()["coalesced"] == 4
+
+    # Without a cache, a later fetch makes a new request
+    http_fetch.fetch_json("http://metadata.test/a.json")
+    assert len(calls) == 2
@@ -0,0 +1,91 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_jobs.py`
+
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.stac.models import GenerateSTACPayload
+from app.stac.services import job_manager, job_store
+from app.stac.services.job_manager import JobManager
+from app.stac.services.job_store import get_job_store
+
+JOBS_ROUTE = "/stac/jobs"
+
+
+def wait_for_job(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"{JOBS_ROUTE}/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f"Job {job_id} did not finish")
+
+
+def test_job_lifecycle(make_geotiff, monkeypatch):
+    """
+    Tests that a job is accepted right away and its result can be fetched once it has run
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_jobs.py::test_job_lifecycle
+    """
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    payload = {"files": [make_geotiff()], "metadata": {"ID": "job_item"}, "parser": "example"}
+
+    with TestClient(app) as client:
+        response = client.post(JOBS_ROUTE, json=payload)
+        assert response.status_code == 202
+        assert response.json()["status"] == "queued"
+
+        job = wait_for_job(client, response.json()["id"])
+        assert job["status"] == "succeeded"
+        assert job["result"]["id"] == "job_item"
+
+        response = client.post(
+            JOBS_ROUTE, json={"files": ["readme.md"], "metadata": {"ID": "x"}, "parser": "example"}
+        )
+        failed = wait_for_job(client, response.json()["id"])
+        assert failed["status"] == "failed"
+        assert failed["detail"] == "No rio_stac generated items found."
+
+        assert client.get(f"{JOBS_ROUTE}/unknown").status_code == 404
+
+
+def test_jobs_are_shared_through_the_job_store(tmp_path, monkeypatch):
+    """
+    Tests that a job can be polled from another process sharing the job store, and that a job
+    whose process stopped beating is reported as failed
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_jobs.py::test_jobs_are_shared_through_the_job_store
+    """
+    monkeypatch.setenv("JOB_STORE_PATH", str(tmp_path / "jobs.sqlite"))
+
+    async def generate_and_publish(payload):
+        return {"id": payload.metadata["ID"]}
+
+    monkeypatch.setattr(job_manager, "generate_and_publish", generate_and_publish)
+
+    async def run():
+        worker, other = JobManager(concurrency=1), JobManager(concurrency=1)
+        await worker.start()
+        await other.start()
+        try:
+            submitted = await worker.submit(GenerateSTACPayload(files=["a.tif"], metadata={"ID": "shared"}))
+            await worker._queue.join()
+            return submitted, await other.get(submitted["id"])
+        finally:
+            await worker.stop()
+            await other.stop()
+
+    submitted, job = asyncio.run(run())
+    assert submitted["status"] == "queued"
+    assert (job["status"], job["result"]) == ("succeeded", {"id": "shared"})
+
+    store = get_job_store()
+    stale = dict(submitted, id="stale")
+    store.put(stale, "dead-process")
+    assert store.get("stale")["status"] == "queued"
+    later = time.time() + 4 * job_store.HEARTBEAT_INTERVAL
+    monkeypatch.setattr(job_store.time, "time", lambda: later)
+    assert store.get("stale")["status"] == "failed"
@@ -0,0 +1,127 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metadata_parser_manager.py`
+
+import json
+import os
+from types import SimpleNamespace
+
+from app.stac.services.metadata_parsers.metadata_parser_manager import MetadataParserManager
+
+PARSER_SOURCE = """
+class Parser:
+    version = {version}
+
+    def parse(self, payload, **kwargs):
+        return {{"properties": {{}}}}
+"""
+
+
+def test_parsers_are_cached_until_their_file_changes(tmp_path, monkeypatch):
+    """
+    Tests that a parser is loaded once and only reloaded when its file mtime changes, which is
+    checked at most once per PARSER_RELOAD_INTERVAL seconds
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metadata_parser_manager.py::test_parsers_are_cached_until_their_file_changes
+    """
+    (tmp_path / "standard").mkdir()
+    parser_path = tmp_path / "standard" / "vendor_parser.py"
+    parser_path.write_text(PARSER_SOURCE.format(version=1))
+
+    monkeypatch.setattr(MetadataParserManager, "parsers_root", str(tmp_path))
+    monkeypatch.setattr(MetadataParserManager, "_registry", {})
+    monkeypatch.setattr(MetadataParserManager, "_registry_stats", {"hits": 0, "loads": 0, "reloads": 0})
+
+    assert MetadataParserManager.load_parsers() == {"standard": ["vendor"], "proprietary": []}
+    first = MetadataParserManager.get_parser("vendor")
+    assert MetadataParserManager.get_parser("vendor") is first
+
+    parser_path.write_text(PARSER_SOURCE.format(version=2))
+    mtime = os.stat(parser_path).st_mtime_ns + 1_000_000_000
+    os.utime(parser_path, ns=(mtime, mtime))
+    monkeypatch.setenv("PARSER_RELOAD_INTERVAL", "60")
+    assert MetadataParserManager.get_parser("vendor") is first
+
+    monkeypatch.setenv("PARSER_RELOAD_INTERVAL", "0")
+    reloaded = MetadataParserManager.get_parser("vendor")
+
+    assert reloaded is not first
+    assert reloaded.version == 2
+    assert MetadataParserManager.get_registry_stats() == {
+        "hits": 3,
+        "loads": 1,
+        "reloads": 1,
+        "parsers": ["vendor"],
+    }
+
+
+MAXAR_METADATA = """<?xml version="1.0" encoding="UTF-8"?>
+<ns0:DeliveryMetadata xmlns:ns0="http://xsd.digitalglobe.com/xsd/dm">
+  <ns0:product>
+    <ns0:cloudCover>0.25</ns0:cloudCover>
+    <ns0:earliestAcquisitionTime>2023-05-01T10:00:00.000Z</ns0:earliestAcquisitionTime>
+    <ns0:sunElevation>41.5</ns0:sunElevation>
+    <ns0:band name="pan" gsd="0.5"/>
+    <ns0:band name="red" gsd="2.0"/>
+  </ns0:product>
+</ns0:DeliveryMetadata>
+"""
+
+VENDOR_SPEC = """
+sidecar: "*DeliveryMetadata.xml"
+format: xml
+namespaces:
+  dm: http://xsd.digitalglobe.com/xsd/dm
+properties:
+  eo:cloud_cover: {path: dm:product/dm:cloudCover, type: float}
+  datetime: {path: dm:product/dm:earliestAcquisitionTime, type: datetime}
+  gsd: {path: "dm:product/dm:band[@name='red']/@gsd", type: float}
+"""
+
+
+def test_parser_specs_are_compiled_into_parsers(tmp_path, monkeypatch, http_server):
+    """
+    Tests that YAML and JSON parser specs are loaded like Python parsers, and read XML sidecar
+    files and the payload metadata
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metadata_parser_manager.py::test_parser_specs_are_compiled_into_parsers
+    """
+    (tmp_path / "standard").mkdir()
+    (tmp_path / "standard" / "vendor_parser.yaml").write_text(VENDOR_SPEC)
+    (tmp_path / "standard" / "inline_parser.json").write_text(json.dumps({
+        "id": "ID",
+        "properties": {"platform": "platforms[0].name", "view:off_nadir": {"path": "$.angles.off_nadir", "type": "float"}},
+    }))
+    (tmp_path / "item_DeliveryMetadata.xml").write_text(MAXAR_METADATA)
+    parsers_root = MetadataParserManager.parsers_root
+
+    monkeypatch.setattr(MetadataParserManager, "parsers_root", str(tmp_path))
+    monkeypatch.setattr(MetadataParserManager, "_registry", {})
+
+    assert MetadataParserManager.load_parsers() == {"standard": ["inline", "vendor"], "proprietary": []}
+    files = [f"{http_server.url}/band.tif", f"{http_server.url}/item_DeliveryMetadata.xml?sig=1"]
+    vendor = MetadataParserManager.get_parser("vendor").parse(SimpleNamespace(files=files, metadata={}))
+    assert vendor["properties"] == {
+        "eo:cloud_cover": 0.25,
+        "datetime": "2023-05-01T10:00:00Z",
+        "gsd": 2.0,
+    }
+
+    inline = MetadataParserManager.get_parser("inline")
+    metadata = {"ID": "scene", "platforms": [{"name": "sat-1"}], "angles": {"off_nadir": "3.5"}}
+    assert inline.parse(SimpleNamespace(files=[], metadata=metadata)) == {
+        "type": "Feature",
+        "stac_extensions": [],
+        "id": "scene",
+        "properties": {"platform": "sat-1", "view:off_nadir": 3.5},
+    }
+    # Missing values are left out
+    assert inline.extract({"ID": "other"})["properties"] == {}
+
+    # The Maxar parser is a spec too
+    monkeypatch.setattr(MetadataParserManager, "parsers_root", parsers_root)
+    monkeypatch.setattr(MetadataParserManager, "_registry", {})
+    maxar = MetadataParserManager.get_parser("maxar").parse(SimpleNamespace(files=files, metadata={}))
+    assert maxar["properties"] == {
+        "eo:cloud_cover": 0.25,
+        "datetime": "2023-05-01T10:00:00.000Z",
+        "view:sun_elevation": 41.5,
+    }
@@ -0,0 +1,105 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metrics.py`
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.stac.services.metrics import STAGE_VALIDATION, get_metric_labels, observe_stage
+
+client = TestClient(app)
+
+
+def get_stage_count(text, stage, parser="example", collection="example"):
+    prefix = f'stac_generator_stage_seconds_count{{collection="{collection}",parser="{parser}",stage="{stage}"}} '
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+def test_metrics_count_generation_stages(make_geotiff, monkeypatch):
+    """
+    Tests that generating an item is timed stage by stage on the /metrics route
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metrics.py::test_metrics_count_generation_stages
+    """
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    monkeypatch.setenv("CHECK_COG_TYPE", "true")
+    monkeypatch.delenv("RASTER_CACHE_PATH", raising=False)
+    stages = ("validation", "parser_load", "rio_stac", "cog_validation", "tag_read", "parse", "merge")
+    before = client.get("/metrics").text
+
+    payload = {"files": [make_geotiff("a.tif"), make_geotiff("b.tif")], "metadata": {"ID": "metrics"}, "parser": "example"}
+    assert client.post("/stac/generate", json=payload).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    counts = {stage: get_stage_count(response.text, stage) - get_stage_count(before, stage) for stage in stages}
+    assert counts == {
+        "validation": 1,
+        "parser_load": 1,
+        "rio_stac": 2,
+        "cog_validation": 2,
+        "tag_read": 2,
+        "parse": 1,
+        "merge": 1,
+    }
+    # No metadata was fetched
+    assert get_stage_count(response.text, "metadata_fetch") == get_stage_count(before, "metadata_fetch")
+
+
+def test_stage_errors_are_counted(monkeypatch):
+    """
+    Tests that a stage raising an error is timed and counted as an error
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metrics.py::test_stage_errors_are_counted
+    """
+    monkeypatch.setenv("METRICS_COLLECTIONS", "errors")
+    labels = get_metric_labels("example", "errors")
+
+    with pytest.raises(ValueError):
+        with observe_stage(STAGE_VALIDATION, labels):
+            raise ValueError("Invalid payload")
+
+    text = client.get("/metrics").text
+    assert get_stage_count(text, STAGE_VALIDATION, parser="example", collection="errors") == 1
+    assert 'stac_generator_stage_errors_total{collection="errors",parser="example",stage="validation"} 1.0' in text
+
+
+def test_metric_labels_are_bounded(monkeypatch):
+    """
+    Tests that unknown parsers and collections are labeled "other", and listed collections keep their name
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metrics.py::test_metric_labels_are_bounded
+    """
+    monkeypatch.setenv("METRICS_COLLECTIONS", "errors, landsat")
+
+    assert get_metric_labels("example") == ("example", "example")
+    assert get_metric_labels(None) == ("none", "default")
+    assert get_metric_labels("example", "landsat") == ("example", "landsat")
+    assert get_metric_labels("example", "request-1234") == ("example", "other")
+    assert get_metric_labels("unknown-1234") == ("other", "other")
+    assert get_metric_labels("../example") == ("other", "other")
+
+
+def test_cache_and_registry_stats_are_reported(make_geotiff, monkeypatch, tmp_path):
+    """
+    Tests that the raster cache, parser registry and HTTP fetch counters are on the /metrics route
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_metrics.py::test_cache_and_registry_stats_are_reported
+    """
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    monkeypatch.setenv("RASTER_CACHE_PATH", str(tmp_path / "raster_cache.sqlite"))
+    path = make_geotiff("a.tif")
+    for item_id in ("first", "second"):
+        payload = {"files": [path], "metadata": {"ID": item_id}, "parser": "example"}
+        assert client.post("/stac/generate", json=payload).status_code == 200
+
+    text = client.get("/metrics").text
+    samples = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+    assert float(samples["stac_generator_raster_cache_hits_total"]) == 1
+    assert float(samples["stac_generator_raster_cache_misses_total"]) == 1
+    assert float(samples["stac_generator_raster_cache_entries"]) == 1
+    assert float(samples["stac_generator_parser_registry_hits_total"]) >= 2
+    assert "stac_generator_http_fetch_requests_total" in samples
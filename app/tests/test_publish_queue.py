@@ -0,0 +1,98 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publish_queue.py`
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.stac.services.metrics import generate_metrics
+from app.stac.services.publisher import publisher_utility
+from app.stac.services.publisher.publish_queue import PublishQueue, PublishQueueFullError
+from app.stac.services.publisher.publish_spool import PublishSpool
+
+STAC_API_URL = "http://stac-api.test"
+
+
+def test_spool_claims_batches_of_a_collection_and_survives_restarts(tmp_path):
+    """
+    Tests that the spool hands out batches of a single collection, oldest first, replaces
+    items queued again, and keeps its items across instances
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publish_queue.py::test_spool_claims_batches_of_a_collection_and_survives_restarts
+    """
+    path = str(tmp_path / "publish_queue.sqlite")
+    spool = PublishSpool(path, max_size=3)
+    assert spool.put({"id": "a1", "version": 1}, "a", "parser")
+    assert spool.put({"id": "a2"}, "a")
+    assert spool.put({"id": "b1"}, "b")
+    assert spool.put({"id": "a1", "version": 2}, "a", "parser")
+    assert not spool.put({"id": "b2"}, "b")
+
+    batch = spool.claim(10, lease=60)
+    assert [entry["item"] for entry in batch] == [{"id": "a2"}, {"id": "a1", "version": 2}]
+    assert [entry["item"]["id"] for entry in spool.claim(10, lease=60)] == ["b1"]
+    assert spool.claim(10, lease=60) == []
+
+    restarted = PublishSpool(path, max_size=3)
+    assert restarted.get_stats()["depth"] == 3
+    assert restarted.retry([entry["id"] for entry in batch], "503", delay=0, max_attempts=1) == 2
+    stats = restarted.get_stats()
+    assert (stats["depth"], stats["failed"]) == (1, 2)
+    assert stats["lag_seconds"] > 0
+
+
+def test_items_are_published_in_the_background(monkeypatch, tmp_path):
+    """
+    Tests that queued items are published in batches per collection, retried when the STAC
+    API fails, and that a full queue pushes back
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publish_queue.py::test_items_are_published_in_the_background
+    """
+    monkeypatch.setenv("STAC_API_URL", STAC_API_URL)
+    monkeypatch.setenv("STAC_API_PUBLISH_MODE", "bulk")
+    monkeypatch.setenv("PUBLISH_QUEUE_PATH", str(tmp_path / "publish_queue.sqlite"))
+    monkeypatch.setenv("PUBLISH_QUEUE_MAX_SIZE", "3")
+    requests = []
+    statuses = iter([503, 200, 200])
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(next(statuses), json={})
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(publisher_utility, "get_stac_api_client", lambda: client)
+        queue = PublishQueue(concurrency=1, flush_interval=0.05, put_timeout=0.1, retry_delay=0.05)
+        async with client:
+            url = await queue.enqueue({"id": "a1"}, "a", "parser")
+            await queue.enqueue({"id": "b1"}, "b", "parser")
+            await queue.enqueue({"id": "a2"}, "a", "parser")
+            with pytest.raises(PublishQueueFullError):
+                await queue.enqueue({"id": "b2"}, "b", "parser")
+            assert queue.get_stats()["depth"] == 3
+            # Nothing was sent to the STAC API so far
+            assert requests == []
+
+            await queue.start()
+            for _ in range(100):
+                if queue.get_stats()["depth"] == 0:
+                    break
+                await asyncio.sleep(0.05)
+            await queue.stop()
+        return url
+
+    url = asyncio.run(run())
+
+    assert url == f"{STAC_API_URL}/collections/a/items/a1"
+    # The other collection is published while the failed batch waits for its retry
+    assert [request.url.path for request in requests] == [
+        "/collections/a/bulk_items",
+        "/collections/b/bulk_items",
+        "/collections/a/bulk_items",
+    ]
+    assert list(json.loads(requests[2].content)["items"]) == ["a1", "a2"]
+
+    metrics = generate_metrics()[0].decode()
+    assert "stac_generator_publish_queue_depth 0.0" in metrics
+    assert 'stac_generator_publish_queue_items_total{outcome="retried"}' in metrics
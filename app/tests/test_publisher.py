@@ -0,0 +1,122 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publisher.py`
+
+import asyncio
+import json
+
+import httpx
+import numpy
+import pytest
+
+from app.stac.services.publisher import publisher_utility
+from app.stac.services.publisher.publisher_utility import (
+    publish_many_to_stac_fastapi,
+    publish_to_stac_fastapi,
+)
+
+STAC_API_URL = "http://stac-api.test"
+
+
+def run_with_stac_api(monkeypatch, responses, coroutine_factory):
+    """
+    Run a publishing coroutine against a stand-in STAC API answering with the given status codes.
+    """
+    monkeypatch.setenv("STAC_API_URL", STAC_API_URL)
+    requests = []
+    statuses = iter(responses)
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(next(statuses), json={})
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(publisher_utility, "get_stac_api_client", lambda: client)
+        async with client:
+            return await coroutine_factory()
+
+    return asyncio.run(run()), requests
+
+
+def test_existing_item_is_updated(monkeypatch):
+    """
+    Tests that an item is PUT when the POST reports that it already exists
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publisher.py::test_existing_item_is_updated
+    """
+    # rio_stac band statistics hold numpy scalars
+    item = {"id": "item", "type": "Feature", "properties": {"valid_percent": numpy.float64(50)}}
+    url, requests = run_with_stac_api(
+        monkeypatch, [409, 200], lambda: publish_to_stac_fastapi(item, "collection")
+    )
+
+    assert url == f"{STAC_API_URL}/collections/collection/items/item"
+    assert [request.method for request in requests] == ["POST", "PUT"]
+    assert json.loads(requests[1].content) == item
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    """
+    Tests that a locked STAC API is retried with backoff, and client errors are not
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publisher.py::test_transient_errors_are_retried
+    """
+    item = {"id": "item", "type": "Feature"}
+    _, requests = run_with_stac_api(
+        monkeypatch,
+        [503, 503, 201],
+        lambda: publish_to_stac_fastapi(item, "collection", retry_delay=0.01),
+    )
+    assert len(requests) == 3
+
+    with pytest.raises(Exception, match="400"):
+        run_with_stac_api(
+            monkeypatch, [400], lambda: publish_to_stac_fastapi(item, "collection", retry_delay=0.01)
+        )
+
+    with pytest.raises(Exception, match="Max retries reached"):
+        run_with_stac_api(
+            monkeypatch,
+            [503] * 3,
+            lambda: publish_to_stac_fastapi(item, "collection", max_retries=3, retry_delay=0.01),
+        )
+
+
+def test_bulk_publish_sends_chunks(monkeypatch):
+    """
+    Tests that many items are upserted in chunks through the bulk items endpoint
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publisher.py::test_bulk_publish_sends_chunks
+    """
+    monkeypatch.setenv("STAC_API_BULK_CHUNK_SIZE", "100")
+    items = [{"id": f"item-{index}", "type": "Feature"} for index in range(250)]
+    urls, requests = run_with_stac_api(
+        monkeypatch, [200] * 3, lambda: publish_many_to_stac_fastapi(items, "collection")
+    )
+
+    assert urls[-1] == f"{STAC_API_URL}/collections/collection/items/item-249"
+    assert {str(request.url) for request in requests} == {
+        f"{STAC_API_URL}/collections/collection/bulk_items"
+    }
+    bodies = [json.loads(request.content) for request in requests]
+    assert [len(body["items"]) for body in bodies] == [100, 100, 50]
+    assert all(body["method"] == "upsert" for body in bodies)
+
+
+def test_bulk_publish_reports_failed_chunks(monkeypatch):
+    """
+    Tests that a failed chunk only fails its own items when exceptions are returned
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_publisher.py::test_bulk_publish_reports_failed_chunks
+    """
+    monkeypatch.setenv("STAC_API_BULK_CHUNK_SIZE", "100")
+    items = [{"id": f"item-{index}", "type": "Feature"} for index in range(250)]
+    results, requests = run_with_stac_api(
+        monkeypatch,
+        [200, 400, 200],
+        lambda: publish_many_to_stac_fastapi(items, "collection", return_exceptions=True),
+    )
+
+    assert len(requests) == 3
+    assert results[99] == f"{STAC_API_URL}/collections/collection/items/item-99"
+    assert all(isinstance(result, Exception) and "400" in str(result) for result in results[100:200])
+    assert results[200] == f"{STAC_API_URL}/collections/collection/items/item-200"
@@ -0,0 +1,92 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_cache.py`
+
+import json
+import os
+
+import rasterio
+
+from app.stac.services.raster_cache import RasterMetadataCache, get_asset_identity, get_raster_cache
+from app.stac.services.raster_inspection import inspect_raster
+from app.stac.services.stac_item_creator import STACItemCreator
+
+
+def test_generation_reuses_cached_inspections(make_geotiff, tmp_path, monkeypatch):
+    """
+    Tests that a regenerated item does not open its unchanged rasters again
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_cache.py::test_generation_reuses_cached_inspections
+    """
+    monkeypatch.setenv("RASTER_CACHE_PATH", str(tmp_path / "cache.sqlite"))
+    files = [make_geotiff(f"B0{index}.tif") for index in (1, 2)]
+    payload = {"files": files, "metadata": {"ID": "cached"}, "parser": "example"}
+
+    opened = []
+    rasterio_open = rasterio.open
+
+    def counting_open(fp, *args, **kwargs):
+        opened.append(str(fp))
+        return rasterio_open(fp, *args, **kwargs)
+
+    monkeypatch.setattr(rasterio, "open", counting_open)
+
+    first = STACItemCreator(payload).create_item()
+    assert sorted(opened) == sorted(files)
+    second = STACItemCreator(payload).create_item()
+    assert sorted(opened) == sorted(files)
+    assert second["assets"] == first["assets"]
+    assert second["properties"]["proj:shape"] == first["properties"]["proj:shape"]
+
+    # Another statistics method is a different entry
+    STACItemCreator(dict(payload, raster_statistics="none")).create_item()
+    assert len(opened) == 4
+
+    # A rewritten file is inspected again
+    stat = os.stat(files[0])
+    os.utime(files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    STACItemCreator(payload).create_item()
+    assert opened[4:] == [files[0]]
+
+    stats = get_raster_cache().get_stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 5
+    assert stats["entries"] == 5
+
+
+def test_least_recently_used_entries_are_evicted(make_geotiff, tmp_path):
+    """
+    Tests that the cache evicts the least recently used entries above its size cap
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_cache.py::test_least_recently_used_entries_are_evicted
+    """
+    inspection = inspect_raster(make_geotiff())
+    cache = RasterMetadataCache(str(tmp_path / "cache.sqlite"))
+    cache.put("a", inspection)
+    cache.max_bytes = 2 * cache.get_stats()["bytes"]
+    cache.put("b", inspection)
+    assert cache.get("a") is not None
+    cache.put("c", inspection)
+
+    assert cache.get("b") is None
+    # Tuples of the generated geometry come back as lists
+    assert cache.get("a").generated_stac.to_dict() == json.loads(
+        json.dumps(inspection.generated_stac.to_dict())
+    )
+    assert cache.get("c").resolution == inspection.resolution
+    assert cache.get_stats() == {
+        "hits": 3, "misses": 1, "stores": 3, "evictions": 1, "entries": 2, "bytes": cache.max_bytes
+    }
+
+
+def test_remote_identity_ignores_the_query_string(make_geotiff, http_server, tmp_path):
+    """
+    Tests that remote rasters are keyed by their href without query string and by their headers
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_cache.py::test_remote_identity_ignores_the_query_string
+    """
+    make_geotiff()
+    cache = RasterMetadataCache(str(tmp_path / "cache.sqlite"))
+    url = f"{http_server.url}/band.tif"
+
+    assert cache.get_key(f"{url}?sig=one") == cache.get_key(f"{url}?sig=two")
+    assert "modified:" in get_asset_identity(url)
+    assert get_asset_identity(f"{http_server.url}/missing.tif") is None
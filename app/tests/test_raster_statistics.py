@@ -0,0 +1,108 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_statistics.py`
+
+import pytest
+import rasterio
+from rasterio.enums import Resampling
+
+from app.stac.services import raster_statistics
+from app.stac.services.metadata_parsers.metadata_parser_manager import MetadataParserManager
+from app.stac.services.raster_statistics import get_raster_bands
+from app.stac.services.stac_item_creator import STACItemCreator
+
+
+@pytest.fixture
+def large_tiff(make_geotiff):
+    path = make_geotiff("large.tif", width=2048, height=2048, tiled=True)
+    with rasterio.open(path, "r+") as dst:
+        dst.build_overviews([2, 4, 8], Resampling.nearest)
+    return path
+
+
+def test_statistics_methods(large_tiff, monkeypatch):
+    """
+    Tests that each method reads the expected pixels and records itself in the band
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_statistics.py::test_statistics_methods
+    """
+    monkeypatch.setenv("RASTER_STATISTICS_SAMPLE_WINDOWS", "4")
+    with rasterio.open(large_tiff) as src:
+        full = src.read(1, masked=True)
+        overview = src.read(1, masked=True, out_shape=(1024, 1024))
+
+        bands = {method: get_raster_bands(src, method)[0] for method in raster_statistics.STATISTICS_METHODS}
+
+    for method, band in bands.items():
+        assert band["statistics_method"] == method
+        assert band["data_type"] == "uint8"
+        assert band["nodata"] == 0
+
+    assert "statistics" not in bands["none"]
+    assert bands["exact"]["statistics"]["mean"] == pytest.approx(full.mean())
+    assert sum(bands["exact"]["histogram"]["buckets"]) == full.count()
+    assert bands["overview"]["statistics"]["mean"] == pytest.approx(overview.mean())
+    # Four 256x256 blocks were sampled
+    assert sum(bands["sampled"]["histogram"]["buckets"]) == 4 * 256 * 256
+    assert bands["sampled"]["statistics"]["minimum"] == 1
+    assert bands["sampled"]["statistics"]["maximum"] == 250
+
+
+def test_striped_statistics(make_geotiff, monkeypatch):
+    """
+    Tests that a striped raster is sampled in square windows, and that its exact statistics
+    read block by block match those of the whole band
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_statistics.py::test_striped_statistics
+    """
+    monkeypatch.setenv("RASTER_STATISTICS_SAMPLE_WINDOWS", "4")
+    monkeypatch.setenv("RASTER_STATISTICS_SAMPLE_SIZE", "128")
+    monkeypatch.setattr(raster_statistics, "_EXACT_READ_PIXELS", 100_000)
+    path = make_geotiff("striped.tif", width=1000, height=1000, blockysize=1)
+    with rasterio.open(path) as src:
+        assert src.block_shapes == [(1, 1000)]
+        windows = raster_statistics._get_sample_windows(src, 4, 128)
+        expected = raster_statistics._get_statistics(src.read(1, masked=True))
+        sampled, exact = (get_raster_bands(src, method)[0] for method in ("sampled", "exact"))
+
+    assert [(window.height, window.width) for window in windows] == [(128, 128)] * 4
+    assert sum(sampled["histogram"]["buckets"]) == 4 * 128 * 128
+    assert exact["histogram"] == expected["histogram"]
+    for name, value in expected["statistics"].items():
+        assert exact["statistics"][name] == pytest.approx(value)
+
+
+def test_overview_statistics_use_the_coarsest_suitable_overview(large_tiff):
+    """
+    Tests that overview statistics are read at the size of an existing overview level
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_statistics.py::test_overview_statistics_use_the_coarsest_suitable_overview
+    """
+    with rasterio.open(large_tiff) as src:
+        assert raster_statistics.get_overview_read_shape(src, 1024) == (1024, 1024)
+        assert raster_statistics.get_overview_read_shape(src, 300) == (512, 512)
+        assert raster_statistics.get_overview_read_shape(src, 4096) == (2048, 2048)
+
+
+def test_statistics_method_precedence(make_geotiff, monkeypatch):
+    """
+    Tests that the request overrides the parser, which overrides RASTER_STATISTICS_METHOD
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_raster_statistics.py::test_statistics_method_precedence
+    """
+    path = make_geotiff()
+    payload = {"files": [path], "metadata": {"ID": "stats"}, "parser": "example"}
+
+    def method_of(item):
+        return item["assets"]["band.tif"]["raster:bands"][0]["statistics_method"]
+
+    monkeypatch.setenv("RASTER_STATISTICS_METHOD", "exact")
+    item = STACItemCreator(payload).create_item()
+    assert method_of(item) == "exact"
+    assert "https://stac-extensions.github.io/raster/v1.1.0/schema.json" in item["stac_extensions"]
+
+    parser = MetadataParserManager.get_parser("example")
+    monkeypatch.setattr(parser, "raster_statistics", "sampled", raising=False)
+    assert method_of(STACItemCreator(payload).create_item()) == "sampled"
+
+    item = STACItemCreator(dict(payload, raster_statistics="none")).create_item()
+    assert method_of(item) == "none"
+    assert "statistics" not in item["assets"]["band.tif"]["raster:bands"][0]
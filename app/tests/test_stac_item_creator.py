@@ -0,0 +1,173 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stac_item_creator.py`
+
+import copy
+import json
+import threading
+
+import numpy
+import pytest
+import rasterio
+from pystac import Item
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+
+from app.stac.services import raster_inspection
+from app.stac.services.file_operations import is_cog
+from app.stac.services.metadata_parsers.metadata_parser_manager import MetadataParserManager
+from app.stac.services.metadata_parsers.utils import merge_stac_items
+from app.stac.services.stac_item_creator import STACItemCreator
+
+
+def test_tiffs_are_inspected_concurrently_and_merged_in_order(make_geotiff, monkeypatch):
+    """
+    Tests that TIFF assets are read on several threads and added in payload order
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stac_item_creator.py::test_tiffs_are_inspected_concurrently_and_merged_in_order
+    """
+    monkeypatch.setenv("ASSET_MAX_WORKERS", "4")
+    files = [make_geotiff(f"B0{index}.tif", width=64 * index, height=64 * index) for index in (3, 1, 2)]
+
+    threads = set()
+    create_stac_item = raster_inspection.create_stac_item
+
+    def recording_create_stac_item(*args, **kwargs):
+        threads.add(threading.current_thread().name)
+        return create_stac_item(*args, **kwargs)
+
+    monkeypatch.setattr(raster_inspection, "create_stac_item", recording_create_stac_item)
+
+    item = STACItemCreator({"files": files, "metadata": {"ID": "bands"}, "parser": "example"}).create_item()
+
+    assert list(item["assets"]) == ["B03.tif", "B01.tif", "B02.tif"]
+    # The item properties come from the last TIFF of the payload
+    assert item["properties"]["proj:shape"] == [128, 128]
+    assert threads and all(name.startswith("stac-asset") for name in threads)
+
+
+def test_each_tiff_is_opened_once(make_geotiff, monkeypatch):
+    """
+    Tests that the inspection of a TIFF, including the COG check, opens the dataset a single time
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stac_item_creator.py::test_each_tiff_is_opened_once
+    """
+    monkeypatch.setenv("CHECK_COG_TYPE", "true")
+    files = [make_geotiff(f"B0{index}.tif", width=1024, height=1024, tiled=True) for index in range(1, 4)]
+    for path in files:
+        with rasterio.open(path, "r+") as dst:
+            dst.build_overviews([2, 4], Resampling.nearest)
+
+    opened = []
+    rasterio_open = rasterio.open
+
+    def counting_open(fp, *args, **kwargs):
+        opened.append(str(fp))
+        return rasterio_open(fp, *args, **kwargs)
+
+    monkeypatch.setattr(rasterio, "open", counting_open)
+
+    item = STACItemCreator({"files": files, "metadata": {"ID": "bands"}, "parser": "example"}).create_item()
+
+    assert sorted(opened) == sorted(files)
+    assert item["properties"]["gsd"] == 10.0
+
+
+def test_grid_metadata_is_shared_and_footprints_are_merged(make_geotiff, monkeypatch):
+    """
+    Tests that TIFFs on the same grid share their geometry and projection, matching rio_stac,
+    and that the item footprint covers TIFFs on different grids
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stac_item_creator.py::test_grid_metadata_is_shared_and_footprints_are_merged
+    """
+    raster_inspection._compute_grid_metadata.cache_clear()
+    files = [make_geotiff(f"B0{index}.tif") for index in range(1, 4)]
+    item = STACItemCreator({"files": files, "metadata": {"ID": "bands"}, "parser": "example"}).create_item()
+
+    assert raster_inspection._compute_grid_metadata.cache_info().misses == 1
+    with rasterio.open(files[0]) as src:
+        expected = raster_inspection.rio_stac.create_stac_item(
+            src, with_eo=True, with_proj=True, with_raster=False, geom_densify_pts=21
+        )
+        generated = raster_inspection.create_stac_item(src)
+    assert generated.geometry == expected.geometry
+    assert generated.bbox == expected.bbox
+    assert {key: value for key, value in generated.properties.items() if key != "datetime"} == {
+        key: value for key, value in expected.properties.items() if key != "datetime"
+    }
+    assert generated.assets["asset"].to_dict() == expected.assets["asset"].to_dict()
+    assert item["geometry"] == expected.geometry
+
+    # A second TIFF east of the first one, the item used to take the footprint of the last TIFF
+    east = make_geotiff("east.tif", transform=from_origin(502560, 5600000, 10, 10))
+    item = STACItemCreator({"files": [files[0], east], "metadata": {"ID": "tiles"}, "parser": "example"}).create_item()
+    with rasterio.open(east) as src:
+        east_bbox = raster_inspection.create_stac_item(src).bbox
+    assert item["bbox"] == [expected.bbox[0], min(expected.bbox[1], east_bbox[1]), east_bbox[2], max(expected.bbox[3], east_bbox[3])]
+    # The adjacent footprints merge into one polygon spanning both TIFFs
+    assert item["geometry"]["type"] == "Polygon"
+    points = numpy.array(item["geometry"]["coordinates"][0])
+    assert points[:, 0].min() == pytest.approx(item["bbox"][0], abs=1e-4)
+    assert points[:, 0].max() == pytest.approx(item["bbox"][2], abs=1e-4)
+
+
+def test_is_cog_reads_overview_layout_from_the_open_dataset(make_geotiff):
+    """
+    Tests that the overview tiling check agrees with reopening every overview level
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stac_item_creator.py::test_is_cog_reads_overview_layout_from_the_open_dataset
+    """
+    tiled = make_geotiff("tiled.tif", width=2048, height=2048, tiled=True)
+    striped = make_geotiff("striped.tif", width=2048, height=2048)
+    for path in (tiled, striped):
+        with rasterio.open(path, "r+") as dst:
+            dst.build_overviews([2, 4, 8], Resampling.nearest)
+    # Overviews wider than 512 px that fit in a single column of blocks
+    cog = make_geotiff("large_blocks.tif", width=2400, height=2400, driver="COG", blocksize=1024)
+
+    for path in (tiled, striped, cog):
+        expected = []
+        with rasterio.open(path) as src:
+            levels = len(src.overviews(1))
+        for ix in range(levels):
+            with rasterio.open(path, OVERVIEW_LEVEL=ix) as ovr:
+                if ovr.width > 512 and ovr.height > 512 and not ovr.is_tiled:
+                    expected.append("Overview of index {} is not tiled".format(ix))
+
+        with rasterio.open(path) as src:
+            valid, errors, _ = is_cog(src)
+
+        assert [error for error in errors if error.startswith("Overview")] == expected
+        if path == cog:
+            assert (levels, valid) == (2, True)
+
+
+def test_parsed_metadata_is_merged_like_a_rebuilt_item(make_geotiff, monkeypatch):
+    """
+    Tests that merging the parsed metadata in place gives the item that rebuilding a pystac Item gave
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stac_item_creator.py::test_parsed_metadata_is_merged_like_a_rebuilt_item
+    """
+    parsed = {
+        "type": "Feature",
+        "id": "parsed",
+        "stac_extensions": ["https://stac-extensions.github.io/view/v1.0.0/schema.json"],
+        "properties": {"datetime": "2022-09-09T15:27:53.250000Z", "view:sun_elevation": 42.0},
+    }
+
+    class Parser:
+        def parse(self, payload, **kwargs):
+            return copy.deepcopy(parsed)
+
+    monkeypatch.setattr(MetadataParserManager, "get_parser", staticmethod(lambda metadata_type: Parser()))
+    payload = {"files": [make_geotiff()], "metadata": {}, "parser": "parsed"}
+    item = STACItemCreator(payload).create_item()
+
+    legacy = STACItemCreator(payload)
+    legacy._add_assets()
+    legacy._add_tiff_stac_metadata()
+    expected = Item.from_dict(merge_stac_items(legacy.item.to_dict(), parsed), migrate=False).to_dict()
+    assert json.loads(json.dumps(item)) == json.loads(json.dumps(expected))
+    assert item["properties"]["datetime"] == "2022-09-09T15:27:53.250000Z"
+
+    parsed["properties"]["datetime"] = "not a date"
+    with pytest.raises(ValueError, match="Invalid datetime"):
+        STACItemCreator(payload).create_item()
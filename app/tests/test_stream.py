@@ -0,0 +1,93 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stream.py`
+
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+
+from app.main import app
+from app.stac.services import job_manager
+
+STREAM_ROUTE = "/stac/generate/stream"
+
+
+def post_stream(lines):
+    """
+    POST the lines to the stream endpoint as a chunked body, returning the response lines.
+    """
+
+    async def body():
+        for line in lines:
+            yield line.encode() + b"\n"
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post(STREAM_ROUTE, content=body())
+            return response
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_stream_generation(make_geotiff, monkeypatch):
+    """
+    Tests that every line of the stream gets its own success or error entry
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stream.py::test_stream_generation
+    """
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    tiff = make_geotiff()
+    lines = [
+        json.dumps({"files": [tiff], "metadata": {"ID": "first"}, "parser": "example"}),
+        "",
+        "not json",
+        json.dumps({"metadata": {"ID": "no files"}}),
+        json.dumps({"files": ["readme.md"], "metadata": {"ID": "no tiff"}, "parser": "example"}),
+    ]
+
+    entries = sorted(post_stream(lines), key=lambda entry: entry["index"])
+
+    assert [entry["index"] for entry in entries] == [0, 1, 2, 3]
+    assert entries[0]["status"] == "success"
+    assert entries[0]["result"]["id"] == "first"
+    assert entries[1]["detail"].startswith("Invalid payload")
+    assert entries[2]["detail"].startswith("Invalid payload")
+    assert entries[3] == {"index": 3, "status": "error", "detail": "No rio_stac generated items found."}
+
+
+def test_stream_in_flight_work_is_bounded(monkeypatch):
+    """
+    Tests that no more than STREAM_MAX_IN_FLIGHT payloads are generated at the same time
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_stream.py::test_stream_in_flight_work_is_bounded
+    """
+    monkeypatch.setenv("HTTP_PUBLISH_TO_STAC_API", "false")
+    monkeypatch.setenv("STREAM_MAX_IN_FLIGHT", "3")
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    class SlowCreator:
+        def __init__(self, payload):
+            self.payload = payload
+
+        def create_item(self):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            return {"id": self.payload["metadata"]["ID"]}
+
+    monkeypatch.setattr(job_manager, "STACItemCreator", SlowCreator)
+    lines = [json.dumps({"files": ["a.tif"], "metadata": {"ID": str(index)}}) for index in range(20)]
+
+    entries = post_stream(lines)
+
+    assert sorted(entry["result"]["id"] for entry in entries) == sorted(str(index) for index in range(20))
+    assert max(peak) == 3
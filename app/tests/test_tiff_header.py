@@ -0,0 +1,107 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_tiff_header.py`
+
+import os
+
+import pytest
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+
+from app.stac.services import file_operations
+from app.stac.services.file_operations import is_cog
+from app.stac.services.raster_inspection import inspect_raster
+from app.stac.services.tiff_header import RangeReader, validate_cog_header
+from benchmarks.stand_in import StandInServer
+
+
+@pytest.fixture
+def tiffs(make_geotiff, tmp_path):
+    """
+    Writes valid and invalid COGs covering each check of the validator.
+    """
+    source = make_geotiff("source.tif", width=2048, height=2048, tiled=True)
+    with rasterio.open(source, "r+") as dst:
+        dst.build_overviews([2, 4, 8], Resampling.nearest)
+
+    cog = str(tmp_path / "cog.tif")
+    rasterio.shutil.copy(source, cog, driver="COG")
+    bigtiff = str(tmp_path / "bigtiff.tif")
+    rasterio.shutil.copy(source, bigtiff, driver="COG", BIGTIFF="YES")
+    masked = str(tmp_path / "masked.tif")
+    with rasterio.open(source) as src:
+        profile = dict(src.profile, nodata=None)
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True):
+            with rasterio.open(tmp_path / "with_mask.tif", "w", **profile) as dst:
+                dst.write(src.read())
+                dst.write_mask(src.read(1) > 10)
+    rasterio.shutil.copy(tmp_path / "with_mask.tif", masked, driver="COG")
+
+    striped = make_geotiff("striped.tif", width=2048, height=2048)
+    with rasterio.open(striped, "r+") as dst:
+        dst.build_overviews([2, 4], Resampling.nearest)
+    external = make_geotiff("external.tif", width=1024, height=1024, tiled=True)
+    with rasterio.Env(TIFF_USE_OVR=True):
+        with rasterio.open(external, "r+") as dst:
+            dst.build_overviews([2], Resampling.nearest)
+    no_overviews = make_geotiff("no_overviews.tif", width=1024, height=1024, tiled=True)
+    small = make_geotiff("small.tif", width=256, height=256)
+    png = make_geotiff("image.png", driver="PNG", crs=None, transform=None)
+
+    return [cog, bigtiff, masked, source, striped, external, no_overviews, small, png]
+
+
+def test_header_validation_matches_gdal(tiffs):
+    """
+    Tests that the header-only validator reports the same errors and warnings as GDAL
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_tiff_header.py::test_header_validation_matches_gdal
+    """
+    valid = []
+    for path in tiffs:
+        with rasterio.open(path) as src:
+            expected = is_cog(src)
+
+        assert is_cog(path) == expected, os.path.basename(path)
+        if not os.path.exists(f"{path}.ovr"):
+            assert validate_cog_header(path) == expected, os.path.basename(path)
+            assert validate_cog_header(path, strict=True) == is_cog(src_path=path, strict=True)
+        if expected[0]:
+            valid.append(os.path.basename(path))
+
+    assert valid == ["cog.tif", "bigtiff.tif", "masked.tif", "no_overviews.tif", "small.tif"]
+
+
+def test_header_validation_reads_few_ranges_over_http(tiffs, http_server):
+    """
+    Tests that a remote COG is validated with a single range request and without GDAL
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_tiff_header.py::test_header_validation_reads_few_ranges_over_http
+    """
+    url = f"{http_server.url}/cog.tif"
+    reader = RangeReader(url)
+
+    assert validate_cog_header(url, reader=reader) == is_cog(tiffs[0])
+    assert reader.requests_made == 1
+    assert http_server.range_requests == [("/cog.tif", 0, 16383)]
+
+
+def test_remote_tiffs_are_checked_from_their_header(tiffs, tmp_path, monkeypatch):
+    """
+    Tests that the COG layout of a remote TIFF is checked from its header, not on the open dataset
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_tiff_header.py::test_remote_tiffs_are_checked_from_their_header
+    """
+
+    def validate_cog_dataset(src):
+        raise AssertionError(f"{src.name} was checked on the open dataset")
+
+    monkeypatch.setenv("CHECK_COG_TYPE", "true")
+    monkeypatch.delenv("BLOCK_CACHE_PATH", raising=False)
+    monkeypatch.setattr(file_operations, "_validate_cog_dataset", validate_cog_dataset)
+
+    with StandInServer(str(tmp_path)) as server:
+        cog = inspect_raster(f"{server.url}/cog.tif", statistics_method="none")
+        striped = inspect_raster(f"{server.url}/striped.tif", statistics_method="none")
+
+    assert cog.media_type == "image/tiff; application=geotiff; profile=cloud-optimized"
+    assert striped.media_type == "image/tiff; application=geotiff"
@@ -0,0 +1,30 @@
+# `poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_warmup.py`
+
+from fastapi.testclient import TestClient
+
+from app.core import warmup
+from app.main import app
+
+
+def test_ready_once_warmed_up():
+    """
+    Tests that the readiness endpoint fails until the warm-up of the process has finished,
+    then reports the duration of each warm-up stage
+
+    poetry run python -m pytest --log-level=INFO --capture=no app/tests/test_warmup.py::test_ready_once_warmed_up
+    """
+    client = TestClient(app)
+    # As in a freshly forked worker
+    warmup.mark_forked()
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "warming up"
+
+    warmup.warm_up()
+
+    response = client.get("/ready")
+    assert response.status_code == 200
+    timings = response.json()["warmup"]
+    assert {"app_load", "parsers", "pystac", "gdal", "cold_start"} <= set(timings)
+    assert all(seconds >= 0 for seconds in timings.values())
+    assert 'stac_generator_warmup_seconds{stage="gdal"}' in client.get("/metrics").text
@@ -0,0 +1,109 @@
+"""
+Benchmark of the assembly and serialization of a STAC item with many assets.
+
+Compares the previous path (the item converted to a dictionary, deep merged into a
+copy, rebuilt as a pystac Item, converted again and encoded by FastAPI's JSON encoder)
+with the lean path (one conversion, an in-place merge, one validation and orjson).
+
+`poetry run python -m benchmarks.item_assembly --assets 40 --bands 4`
+"""
+import argparse
+import copy
+import datetime
+import json
+import time
+import tracemalloc
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pystac import Asset, Item
+
+from app.stac.services.metadata_parsers.utils import merge_stac_items, merge_stac_items_in_place
+from app.stac.services.stac_item_creator import validate_item
+
+
+def make_item(assets: int, bands: int) -> Item:
+    """
+    Build an item shaped like a generated one, with a histogram for every band of every asset.
+    """
+    item = Item(
+        id="benchmark",
+        geometry={"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]},
+        bbox=[0, 0, 1, 1],
+        datetime=datetime.datetime(2022, 9, 9, 15, 27, 53),
+        properties={"proj:epsg": 32630, "proj:shape": [10980, 10980]},
+    )
+    raster_bands = [
+        {
+            "data_type": "uint16",
+            "scale": 1.0,
+            "offset": 0.0,
+            "nodata": 0,
+            "statistics": {"mean": 1.5, "minimum": 1, "maximum": 2, "stddev": 0.5, "valid_percent": 99.0},
+            "histogram": {"count": 11, "min": 1.0, "max": 2.0, "buckets": list(range(256))},
+        }
+        for _ in range(bands)
+    ]
+    for index in range(assets):
+        item.add_asset(
+            f"B{index:02d}",
+            Asset(
+                href=f"https://storage.example.com/scene/B{index:02d}.tif",
+                media_type="image/tiff; application=geotiff; profile=cloud-optimized",
+                extra_fields={"raster:bands": copy.deepcopy(raster_bands)},
+            ),
+        )
+    return item
+
+
+PARSED = {
+    "type": "Feature",
+    "id": "benchmark",
+    "stac_extensions": ["https://stac-extensions.github.io/view/v1.0.0/schema.json"],
+    "properties": {"datetime": "2022-09-09T15:27:53Z", "eo:cloud_cover": 1.5},
+}
+
+
+def legacy_path(item: Item) -> bytes:
+    merged = Item.from_dict(merge_stac_items(item.to_dict(), copy.deepcopy(PARSED)))
+    return json.dumps(jsonable_encoder(merged.to_dict())).encode()
+
+
+def lean_path(item: Item) -> bytes:
+    merged = merge_stac_items_in_place(item.to_dict(), copy.deepcopy(PARSED))
+    return orjson.dumps(validate_item(merged), option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def measure(path, item: Item, repeat: int):
+    """
+    Return the mean time in milliseconds, and the peak memory allocated by one run.
+    """
+    path(item)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        path(item)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+
+    tracemalloc.start()
+    path(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--assets", type=int, default=40)
+    parser.add_argument("--bands", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    item = make_item(args.assets, args.bands)
+    print(f"{args.assets} assets with {args.bands} bands, {len(lean_path(item))} bytes")
+    for name, path in (("legacy", legacy_path), ("lean", lean_path)):
+        elapsed, peak = measure(path, item, args.repeat)
+        print(f"{name:>8}: {elapsed:8.2f} ms per item, {peak / 1024:8.1f} KiB peak allocated")
+
+
+if __name__ == "__main__":
+    main()
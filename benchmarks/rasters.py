@@ -0,0 +1,89 @@
+"""
+Synthetic GeoTIFFs for the benchmarks, written with rasterio.
+
+Every raster has the same georeferencing and a deterministic pattern, so runs are
+comparable between machines. Large rasters are written block by block.
+"""
+import os
+
+import numpy
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+# Tiled with internal overviews, tiled without overviews, striped, striped with overviews
+RASTER_KINDS = ("cog", "tiled", "striped", "striped-overviews")
+
+_BLOCK_ROWS = 512
+
+
+def get_raster_name(kind: str, size: int, bands: int) -> str:
+    return f"{kind}-{size}px-{bands}b.tif"
+
+
+def make_raster(directory: str, kind: str, size: int, bands: int) -> str:
+    """
+    Write a synthetic raster of `size` x `size` pixels unless it already exists.
+
+    Args:
+        directory (str): Where to write the raster.
+        kind (str): One of RASTER_KINDS.
+        size (int): The width and height in pixels.
+        bands (int): The number of uint8 bands.
+
+    Returns:
+        str: The path of the raster.
+    """
+    if kind not in RASTER_KINDS:
+        raise ValueError(f"Unknown raster kind {kind}, expected one of {RASTER_KINDS}")
+    path = os.path.join(directory, get_raster_name(kind, size, bands))
+    if os.path.exists(path):
+        return path
+
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": bands,
+        "dtype": "uint8",
+        "crs": "EPSG:32630",
+        "transform": from_origin(500000, 5600000, 10, 10),
+        "nodata": 0,
+        "compress": "deflate",
+        # GDAL would read 3 and 4 band uint8 rasters as RGB(A) images
+        "photometric": "minisblack",
+    }
+    if kind in ("cog", "tiled"):
+        profile.update(tiled=True, blockxsize=512, blockysize=512)
+
+    # Written next to the target and renamed, so an interrupted run leaves no partial raster
+    tmp_path = path + ".tmp"
+    with rasterio.open(tmp_path, "w", **profile) as dst:
+        columns = numpy.arange(size, dtype="uint32")
+        for row_off in range(0, size, _BLOCK_ROWS):
+            rows = min(_BLOCK_ROWS, size - row_off)
+            grid = numpy.add.outer(numpy.arange(row_off, row_off + rows, dtype="uint32"), columns)
+            for band in range(1, bands + 1):
+                data = ((grid + band * 17) % 250 + 1).astype("uint8")
+                dst.write(data, band, window=Window(0, row_off, size, rows))
+
+    if kind in ("cog", "tiled"):
+        # The COG driver lays the overviews and tiles out for range reads
+        rasterio.shutil.copy(
+            tmp_path,
+            path,
+            driver="COG",
+            compress="deflate",
+            blocksize=512,
+            overviews="AUTO" if kind == "cog" else "NONE",
+        )
+        os.remove(tmp_path)
+    else:
+        if kind == "striped-overviews":
+            factors = [2 ** level for level in range(1, 6) if size // 2 ** level >= 256]
+            with rasterio.open(tmp_path, "r+") as dst:
+                dst.build_overviews(factors or [2], Resampling.average)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,150 @@
+"""
+A local HTTP stand-in for the blob store holding the rasters and for the STAC API.
+
+GET and HEAD requests serve files from a directory, honouring single byte range requests
+like a blob store would. POST and PUT requests are accepted like a STAC API accepts items.
+The requests, and the bytes sent and received, are counted.
+
+The server runs in its own process: some rasterio calls hold the GIL while GDAL waits
+for the response, which a server thread of the same process could never send.
+"""
+import functools
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import threading
+from typing import Dict
+
+import requests
+
+# Served by the stand-in itself, and not counted
+STATS_PATH = "/_stand_in/stats"
+
+
+class StandInHandler(http.server.SimpleHTTPRequestHandler):
+    def send_head(self):
+        if self.path == STATS_PATH:
+            return self._send_stats()
+
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        self.server.count(requests=1)
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start, end = range_header.replace("bytes=", "").split("-")
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+        if start >= size:
+            self.send_error(416)
+            return None
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Last-Modified", self.date_time_string(int(os.path.getmtime(path))))
+        self.end_headers()
+        self.server.count(size=len(data))
+        return io.BytesIO(data)
+
+    def copyfile(self, source, outputfile):
+        # The size of range responses is counted in send_head
+        if not isinstance(source, io.BytesIO):
+            self.server.count(size=os.fstat(source.fileno()).st_size)
+        super().copyfile(source, outputfile)
+
+    def do_POST(self):
+        self._accept(201)
+
+    def do_PUT(self):
+        self._accept(200)
+
+    def _accept(self, status: int):
+        received = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.count(requests=1, size=len(received))
+        body = b"{}"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stats(self):
+        body = json.dumps(self.server.get_stats()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _CountingServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory: str):
+        handler = functools.partial(StandInHandler, directory=directory)
+        super().__init__(("127.0.0.1", 0), handler)
+        self._stats = {"requests": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, requests: int = 0, size: int = 0):
+        with self._stats_lock:
+            self._stats["requests"] += requests
+            self._stats["bytes"] += size
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+def _serve(directory: str, ports):
+    server = _CountingServer(directory)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StandInServer:
+    """
+    Serves a directory and stands in for the STAC API on a free local port, from a child process.
+
+    Attributes:
+        directory (str): The directory served.
+        url (str): The base URL of the server, once started.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.url = None
+        self._process = None
+        self._session = requests.Session()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Return the number of requests served, and of bytes sent and received, since the server started.
+        """
+        response = self._session.get(f"{self.url}{STATS_PATH}", timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def __enter__(self):
+        context = multiprocessing.get_context("spawn")
+        ports = context.Queue()
+        self._process = context.Process(target=_serve, args=(self.directory, ports), daemon=True)
+        self._process.start()
+        self.url = f"http://127.0.0.1:{ports.get(timeout=30)}"
+        return self
+
+    def __exit__(self, *args):
+        self._session.close()
+        self._process.terminate()
+        self._process.join()
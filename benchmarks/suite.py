@@ -0,0 +1,278 @@
+"""
+Benchmark suite of item generation against synthetic GeoTIFFs served over HTTP.
+
+Synthetic rasters (COG and non-COG, with and without overviews) are served by a local
+stand-in for the blob store and the STAC API. For each raster, the suite times
+`STACItemCreator.create_item` (with the time of each stage), `is_cog` and publishing
+the item, and counts the HTTP requests and bytes each of them needed. The results are
+compared to a stored baseline, and the run fails when one regressed.
+
+`poetry run python -m benchmarks.suite`
+`poetry run python -m benchmarks.suite --profile full --data-dir /tmp/stac-benchmarks`
+`poetry run python -m benchmarks.suite --update-baseline`
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+
+from app.stac.services.file_operations import is_cog
+from app.stac.services.metrics import STAGE_SECONDS
+from app.stac.services.publisher.publisher_utility import (
+    close_stac_api_client,
+    publish_to_stac_fastapi,
+)
+from app.stac.services.stac_item_creator import STACItemCreator
+
+from .rasters import RASTER_KINDS, get_raster_name, make_raster
+from .stand_in import StandInServer
+
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Raster sizes in pixels and band counts of each profile
+PROFILES = {
+    "quick": {"sizes": [1024], "bands": [1, 4]},
+    "full": {"sizes": [1024, 5120, 10240, 20480], "bands": [1, 4, 12]},
+}
+
+# The environment of the run: no caches, the COG layout is checked, publishing is explicit
+BENCHMARK_ENV = {
+    "CHECK_COG_TYPE": "true",
+    "HTTP_PUBLISH_TO_STAC_API": "false",
+    "GDAL_READ_STATS": "false",
+    "STAC_API_PUBLISH_MODE": "item",
+}
+UNSET_ENV = ("RASTER_CACHE_PATH",)
+
+
+def get_stage_seconds() -> Dict[str, float]:
+    """
+    Return the total seconds of each generation stage observed by this process.
+    """
+    seconds: Dict[str, float] = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_sum"):
+                stage = sample.labels["stage"]
+                seconds[stage] = seconds.get(stage, 0.0) + sample.value
+    return seconds
+
+
+def _summarize(runs: List[Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Return the median of each measure over the runs, in milliseconds for times.
+    """
+    result = {
+        "ms": round(statistics.median(run["seconds"] for run in runs) * 1000, 3),
+        "requests": int(statistics.median(run["requests"] for run in runs)),
+        "bytes": int(statistics.median(run["bytes"] for run in runs)),
+    }
+    stages = sorted({stage for run in runs for stage in run.get("stages", {})})
+    if stages:
+        result["stages"] = {
+            stage: round(statistics.median(run["stages"].get(stage, 0.0) for run in runs) * 1000, 3)
+            for stage in stages
+        }
+    return result
+
+
+def _measure(server: StandInServer, func) -> Dict[str, Any]:
+    """
+    Run func once, returning its time, the stand-in requests and bytes, and the stage times.
+    """
+    requests_before = server.get_stats()
+    stages_before = get_stage_seconds()
+    started = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - started
+    requests_after = server.get_stats()
+    stages = {
+        stage: total - stages_before.get(stage, 0.0)
+        for stage, total in get_stage_seconds().items()
+        if total - stages_before.get(stage, 0.0) > 0
+    }
+    return {
+        "seconds": seconds,
+        "requests": requests_after["requests"] - requests_before["requests"],
+        "bytes": requests_after["bytes"] - requests_before["bytes"],
+        "stages": stages,
+        "value": value,
+    }
+
+
+def run_case(server: StandInServer, name: str, repeat: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Time the generation, COG check and publication of one raster.
+
+    Each run reads the raster from a new URL, so that nothing is served from the GDAL
+    cache of an earlier run.
+    """
+    def url():
+        return f"{server.url}/{name}?run={uuid.uuid4().hex}"
+
+    creations = [
+        _measure(
+            server,
+            lambda: STACItemCreator(
+                {"files": [url()], "metadata": {"ID": name}, "parser": "example"}
+            ).create_item(),
+        )
+        for _ in range(repeat)
+    ]
+    cog_checks = [_measure(server, lambda: is_cog(url())) for _ in range(repeat)]
+
+    item = creations[-1]["value"]
+
+    async def publish():
+        try:
+            return [await _timed_publish(server, item) for _ in range(repeat)]
+        finally:
+            await close_stac_api_client()
+
+    publications = asyncio.run(publish())
+    return {
+        "create_item": _summarize(creations),
+        "is_cog": _summarize(cog_checks),
+        "publish": _summarize(publications),
+    }
+
+
+async def _timed_publish(server: StandInServer, item: dict) -> Dict[str, Any]:
+    """
+    Publish an item to the stand-in STAC API once, returning its time, requests and bytes.
+    """
+    before = server.get_stats()
+    started = time.perf_counter()
+    await publish_to_stac_fastapi(item, "benchmark", max_retries=1)
+    seconds = time.perf_counter() - started
+    after = server.get_stats()
+    return {
+        "seconds": seconds,
+        "requests": after["requests"] - before["requests"],
+        "bytes": after["bytes"] - before["bytes"],
+    }
+
+
+def run_suite(profile: str, data_dir: str, repeat: int = 5, kinds=RASTER_KINDS) -> Dict[str, Dict[str, Any]]:
+    """
+    Run the benchmarks of a profile, writing the rasters to data_dir if they do not exist.
+
+    Returns:
+        dict: The results by "<raster>/<operation>", each with the median time in
+        milliseconds ("ms"), HTTP requests and bytes, and for create_item the median
+        time of each stage ("stages").
+    """
+    settings = PROFILES[profile]
+    previous_env = {name: os.environ.get(name) for name in list(BENCHMARK_ENV) + list(UNSET_ENV) + ["STAC_API_URL"]}
+    os.environ.update(BENCHMARK_ENV)
+    for name in UNSET_ENV:
+        os.environ.pop(name, None)
+
+    results = {}
+    try:
+        with StandInServer(data_dir) as server:
+            os.environ["STAC_API_URL"] = server.url
+            for kind in kinds:
+                for size in settings["sizes"]:
+                    for bands in settings["bands"]:
+                        make_raster(data_dir, kind, size, bands)
+                        name = get_raster_name(kind, size, bands)
+                        for operation, result in run_case(server, name, repeat).items():
+                            results[f"{name[:-4]}/{operation}"] = result
+    finally:
+        for name, value in previous_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return results
+
+
+def compare_to_baseline(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float = 0.5,
+    min_delta_ms: float = 5.0,
+) -> List[str]:
+    """
+    Return the regressions of the results against a baseline.
+
+    A benchmark regressed when it made more HTTP requests or read more bytes than its
+    baseline, or when it got slower by more than `tolerance` (a fraction of the baseline
+    time) and by more than `min_delta_ms`, which keeps timer noise on fast operations out.
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        if result["requests"] > expected["requests"]:
+            regressions.append(f"{key}: {result['requests']} requests, baseline {expected['requests']}")
+        if result["bytes"] > expected["bytes"]:
+            regressions.append(f"{key}: {result['bytes']} bytes, baseline {expected['bytes']}")
+        slower = result["ms"] - expected["ms"]
+        if slower > expected["ms"] * tolerance and slower > min_delta_ms:
+            regressions.append(f"{key}: {result['ms']:.1f} ms, baseline {expected['ms']:.1f} ms")
+    return regressions
+
+
+def _print_results(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]):
+    print(f"{'benchmark':<40} {'ms':>10} {'baseline':>10} {'requests':>9} {'bytes':>10}  stages (ms)")
+    for key, result in results.items():
+        expected = baseline.get(key, {}).get("ms")
+        expected = f"{expected:10.1f}" if expected is not None else f"{'-':>10}"
+        stages = " ".join(f"{stage}={ms:.1f}" for stage, ms in result.get("stages", {}).items())
+        print(f"{key:<40} {result['ms']:10.1f} {expected} {result['requests']:9d} {result['bytes']:10d}  {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each benchmark, the median is kept")
+    parser.add_argument("--data-dir", help="Where the rasters are written and kept, defaults to a temporary directory")
+    parser.add_argument("--baseline", help="Defaults to benchmarks/baselines/<profile>.json")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="The allowed slowdown, as a fraction of the baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    baseline_path = args.baseline or os.path.join(BASELINES_DIR, f"{args.profile}.json")
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        results = run_suite(args.profile, args.data_dir, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            results = run_suite(args.profile, data_dir, args.repeat)
+
+    _print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Stored the baseline in {baseline_path}")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Settings of the production serving mode, read by gunicorn from the working directory:
+
+    gunicorn app.main:app
+
+The app is loaded once by the master process, with its parsers, and forked into
+WEB_CONCURRENCY uvicorn workers, which share it. Each worker then warms GDAL up, see
+app.core.warmup, and `/ready` passes once it is done.
+
+The jobs of `/stac/jobs` run in the worker that received them and are recorded in the
+job store, so that they can be polled from any worker. When `JOB_STORE_PATH` is not set,
+the master creates the store in a temporary directory before forking.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Item generation runs off the event loop, a worker only misses heartbeats when it is stuck
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = "-"
+
+if not os.getenv("JOB_STORE_PATH"):
+    os.environ["JOB_STORE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="stac-jobs-"), "jobs.sqlite")
+
+
+def when_ready(server):
+    # In the master process, after the app is loaded and before the workers are forked
+    from app.core import warmup
+
+    warmup.warm_up_before_fork()
+    server.log.info(f"Loaded the app and its parsers before forking: {warmup.get_warmup_timings()}")
+
+
+def post_fork(server, worker):
+    from app.core import warmup
+
+    warmup.mark_forked()
+
+
+def child_exit(server, worker):
+    # The metrics of a dead worker are kept, but its gauges are dropped
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)